@@ -0,0 +1,1335 @@
+"""
+Бенчмарки производительности Telegram-бота "Напоминалка"
+
+Запуск:
+    python benchmark.py              # все бенчмарки
+    python benchmark.py webhook      # только выбранный бенчмарк
+
+Все сетевые вызовы идут в локальный фейковый Bot API (FakeTelegramAPI),
+база данных и логи создаются во временной директории.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# Окружение для бенчмарков настраивается до импорта модулей проекта
+BENCH_DIR = tempfile.mkdtemp(prefix='reminder_bench_')
+os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+os.environ.setdefault('DB_PATH', os.path.join(BENCH_DIR, 'reminders.db'))
+os.environ.setdefault('LOG_FILE', os.path.join(BENCH_DIR, 'bot.log'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# Бенчмарки пропускной способности шлют тысячи обновлений подряд - без защиты от флуда
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('OUTBOUND_LANES_ENABLED', 'false')
+
+from html.parser import HTMLParser  # noqa: E402
+
+from aiohttp import web, ClientSession  # noqa: E402
+
+
+class _EntitiesParser(HTMLParser):
+    """Разбор HTML-разметки в текст и entities, как это делает Telegram"""
+
+    TAGS = {'b': 'bold', 'strong': 'bold', 'i': 'italic', 'em': 'italic', 'u': 'underline', 'code': 'code', 'pre': 'pre'}
+
+    def __init__(self):
+        super().__init__()
+        self.text = ''
+        self.entities = []
+        self._open = []
+
+    def _offset(self) -> int:
+        return len(self.text.encode('utf-16-le')) // 2
+
+    def handle_starttag(self, tag, attrs):
+        self._open.append((tag, self._offset()))
+
+    def handle_endtag(self, tag):
+        open_tag, offset = self._open.pop()
+        if open_tag in self.TAGS:
+            self.entities.append({'type': self.TAGS[open_tag], 'offset': offset, 'length': self._offset() - offset})
+
+    def handle_data(self, data):
+        self.text += data
+
+
+def _parse_html(text: str):
+    parser = _EntitiesParser()
+    parser.feed(text)
+    parser.close()
+    return parser.text, sorted(parser.entities, key=lambda entity: entity['offset'])
+
+
+class FakeTelegramAPI:
+    """Минимальная локальная реализация Bot API для измерений"""
+
+    def __init__(self, rtt_ms: float = 0.0):
+        self.rtt = rtt_ms / 1000
+        self.updates = []
+        self.next_update_id = 1
+        self.calls = {}
+        self.sent = []  # (время получения, chat_id)
+        self.messages = {}  # chat_id -> {message_id: сообщение в формате Bot API}
+        self.next_message_id = 1
+        self._new_updates = asyncio.Event()
+        self._runner = None
+        self.base_url = None
+
+    def make_message_update(self, user_id: int, text: str) -> dict:
+        """Создать обновление с текстовым сообщением"""
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'text': text
+            }
+        }
+
+    def push_update(self, update: dict):
+        """Поставить обновление в очередь getUpdates"""
+        self.updates.append(update)
+        self._new_updates.set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        app.router.add_get('/stats', self._stats)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        data = await request.post()
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+        if method == 'getUpdates':
+            result = await self._get_updates(int(data.get('offset') or 0), float(data.get('timeout') or 0))
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            chat_id = int(data.get('chat_id') or 0)
+            result = self._store_message(chat_id, data, int(data.get('message_id') or 0))
+            if result is None:
+                return web.json_response(
+                    {'ok': False, 'error_code': 400, 'description': 'Bad Request: message is not modified'},
+                    status=400
+                )
+            self.sent.append((time.perf_counter(), chat_id))
+        else:
+            result = True
+
+        return web.json_response({'ok': True, 'result': result})
+
+    def _store_message(self, chat_id: int, data, message_id: int = 0):
+        """Сохранить отправленное или отредактированное сообщение (None - содержимое не изменилось)"""
+        text = data.get('text', '')
+        entities = []
+        if data.get('parse_mode') == 'HTML':
+            text, entities = _parse_html(text)
+        reply_markup = json.loads(data['reply_markup']) if data.get('reply_markup') else None
+
+        chat = self.messages.setdefault(chat_id, {})
+        if message_id:
+            old = chat.get(message_id, {})
+            if old.get('text') == text and old.get('entities') == entities and old.get('reply_markup') == reply_markup:
+                return None
+        else:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Bench'},
+            'text': text,
+            'entities': entities
+        }
+        if reply_markup:
+            message['reply_markup'] = reply_markup
+        chat[message_id] = message
+        return message
+
+    def make_callback_update(self, user_id: int, data: str) -> dict:
+        """Нажатие кнопки с callback_data в последнем сообщении, где она есть"""
+        for message in reversed(list(self.messages.get(user_id, {}).values())):
+            buttons = [
+                button
+                for row in message.get('reply_markup', {}).get('inline_keyboard', [])
+                for button in row
+            ]
+            if any(button.get('callback_data') == data for button in buttons):
+                break
+        else:
+            raise LookupError(f"Кнопка {data} не найдена")
+
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'chat_instance': str(user_id),
+                'message': message,
+                'data': data
+            }
+        }
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'calls': self.calls, 'sent': len(self.sent)})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list:
+        if offset:
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+
+def _serve_fake_api(conn, rtt_ms: float = 0.0):
+    """Запуск фейкового Bot API в отдельном процессе (адрес передается через pipe)"""
+    async def serve():
+        api = await FakeTelegramAPI(rtt_ms).start()
+        conn.send(api.base_url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _report(title: str, started: float, injected: dict, api: FakeTelegramAPI):
+    """Вывести пропускную способность и задержку по ответам sendMessage"""
+    latencies = [(received - injected[chat_id]) * 1000 for received, chat_id in api.sent if chat_id in injected]
+    elapsed = max(received for received, _ in api.sent) - started
+    print(
+        f"  {title:<8} обновлений: {len(latencies):>5} | "
+        f"{len(latencies) / elapsed:>7.0f} upd/s | "
+        f"p50 {statistics.median(latencies):6.1f} мс | "
+        f"p95 {_percentile(latencies, 0.95):6.1f} мс"
+    )
+
+
+async def _wait_for_replies(api: FakeTelegramAPI, count: int, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    while len(api.sent) < count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.005)
+
+
+async def _run_polling(reminder_bot, api: FakeTelegramAPI, updates_count: int, rate: float):
+    polling = asyncio.create_task(
+        reminder_bot.dp.start_polling(reminder_bot.bot, handle_signals=False, close_bot_session=False)
+    )
+    await asyncio.sleep(0.2)
+
+    injected = {}
+    started = time.perf_counter()
+    for i in range(updates_count):
+        user_id = 1000 + i
+        injected[user_id] = time.perf_counter()
+        api.push_update(api.make_message_update(user_id, 'abc'))
+        if rate:
+            await asyncio.sleep(1 / rate)
+
+    await _wait_for_replies(api, updates_count)
+    _report('polling', started, injected, api)
+
+    await reminder_bot.dp.stop_polling()
+    await polling
+
+
+async def _run_webhook(webhook_url: str, secret: str, api: FakeTelegramAPI, updates_count: int, rate: float):
+    injected = {}
+    pending = []
+    async with ClientSession() as session:
+        async def post(update):
+            # Задержка сети от Telegram до webhook
+            if api.rtt:
+                await asyncio.sleep(api.rtt / 2)
+            headers = {'X-Telegram-Bot-Api-Secret-Token': secret}
+            async with session.post(webhook_url, json=update, headers=headers) as resp:
+                assert resp.status == 200
+
+        started = time.perf_counter()
+        for i in range(updates_count):
+            user_id = 1000 + i
+            injected[user_id] = time.perf_counter()
+            pending.append(asyncio.create_task(post(api.make_message_update(user_id, 'abc'))))
+            if rate:
+                await asyncio.sleep(1 / rate)
+
+        await asyncio.gather(*pending)
+        await _wait_for_replies(api, updates_count)
+
+    _report('webhook', started, injected, api)
+
+
+async def bench_webhook():
+    """Сравнение polling и webhook: пропускная способность и задержка"""
+    from bot import ReminderBotV2
+
+    print("=== Polling vs webhook (локальный фейковый Bot API) ===")
+    api = await FakeTelegramAPI().start()
+    reminder_bot = ReminderBotV2(api_base_url=api.base_url)
+
+    secret = 'bench-secret'
+    runner = web.AppRunner(reminder_bot.create_webhook_app(secret_token=secret, path='/webhook'), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    webhook_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/webhook"
+
+    # Запрос с неверным секретом должен отклоняться
+    async with ClientSession() as session:
+        headers = {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}
+        async with session.post(webhook_url, json={'update_id': 0}, headers=headers) as resp:
+            assert resp.status == 401
+
+    for title, updates_count, rate, rtt_ms in (
+        ("Пакет из 2000 обновлений, RTT 0 мс", 2000, 0, 0),
+        ("Поток 200 upd/s, RTT 40 мс", 1000, 200, 40),
+    ):
+        print(title)
+        api.rtt = rtt_ms / 1000
+        api.sent.clear()
+        await _run_polling(reminder_bot, api, updates_count, rate)
+        api.sent.clear()
+        await _run_webhook(webhook_url, secret, api, updates_count, rate)
+
+    await runner.cleanup()
+    await reminder_bot.bot.session.close()
+    await api.stop()
+    print()
+
+
+async def bench_workers():
+    """Масштабирование обработки обновлений от 1 до N рабочих процессов"""
+    import multiprocessing
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from workers import ShardedUpdateProcessor, ShardRouterMiddleware
+
+    print(f"=== Рабочие процессы с шардированием по user_id (CPU: {os.cpu_count()}) ===")
+
+    # Фейковый API в отдельном процессе, чтобы не делить CPU с главным процессом
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    api_process = context.Process(target=_serve_fake_api, args=(child_conn,), daemon=True)
+    api_process.start()
+    base_url = parent_conn.recv()
+
+    async with ClientSession() as session:
+        async def sent_count() -> int:
+            async with session.get(f"{base_url}/stats") as resp:
+                return (await resp.json())['sent']
+
+        async def wait_sent(target: int):
+            while await sent_count() < target:
+                await asyncio.sleep(0.01)
+
+        updates_count = 3000
+        workers_options = sorted({1, 2, 4, max(1, os.cpu_count() or 1)})
+        for workers_count in workers_options:
+            processor = ShardedUpdateProcessor(workers_count, base_url)
+            processor.start()
+
+            dp = Dispatcher()
+            dp.update.outer_middleware(ShardRouterMiddleware(processor))
+            front_bot = Bot(token=os.environ['BOT_TOKEN'], session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+            fake = FakeTelegramAPI()
+
+            # Прогрев: по одному обновлению на каждый рабочий процесс
+            baseline = await sent_count()
+            for user_id in range(workers_count):
+                await dp.feed_raw_update(front_bot, fake.make_message_update(user_id, 'abc'))
+            await wait_sent(baseline + workers_count)
+
+            baseline = await sent_count()
+            started = time.perf_counter()
+            for i in range(updates_count):
+                await dp.feed_raw_update(front_bot, fake.make_message_update(1000 + i % 500, 'abc'))
+            await wait_sent(baseline + updates_count)
+            elapsed = time.perf_counter() - started
+
+            print(f"  процессов: {workers_count} | {updates_count / elapsed:>7.0f} upd/s | шарды: {processor.dispatched}")
+
+            await asyncio.get_running_loop().run_in_executor(None, processor.stop)
+            await front_bot.session.close()
+
+    api_process.terminate()
+    print()
+
+
+class _CountingBot:
+    """Бот без сети: считает вызовы sendMessage"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.calls += 1
+
+
+def _zipf_counts(users_count: int, s: float, max_count: int, seed: int = 42) -> list:
+    """Количество наступивших напоминаний на пользователя по закону Ципфа (большинство - одно)"""
+    import random
+    rng = random.Random(seed)
+    weights = [1 / k ** s for k in range(1, max_count + 1)]
+    return rng.choices(range(1, max_count + 1), weights=weights, k=users_count)
+
+
+async def bench_coalesce():
+    """Экономия вызовов Bot API при объединении напоминаний одного пользователя"""
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from scheduler import ReminderScheduler
+
+    print("=== Объединенная доставка напоминаний (распределение Ципфа) ===")
+    users_count = 2000
+    now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+
+    for s in (2.0, 1.2):
+        counts = _zipf_counts(users_count, s, max_count=30)
+        total = sum(counts)
+        print(f"Пользователей: {users_count}, напоминаний: {total} (s={s}, максимум на пользователя: {max(counts)})")
+
+        for coalesce in (False, True):
+            db_path = os.path.join(BENCH_DIR, f'coalesce_{s}_{coalesce}.db')
+            database = ReminderDatabaseV2(db_path)
+            conn = sqlite3.connect(db_path)
+            # Напоминания в пределах последних 30 минут (например, после короткого простоя)
+            conn.executemany(
+                "INSERT INTO reminders_v2 (user_id, reminder_time, reminder_text, created_at) VALUES (?, ?, ?, ?)",
+                (
+                    (user_id, (now - timedelta(minutes=30 - i)).isoformat(), f"Задача {i}", now.isoformat())
+                    for user_id, count in enumerate(counts, start=1)
+                    for i in range(count)
+                )
+            )
+            conn.commit()
+            conn.close()
+
+            bot = _CountingBot()
+            stats = {'reminders_sent': 0, 'errors_count': 0}
+            scheduler = ReminderScheduler(bot, database, stats, coalesce=coalesce)
+            started = time.perf_counter()
+            await scheduler.deliver_due()
+            elapsed = time.perf_counter() - started
+
+            assert stats['reminders_sent'] == total
+            title = 'объединение' if coalesce else 'по одному'
+            print(
+                f"  {title:<12} вызовов sendMessage: {bot.calls:>6} | "
+                f"{bot.calls / total * 100:5.1f}% от числа напоминаний | {elapsed:6.2f} с"
+            )
+    print()
+
+
+class _EmptySource:
+    """Источник без строк: индекс наполняется напрямую через add"""
+
+    def iter_pending_ids(self, start_time, end_time, batch_size):
+        return iter(())
+
+
+def _traced(build):
+    """Пиковый и итоговый объем памяти (tracemalloc) для построенной структуры"""
+    import gc
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+async def bench_due_index():
+    """Память индекса ближайших напоминаний: куча datetime-кортежей против колеса времени"""
+    import heapq
+    import random
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from due_index import DueIndex, epoch_minute
+
+    print("=== Индекс ближайших напоминаний в памяти ===")
+    now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+    now_minute = epoch_minute(now)
+    mb = 1024 * 1024
+
+    for count in (1_000_000, 10_000_000):
+        rng = random.Random(count)
+        print(f"Ожидающих напоминаний: {count:_}".replace('_', ' '))
+
+        if count <= 1_000_000:
+            def build_heap():
+                heap = [(now + timedelta(minutes=rng.randrange(180)), i) for i in range(count)]
+                heapq.heapify(heap)
+                return heap
+            heap, current, _ = _traced(build_heap)
+            heap_bytes = current
+            print(f"  куча (datetime, id)              {current / mb:8.1f} МБ")
+            del heap
+        else:
+            print(f"  куча (datetime, id)              {heap_bytes * 10 / mb:8.1f} МБ (оценка по 1 млн)")
+
+        def build_wheel(spread_minutes):
+            index = DueIndex(_EmptySource(), horizon_hours=3)
+            index.sync(now)
+            add = index.add
+            for i in range(count):
+                add(i, now_minute + rng.randrange(spread_minutes))
+            return index
+
+        # Худший случай: все напоминания внутри горизонта в 3 часа
+        started = time.perf_counter()
+        index, current, peak = _traced(lambda: build_wheel(180))
+        elapsed = time.perf_counter() - started
+        print(
+            f"  колесо, все в горизонте 3 ч      {current / mb:8.1f} МБ "
+            f"(в индексе {len(index):_}, заполнение {elapsed:.1f} с)".replace('_', ' ')
+        )
+        del index
+
+        # Реалистично: напоминания равномерно на 30 дней, в памяти только горизонт
+        index, current, _ = _traced(lambda: build_wheel(30 * 24 * 60))
+        print(f"  колесо, 30 дней, горизонт 3 ч    {current / mb:8.1f} МБ (в индексе {len(index):_})".replace('_', ' '))
+        del index
+    print()
+
+
+async def bench_navigation():
+    """Вызовы Bot API за сессию навигации по меню"""
+    from datetime import datetime, timedelta
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from config import OMSK_TIMEZONE
+    from database import get_db
+    from callbacks import (
+        encode_callback, ACTION_MAIN_MENU, ACTION_SHOW_REMINDERS, ACTION_HELP, ACTION_ADD_HELP,
+        ACTION_REMINDER, ACTION_DELETE
+    )
+    from handlers import router
+
+    print("=== Навигация по меню: вызовы Bot API за сессию ===")
+    api = await FakeTelegramAPI().start()
+    bot = Bot(token=os.environ['BOT_TOKEN'], session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    user_id = 777
+    now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+    for i in range(5):
+        get_db().add_reminder(user_id, now + timedelta(days=i + 1), f"Задача {i}")
+    first_id = get_db().get_user_reminders(user_id)[0][0]
+
+    # Типичная сессия: список, карточка, отмена удаления, справка, меню; двойные нажатия
+    menu, reminders, help_ = (encode_callback(action) for action in (ACTION_MAIN_MENU, ACTION_SHOW_REMINDERS, ACTION_HELP))
+    reminder, delete = encode_callback(ACTION_REMINDER, first_id), encode_callback(ACTION_DELETE, first_id)
+    session = [
+        reminders, reminder, delete, reminder,
+        reminders, menu, help_, menu, menu,
+        reminders, reminders, encode_callback(ACTION_ADD_HELP), reminders, menu
+    ]
+    # До редактирования на месте эти кнопки открывали экран новым сообщением
+    legacy = {menu: ACTION_MAIN_MENU, reminders: ACTION_SHOW_REMINDERS, help_: ACTION_HELP}
+
+    for title, new_message in (("до (новое сообщение)", True), ("после (редактирование)", False)):
+        api.messages.clear()
+        api.calls.clear()
+        await dp.feed_raw_update(bot, api.make_message_update(user_id, '/start'))
+
+        previous = None
+        for data in session:
+            if data == previous:
+                # Повторное нажатие той же кнопки: Telegram присылает текущее состояние сообщения
+                message_id = update['callback_query']['message']['message_id']
+                update = {
+                    'update_id': api.next_update_id,
+                    'callback_query': dict(update['callback_query'], message=api.messages[user_id][message_id])
+                }
+                api.next_update_id += 1
+            else:
+                update = api.make_callback_update(user_id, data)
+                if new_message and data in legacy:
+                    update['callback_query']['data'] = encode_callback(legacy[data], new_message=True)
+            previous = data
+            await dp.feed_raw_update(bot, update)
+
+        calls = {method: count for method, count in api.calls.items() if method != 'getMe'}
+        print(
+            f"  {title:<24} нажатий: {len(session)} | sendMessage: {calls.get('sendMessage', 0):>2} | "
+            f"editMessageText: {calls.get('editMessageText', 0):>2} | "
+            f"всего вызовов: {sum(calls.values()):>2} | сообщений в чате: {len(api.messages[user_id])}"
+        )
+
+    await bot.session.close()
+    await api.stop()
+    print()
+
+
+async def bench_throttling():
+    """Накладные расходы защиты от флуда на одно обновление"""
+    from types import SimpleNamespace
+    from middlewares import ThrottlingMiddleware
+
+    print("=== Защита от флуда: накладные расходы на обновление ===")
+    updates_count = 500_000
+
+    async def handler(event, data):
+        return None
+
+    for users_count in (1_000, 100_000):
+        users = [SimpleNamespace(id=user_id) for user_id in range(users_count)]
+        datas = [{'event_from_user': user} for user in users]
+
+        started = time.perf_counter()
+        for i in range(updates_count):
+            await handler(None, datas[i % users_count])
+        baseline = time.perf_counter() - started
+
+        middleware = ThrottlingMiddleware(per_minute=30, burst=5, global_per_second=0, mode='drop')
+        started = time.perf_counter()
+        for i in range(updates_count):
+            await middleware(handler, None, datas[i % users_count])
+        elapsed = time.perf_counter() - started
+
+        overhead_ns = (elapsed - baseline) / updates_count * 1e9
+        print(
+            f"  пользователей: {users_count:>7} | {overhead_ns:6.0f} нс/обновление | "
+            f"отброшено: {middleware.dropped:>6} | записей в памяти: {len(middleware)}"
+        )
+    print()
+
+
+async def bench_outbound():
+    """Задержка ответов на кнопки во время пика рассылки: полосы приоритета против общей очереди"""
+    from aiogram.methods import AnswerCallbackQuery, SendMessage
+    from outbound import OutboundScheduler, outbound_lane, LANE_DELIVERY
+
+    print("=== Полосы исходящих запросов ===")
+    rate = 1000  # масштаб 1000 запросов/с вместо 30, чтобы бенчмарк шел секунды
+    deliveries = 5000
+    callbacks = 40
+
+    async def make_request(bot, method):
+        return None
+
+    for title, lanes in (("общая очередь", False), ("полосы", True)):
+        outbound = OutboundScheduler(rate_per_second=rate, per_chat_interval=1.0)
+        callback_waits = []
+
+        async def deliver(chat_id):
+            with outbound_lane(LANE_DELIVERY):
+                await outbound(make_request, None, SendMessage(chat_id=chat_id, text="🔔"))
+
+        async def tap(query_id):
+            started = time.perf_counter()
+            if lanes:
+                await outbound(make_request, None, AnswerCallbackQuery(callback_query_id=str(query_id)))
+            else:
+                # Без приоритетов ответ на кнопку стоит в той же очереди, что и рассылка
+                with outbound_lane(LANE_DELIVERY):
+                    await outbound(make_request, None, SendMessage(chat_id=-query_id, text="ok"))
+            callback_waits.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(deliver(chat_id)) for chat_id in range(1, deliveries + 1)]
+        for query_id in range(1, callbacks + 1):
+            await asyncio.sleep(0.1)
+            tasks.append(asyncio.create_task(tap(query_id)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"  {title:<14} ответ на кнопку: p50 {statistics.median(callback_waits):7.1f} мс, "
+            f"p95 {_percentile(callback_waits, 0.95):7.1f} мс | рассылка {deliveries} за {elapsed:.1f} с"
+        )
+        print(f"  {'':<14} метрики: {outbound.metrics()}")
+    print()
+
+
+async def bench_simulation():
+    """Несколько суток работы бота в виртуальном времени: создание, доставка с повторами и очистка"""
+    import logging
+    import random
+    from datetime import datetime, timedelta
+    from clock import VirtualClock, set_clock
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from due_index import DueIndex
+    from events import ReminderEvents, EVENT_ADDED
+    from maintenance import RetentionJob
+    from scheduler import ReminderScheduler
+    from utils import validate_reminder_time_v2
+
+    print("=== Симуляция в виртуальном времени ===")
+    days = 3
+    users_count = 300
+    reminders_per_user_per_day = 5
+    failure_rate = 0.02
+    # Ошибки отправки здесь ожидаемы - не засоряем ими вывод
+    logging.disable(logging.ERROR)
+
+    for title, use_index in (("опрос базы", False), ("колесо времени", True)):
+        start = datetime(2026, 1, 1, tzinfo=OMSK_TIMEZONE)
+        clock = VirtualClock(start)
+        previous = set_clock(clock)
+        rng = random.Random(42)
+        lateness = []
+        counters = {'created': 0, 'wakeups': 0}
+
+        class SimulatedBot:
+            """Бот без сети: часть отправок завершается ошибкой"""
+
+            async def send_message(self, chat_id: int, text: str, **kwargs):
+                if rng.random() < failure_rate:
+                    raise RuntimeError("Telegram недоступен")
+
+        class MeasuredScheduler(ReminderScheduler):
+            """Планировщик, который считает пробуждения и опоздание доставки"""
+
+            async def deliver_due(self):
+                counters['wakeups'] += 1
+                await super().deliver_due()
+
+            async def _deliver_to_user(self, user_id, reminders):
+                sent_before = self.stats['reminders_sent']
+                await super()._deliver_to_user(user_id, reminders)
+                if self.stats['reminders_sent'] > sent_before:
+                    now = self.clock.now()
+                    lateness.extend((now - reminder[2]).total_seconds() for reminder in reminders)
+
+        try:
+            database = ReminderDatabaseV2(os.path.join(BENCH_DIR, f'simulation_{use_index}.db'))
+            stats = {'reminders_sent': 0, 'errors_count': 0}
+            due_index = DueIndex(database) if use_index else None
+            scheduler = MeasuredScheduler(SimulatedBot(), database, stats, due_index=due_index)
+            events = ReminderEvents()
+            events.subscribe(scheduler.notify)
+            retention = RetentionJob(database, days_old=1, interval_minutes=60, stats=stats)
+
+            async def traffic():
+                # Пользователи создают напоминания на ближайшие двое суток (пуассоновский поток)
+                mean_gap = 86400 / (users_count * reminders_per_user_per_day)
+                while True:
+                    await clock.sleep(rng.expovariate(1 / mean_gap))
+                    target = clock.now() + timedelta(minutes=rng.randint(1, 2880))
+                    reminder_time, status, _ = validate_reminder_time_v2(target.strftime("%H:%M %d.%m.%Y"))
+                    user_id = rng.randint(1, users_count)
+                    if status == "success" and database.add_reminder(user_id, reminder_time, "Симуляция"):
+                        counters['created'] += 1
+                        events.publish(EVENT_ADDED, reminder_time)
+
+            started = time.perf_counter()
+            tasks = [
+                asyncio.create_task(scheduler.check_reminders()),
+                asyncio.create_task(retention.run()),
+                asyncio.create_task(traffic())
+            ]
+            await clock.run_until(start + timedelta(days=days))
+            elapsed = time.perf_counter() - started
+
+            scheduler.stop()
+            retention.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            set_clock(previous)
+
+        print(
+            f"  {title:<15} {days} дн. за {elapsed:5.1f} с ({days * 86400 / elapsed:_.0f}x) | "
+            f"создано {counters['created']}, доставлено {stats['reminders_sent']}, "
+            f"ошибок {stats['errors_count']}, очищено {stats.get('reminders_cleaned', 0)}".replace('_', ' ')
+        )
+        print(
+            f"  {'':<15} пробуждений в сутки: {counters['wakeups'] / days:.0f} | "
+            f"опоздание p50 {statistics.median(lateness):.0f} с, p95 {_percentile(lateness, 0.95):.0f} с, "
+            f"макс. {max(lateness):.0f} с"
+        )
+    logging.disable(logging.NOTSET)
+    print()
+
+
+def _write_load(database, writers: int, per_writer: int, start_time) -> tuple:
+    """Добавить и удалить напоминания из нескольких потоков, вернуть (секунды, ошибки)"""
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import timedelta
+
+    def writer(number: int) -> int:
+        failed = 0
+        for i in range(per_writer):
+            user_id = number * 100_000 + i
+            reminder_time = start_time + timedelta(minutes=i)
+            if not database.add_reminder(user_id, reminder_time, "Нагрузка"):
+                failed += 1
+                continue
+            if i % 4 == 0:
+                # Часть напоминаний пользователь сразу удаляет
+                reminder_id = database.get_user_reminders(user_id)[0][0]
+                failed += not database.delete_reminder(reminder_id, user_id)
+        return failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        failed = sum(pool.map(writer, range(writers)))
+    return time.perf_counter() - started, failed
+
+
+async def bench_sharding():
+    """Параллельная запись в базу, разделенную на несколько файлов"""
+    from datetime import datetime
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+
+    print("=== Параллельная запись: число файлов базы ===")
+    writers = 8
+    per_writer = 250
+    start_time = datetime(2030, 1, 1, tzinfo=OMSK_TIMEZONE)
+    operations = writers * per_writer * 5 // 4
+
+    for shards in (1, 2, 4, 8):
+        db_path = os.path.join(BENCH_DIR, f'sharding_{shards}', 'reminders.db')
+        os.makedirs(os.path.dirname(db_path))
+        if shards == 1:
+            database = ReminderDatabaseV2(db_path)
+        else:
+            database = ShardedReminderDatabase(db_path, shards=shards)
+
+        elapsed, failed = await asyncio.to_thread(_write_load, database, writers, per_writer, start_time)
+        print(
+            f"  файлов: {shards} | потоков записи: {writers} | {operations / elapsed:7.0f} записей/с | "
+            f"ошибок: {failed}"
+        )
+    print()
+
+
+async def bench_group_commit():
+    """Добавление напоминаний при одновременных обработчиках: транзакция на напоминание против группы"""
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from write_batcher import InsertBatcher
+
+    print("=== Групповая фиксация добавлений ===")
+    inserts = 2000
+    start_time = datetime(2030, 1, 1, tzinfo=OMSK_TIMEZONE)
+
+    for concurrency in (1, 10, 100):
+        for title, grouped in (("по одному", False), ("группами", True)):
+            database = ReminderDatabaseV2(os.path.join(BENCH_DIR, f'group_commit_{concurrency}_{grouped}.db'))
+            batcher = InsertBatcher(database)
+            latencies = []
+
+            async def handler(worker: int):
+                # Каждый обработчик добавляет свою часть напоминаний подряд
+                for i in range(worker, inserts, concurrency):
+                    started = time.perf_counter()
+                    reminder_time = start_time + timedelta(minutes=i)
+                    if grouped:
+                        assert await batcher.add(i % 500, reminder_time) is not None
+                    else:
+                        assert database.add_reminder(i % 500, reminder_time)
+                        database.get_reminders_count(i % 500)
+                        await asyncio.sleep(0)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(handler(worker) for worker in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+            groups = f" | транзакций: {batcher.batches}" if grouped else ""
+            print(
+                f"  обработчиков: {concurrency:>3} | {title:<9} {inserts / elapsed:7.0f} добавлений/с | "
+                f"задержка p50 {statistics.median(latencies):6.1f} мс, p95 {_percentile(latencies, 0.95):6.1f} мс{groups}"
+            )
+    print()
+
+
+async def bench_backup():
+    """Задержка записи в базу во время резервного копирования"""
+    import threading
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from maintenance import BackupService
+
+    print("=== Резервное копирование под нагрузкой записи ===")
+    database = ReminderDatabaseV2(os.path.join(BENCH_DIR, 'backup_source.db'))
+    start_time = datetime(2030, 1, 1, tzinfo=OMSK_TIMEZONE)
+    for chunk in range(20):
+        database.add_reminders([
+            (i, start_time + timedelta(minutes=chunk * 10_000 + i), "Напоминание " * 8) for i in range(10_000)
+        ])
+    print(f"Размер базы: {os.path.getsize(database.db_path) / 1e6:.0f} МБ")
+
+    for title, pages_per_step, write_pause in (
+        ("одним шагом", -1, 0.005),
+        ("по шагам, без записи", 100, None),
+        ("по шагам, запись", 100, 0.005),
+    ):
+        latencies = []
+        stop = threading.Event()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                database.add_reminder(10**9, start_time + timedelta(days=1000, minutes=i))
+                latencies.append((time.perf_counter() - started) * 1000)
+                i += 1
+                time.sleep(write_pause)
+
+        thread = threading.Thread(target=writer) if write_pause is not None else None
+        if thread:
+            thread.start()
+        service = BackupService(
+            database, backup_dir=os.path.join(BENCH_DIR, 'backups'), pages_per_step=pages_per_step, step_pause_ms=10
+        )
+        report = await service.backup_once()
+        stop.set()
+        if thread:
+            thread.join()
+
+        writes = (
+            f"запись p50 {statistics.median(latencies):5.1f} мс, p99 {_percentile(latencies, 0.99):5.1f} мс, "
+            f"макс. {max(latencies):5.1f} мс" if latencies else "без записи"
+        )
+        print(
+            f"  {title:<21} {report['seconds']:6.2f} с | шагов: {report['steps']:>5}, "
+            f"перезапусков: {report['restarts']} | {writes}"
+        )
+    print()
+
+
+async def bench_maintenance():
+    """Возврат свободных страниц: VACUUM против incremental_vacuum порциями под нагрузкой записи"""
+    import threading
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from maintenance import MaintenanceJob
+
+    print("=== Обслуживание базы: VACUUM против incremental_vacuum ===")
+    start_time = datetime(2030, 1, 1, tzinfo=OMSK_TIMEZONE)
+
+    for title, incremental in (("VACUUM", False), ("incremental_vacuum", True)):
+        database = ReminderDatabaseV2(os.path.join(BENCH_DIR, f'maintenance_{incremental}.db'))
+        for chunk in range(60):
+            database.add_reminders([
+                (i, start_time + timedelta(minutes=chunk * 10_000 + i), "Напоминание " * 8) for i in range(10_000)
+            ])
+        # Как после очистки старых напоминаний: 80% строк удалено
+        with sqlite3.connect(database.db_path) as conn:
+            conn.execute("DELETE FROM reminders_v2 WHERE id % 5 != 0")
+        database.checkpoint('TRUNCATE')
+        before = database.get_storage_info()
+
+        latencies = []
+        stop = threading.Event()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                database.add_reminder(10**9, start_time + timedelta(days=1000, minutes=i))
+                latencies.append((time.perf_counter() - started) * 1000)
+                i += 1
+                time.sleep(0.005)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        started = time.perf_counter()
+        if incremental:
+            job = MaintenanceJob(database, vacuum_max_pages=before['freelist_pages'])
+            await job.run_once(force_vacuum=True)
+        else:
+            with sqlite3.connect(database.db_path, timeout=60) as conn:
+                conn.execute("VACUUM")
+        elapsed = time.perf_counter() - started
+        stop.set()
+        thread.join()
+
+        after = database.get_storage_info()
+        print(
+            f"  {title:<19} {before['size_bytes'] / 1e6:5.1f} -> {after['size_bytes'] / 1e6:5.1f} МБ, "
+            f"свободных страниц {before['freelist_pages']} -> {after['freelist_pages']} за {elapsed:5.2f} с | "
+            f"записей: {len(latencies)}, макс. задержка {max(latencies):6.1f} мс"
+        )
+    print()
+
+
+async def bench_import():
+    """Импорт и выгрузка 100 тыс. напоминаний: построчный разбор и executemany пакетами"""
+    import tracemalloc
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from transfer import FORMAT_CSV, FORMAT_ICS, import_file, export_reminders
+
+    print("=== Импорт и выгрузка файлов (100 тыс. строк) ===")
+    rows = 100_000
+    start_time = datetime(2031, 1, 1, tzinfo=OMSK_TIMEZONE)
+    source = ReminderDatabaseV2(os.path.join(BENCH_DIR, 'import_source.db'))
+    for chunk in range(0, rows, 10_000):
+        source.add_reminders([
+            (1, start_time + timedelta(minutes=i), f"Импортированное напоминание {i}") for i in range(chunk, chunk + 10_000)
+        ])
+
+    for file_format in (FORMAT_CSV, FORMAT_ICS):
+        path = os.path.join(BENCH_DIR, f'import.{file_format}')
+        started = time.perf_counter()
+        await asyncio.to_thread(export_reminders, source, 1, path, file_format)
+        export_seconds = time.perf_counter() - started
+
+        for chunk_size in (1, 100, 1000, 10_000):
+            database = ReminderDatabaseV2(os.path.join(BENCH_DIR, f'import_{file_format}_{chunk_size}.db'))
+            # Транзакция на каждую строку слишком медленная для всего файла - берем его начало
+            max_rows = 5000 if chunk_size == 1 else rows
+            started = time.perf_counter()
+            report = await asyncio.to_thread(import_file, database, 2, path, file_format, chunk_size=chunk_size, max_rows=max_rows)
+            elapsed = time.perf_counter() - started
+            assert report['added'] == max_rows and report['invalid'] == 0
+            print(
+                f"  {file_format} {os.path.getsize(path) / 1e6:5.1f} МБ | строк в транзакции: {chunk_size:>5} | "
+                f"импорт {report['added'] / elapsed:7.0f} строк/с"
+            )
+
+        # Пик памяти Python при потоковом импорте и выгрузке всего файла
+        database = ReminderDatabaseV2(os.path.join(BENCH_DIR, f'import_{file_format}_traced.db'))
+        tracemalloc.start()
+        import_file(database, 2, path, file_format)
+        import_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        export_reminders(source, 1, path + '.out', file_format)
+        export_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            f"  {file_format} выгрузка {rows / export_seconds:7.0f} строк/с | пик памяти: импорт "
+            f"{import_peak / 1e6:4.1f} МБ, выгрузка {export_peak / 1e6:4.1f} МБ"
+        )
+    print()
+
+
+async def bench_stats():
+    """Сводка /stats: подсчет строк COUNT(*) против счетчиков, которые ведут операции записи"""
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+
+    print("=== Статистика /stats (1 млн напоминаний) ===")
+    users = 1000
+    per_user = 1000
+    database = ReminderDatabaseV2(os.path.join(BENCH_DIR, 'stats.db'))
+    start_time = datetime(2031, 1, 1, tzinfo=OMSK_TIMEZONE)
+    for user_id in range(1, users + 1):
+        database.import_reminders(user_id, [(start_time + timedelta(minutes=i), None) for i in range(per_user)])
+    # Половина напоминаний отправлена - как в базе с накопленной историей
+    for first_id in range(1, users * per_user, 20_000):
+        database.mark_reminders_sent(list(range(first_id, first_id + 10_000)))
+
+    def count_rows():
+        with sqlite3.connect(database.db_path) as conn:
+            return (
+                conn.execute("SELECT COUNT(*) FROM reminders_v2 WHERE is_sent = FALSE").fetchone()[0],
+                conn.execute("SELECT COUNT(DISTINCT user_id) FROM reminders_v2 WHERE is_sent = FALSE").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM reminders_v2 WHERE is_sent = TRUE").fetchone()[0],
+            )
+
+    def rollup():
+        summary = database.get_stats_summary()
+        return summary['pending'], summary['active_users'], summary['sent_total']
+
+    results = {}
+    for name, read in (("COUNT(*) по таблице", count_rows), ("счетчики", rollup)):
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            results[name] = read()
+            timings.append(time.perf_counter() - started)
+        print(f"  {name:<20} | {statistics.median(timings) * 1000:8.2f} мс | pending/users/sent = {results[name]}")
+    assert len(set(results.values())) == 1
+
+    # Цена счетчиков при записи: одиночные добавления отдельными транзакциями
+    started = time.perf_counter()
+    for i in range(200):
+        database.add_reminders([(users + 1 + i, start_time, None)])
+    print(f"  Добавление с обновлением счетчиков: {(time.perf_counter() - started) / 200 * 1000:.2f} мс на транзакцию")
+    print()
+
+
+async def bench_broadcast():
+    """Волна напоминаний во время объявления администратора: лимит Telegram 30 сообщений/с"""
+    import logging
+    from datetime import datetime, timedelta
+    from aiogram.methods import SendMessage
+    from broadcast import BroadcastService
+    from clock import VirtualClock
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+    from outbound import OutboundScheduler, outbound_lane, LANE_DELIVERY, LANE_MENU
+
+    print("=== Объявление во время рассылки напоминаний (виртуальное время) ===")
+    recipients = 3000
+    wave = 600
+    database = ReminderDatabaseV2(os.path.join(BENCH_DIR, 'broadcast.db'))
+    start = datetime(2026, 1, 1, tzinfo=OMSK_TIMEZONE)
+    database.add_reminders([(user_id, start + timedelta(days=1), None) for user_id in range(1, recipients + 1)])
+    logging.disable(logging.INFO)
+
+    class PipelineBot:
+        """Отправка через общий планировщик исходящих запросов"""
+
+        def __init__(self, outbound, clock, menu_lane: bool):
+            self.outbound = outbound
+            self.clock = clock
+            self.menu_lane = menu_lane
+            self.last_broadcast = None
+
+        async def send_message(self, chat_id, text, **kwargs):
+            async def make_request(bot, method):
+                return None
+
+            if self.menu_lane and chat_id > 0:
+                # Объявление как обычное сообщение: полоса меню обслуживается вне очереди
+                with outbound_lane(LANE_MENU):
+                    await self.outbound(make_request, None, SendMessage(chat_id=chat_id, text=text))
+            else:
+                await self.outbound(make_request, None, SendMessage(chat_id=chat_id, text=text))
+            if chat_id > 0:
+                self.last_broadcast = self.clock.monotonic()
+
+    for title, mode in (
+        ("без объявления", None),
+        ("объявление в полосе меню", 'menu_lane'),
+        ("BroadcastService", 'background'),
+    ):
+        clock = VirtualClock(start)
+        outbound = OutboundScheduler(rate_per_second=30, per_chat_interval=1.0, clock=clock)
+        bot = PipelineBot(outbound, clock, menu_lane=mode == 'menu_lane')
+        lateness = []
+
+        async def deliver(chat_id):
+            with outbound_lane(LANE_DELIVERY):
+                await bot.send_message(chat_id, "🔔")
+            lateness.append(clock.monotonic() - 30)
+
+        service = None
+        if mode:
+            database.create_broadcast("Профилактика", created_by=1)
+            # Без фоновой полосы объявление идет с полным лимитом Telegram
+            rate = 20 if mode == 'background' else 30
+            service = BroadcastService(bot, database, rate_per_second=rate, clock=clock)
+            service.resume()
+
+        await clock.advance(30)
+        tasks = [asyncio.create_task(deliver(-chat_id)) for chat_id in range(1, wave + 1)]
+        await clock.advance(3600)
+        await asyncio.gather(*tasks)
+
+        broadcast = ""
+        if service:
+            service.stop()
+            broadcast = f"объявление: {database.get_broadcasts()[0]['sent']} за {bot.last_broadcast:.0f} с"
+        print(
+            f"  {title:<32} волна {wave} напоминаний: p50 {statistics.median(lateness):5.1f} с, "
+            f"последнее через {max(lateness):5.1f} с | {broadcast}"
+        )
+    logging.disable(logging.NOTSET)
+    print()
+
+
+async def bench_search():
+    """Поиск /find: индекс FTS5 против LIKE по текстам (1 млн напоминаний)"""
+    import random
+    from datetime import datetime, timedelta
+    from config import OMSK_TIMEZONE
+    from database import ReminderDatabaseV2
+
+    print("=== Поиск по тексту напоминаний (1 млн строк) ===")
+    words = [
+        "купить", "молоко", "хлеб", "позвонить", "маме", "врач", "оплатить", "интернет", "встреча",
+        "отчет", "тренировка", "забрать", "посылку", "день", "рождения", "лекарство", "счет", "квартира",
+    ] + [f"слово{i}" for i in range(2000)]
+    rng = random.Random(42)
+    database = ReminderDatabaseV2(os.path.join(BENCH_DIR, 'search.db'))
+    start_time = datetime(2031, 1, 1, tzinfo=OMSK_TIMEZONE)
+    # Один активный пользователь с 10 тыс. напоминаний и 990 пользователей по 1000
+    for user_id, count in [(1, 10_000)] + [(user_id, 1000) for user_id in range(2, 992)]:
+        database.import_reminders(user_id, [
+            (start_time + timedelta(minutes=i), " ".join(rng.choices(words, k=5))) for i in range(count)
+        ])
+
+    def like(query, only_user_rows: bool):
+        # "+is_sent" исключает индекс idx_reminders_due: перебор только строк пользователя
+        is_sent = "+is_sent" if only_user_rows else "is_sent"
+        with sqlite3.connect(database.db_path) as conn:
+            return conn.execute(
+                f"SELECT id FROM reminders_v2 WHERE user_id = ? AND {is_sent} = FALSE AND reminder_text LIKE ? "
+                "ORDER BY reminder_time LIMIT 10",
+                (1, f"%{query}%")
+            ).fetchall()
+
+    def fts(query):
+        return database.search_reminders(1, query)
+
+    for query in ("молоко", "слово1999", "нетакогослова"):
+        for name, search in (
+            ("LIKE (план SQLite)", lambda query: like(query, False)),
+            ("LIKE по строкам польз.", lambda query: like(query, True)),
+            ("FTS5", fts),
+        ):
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                found = search(query)
+                timings.append(time.perf_counter() - started)
+            print(f"  {query:<14} {name:<24} | {statistics.median(timings) * 1000:8.2f} мс | найдено {len(found)}")
+    print()
+
+
+async def bench_callbacks():
+    """Маршрутизация нажатий кнопок: цепочка фильтров F.data против таблицы по коду действия"""
+    from aiogram import Bot, Dispatcher, Router, F
+    from aiogram.types import Update
+    from callbacks import encode_callback, decode_callback, ACTION_ARGS, ACTION_MAIN_MENU, ACTION_SEARCH_PAGE
+
+    print("=== Маршрутизация нажатий кнопок (мкс на нажатие через Dispatcher) ===")
+    presses = 10_000
+    bot = Bot(token=os.environ['BOT_TOKEN'])
+
+    async def noop(callback, *args):
+        return None
+
+    # Фильтры обработчиков в прежнем порядке (строковая callback_data)
+    filters_router = Router()
+    for callback_filter in (
+        F.data.in_({"main_menu", "main_menu:new"}), F.data.in_({"show_reminders", "show_reminders:new"}),
+        F.data.in_({"help", "help:new"}), F.data == "add_reminder_help", F.data.startswith("reminder_"),
+        F.data.startswith("delete_"), F.data.startswith("confirm_delete_"), F.data == "bulk_select",
+        F.data.startswith("bulk_toggle_"), F.data == "bulk_delete_selected", F.data.startswith("bulk_ask_"),
+        F.data.startswith("bulk_confirm_"), F.data.startswith("find_page_"),
+    ):
+        filters_router.callback_query(callback_filter)(noop)
+
+    table = dict.fromkeys(ACTION_ARGS, noop)
+    table_router = Router()
+
+    @table_router.callback_query()
+    async def dispatch(callback):
+        data = decode_callback(callback.data)
+        handler = table.get(data.action) if data else None
+        if handler is not None:
+            await handler(callback, *data.args)
+
+    floor_router = Router()
+    floor_router.callback_query()(noop)
+
+    def make_update(data: str, update_id: int) -> Update:
+        return Update.model_validate({
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id), 'chat_instance': '1', 'data': data,
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'User'},
+                'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': '...'}
+            }
+        }, context={'bot': bot})
+
+    dispatchers = {}
+    for router in (filters_router, table_router, floor_router):
+        dispatchers[router] = Dispatcher()
+        dispatchers[router].include_router(router)
+
+    async def measure(router, data: str) -> float:
+        dp = dispatchers[router]
+        updates = [make_update(data, update_id) for update_id in range(presses)]
+        started = time.perf_counter()
+        for update in updates:
+            await dp.feed_update(bot, update)
+        return (time.perf_counter() - started) / presses * 1e6
+
+    floor = await measure(floor_router, encode_callback(ACTION_MAIN_MENU))
+    print(f"  Один обработчик без фильтров (нижняя граница Dispatcher): {floor:6.1f} мкс")
+    for title, legacy_data, action, args in (
+        ("первая кнопка (главное меню)", "main_menu", ACTION_MAIN_MENU, ()),
+        ("последняя кнопка (страница поиска)", "find_page_3", ACTION_SEARCH_PAGE, (3,)),
+    ):
+        filters = await measure(filters_router, legacy_data)
+        dispatch_table = await measure(table_router, encode_callback(action, *args))
+        print(
+            f"  {title:<36} | фильтры F.data: {filters:6.1f} мкс ({filters - floor:+6.1f}) | "
+            f"таблица действий: {dispatch_table:6.1f} мкс ({dispatch_table - floor:+6.1f})"
+        )
+
+    # Только разбор callback_data
+    data = encode_callback(ACTION_SEARCH_PAGE, 3)
+    started = time.perf_counter()
+    for _ in range(presses * 10):
+        decode_callback(data)
+    print(f"  decode_callback: {(time.perf_counter() - started) / (presses * 10) * 1e9:.0f} нс, {len(data)} символов")
+    await bot.session.close()
+    print()
+
+
+BENCHMARKS = {
+    'webhook': bench_webhook,
+    'workers': bench_workers,
+    'coalesce': bench_coalesce,
+    'due_index': bench_due_index,
+    'navigation': bench_navigation,
+    'throttling': bench_throttling,
+    'outbound': bench_outbound,
+    'simulation': bench_simulation,
+    'sharding': bench_sharding,
+    'group_commit': bench_group_commit,
+    'backup': bench_backup,
+    'maintenance': bench_maintenance,
+    'import': bench_import,
+    'stats': bench_stats,
+    'broadcast': bench_broadcast,
+    'search': bench_search,
+    'callbacks': bench_callbacks,
+}
+
+
+async def main(names: list):
+    for name in names or BENCHMARKS:
+        await BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
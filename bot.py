@@ -4,38 +4,102 @@ Telegram-бот "Напоминалка" версия 2.0
 """
 import asyncio
 import logging
-from datetime import datetime
+import signal
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
-from config import BOT_TOKEN, setup_logging
-from database import db_v2
-from handlers import router, send_reminder_to_user_v2
+from config import (
+    BOT_MODE,
+    BOT_ROLE,
+    TELEGRAM_API_BASE_URL,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WORKER_PROCESSES,
+    DELIVERY_SIGNAL_HOST,
+    DELIVERY_SIGNAL_BIND_HOST,
+    DELIVERY_SIGNAL_PORT,
+    DUE_INDEX_ENABLED,
+    DB_BACKUP_ENABLED,
+    DB_MAINTENANCE_ENABLED,
+    RATE_LIMIT_ENABLED,
+    OUTBOUND_LANES_ENABLED,
+    OUTBOUND_RATE_PER_SECOND,
+    OUTBOUND_RATE_SHARE,
+    get_bot_token,
+    setup_logging
+)
+from clock import get_clock
+from broadcast import BroadcastService
+from database import get_db
+from due_index import DueIndex
+from events import reminder_events, EVENT_BROADCAST, EVENT_USER, DeliverySignalListener, DeliverySignalSender
+from handlers import router
+from maintenance import RetentionJob, MaintenanceJob, BackupService
+from middlewares import ThrottlingMiddleware
+from outbound import OutboundScheduler
+from scheduler import ReminderScheduler
+from user_settings import get_user_settings
 
 logger = logging.getLogger(__name__)
 
 
+def outbound_rate_for(role: str, workers_count: int = 0) -> float:
+    """
+    Лимит исходящих запросов в секунду для одного процесса
+    
+    Args:
+        role: Роль процесса (all, interactive, delivery)
+        workers_count: Число рабочих процессов, с которыми делится доля роли
+        
+    Returns:
+        float: Лимит запросов в секунду
+    """
+    share = OUTBOUND_RATE_SHARE or (1.0 if role == 'all' else 0.5)
+    return OUTBOUND_RATE_PER_SECOND * share / (workers_count + 1)
+
+
 class ReminderBotV2:
     """Класс для управления ботом напоминаний версии 2.0"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        api_base_url: str = TELEGRAM_API_BASE_URL,
+        workers_count: int = WORKER_PROCESSES,
+        role: str = BOT_ROLE
+    ):
         # Настройка логирования
         setup_logging()
         
         # Создание бота и диспетчера
+        session = None
+        if api_base_url:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(api_base_url))
+        
         self.bot = Bot(
-            token=BOT_TOKEN,
+            token=get_bot_token(),
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         self.dp = Dispatcher()
         
-        # Регистрация роутера
-        self.dp.include_router(router)
+        # Обновления обрабатывают рабочие процессы (кроме процесса только рассылки)
+        use_workers = workers_count > 0 and role != 'delivery'
         
-        # Флаг для остановки фоновых задач
-        self._running = False
+        # Приоритеты исходящих запросов: кнопки, затем напоминания, затем меню.
+        # Лимит скорости действует на процесс, поэтому общий лимит делится между
+        # процессами разных ролей, а доля роли - поровну с рабочими процессами
+        outbound_rate = outbound_rate_for(role, workers_count if use_workers else 0)
+        self.outbound = None
+        if OUTBOUND_LANES_ENABLED:
+            self.outbound = OutboundScheduler(rate_per_second=outbound_rate)
+            self.bot.session.middleware(self.outbound)
         
         # Статистика
         self.stats = {
@@ -43,52 +107,138 @@ class ReminderBotV2:
             'reminders_sent': 0,
             'reminders_added': 0,
             'reminders_deleted': 0,
+            'reminders_skipped': 0,
+            'reminders_failed': 0,
+            'reminders_cleaned': 0,
+            'backups_created': 0,
+            'broadcast_sent': 0,
+            'broadcast_blocked': 0,
+            'db_pages_vacuumed': 0,
+            'updates_throttled': 0,
             'errors_count': 0,
-            'start_time': datetime.now()
+            'start_time': get_clock().now()
         }
         
-        logger.info("Бот v2.0 инициализирован")
+        # Защита от флуда до передачи обновления обработчикам или рабочим процессам
+        self.throttling = None
+        if RATE_LIMIT_ENABLED:
+            self.throttling = ThrottlingMiddleware(stats=self.stats)
+            self.dp.update.outer_middleware(self.throttling)
+        
+        # Регистрация роутера: в этом процессе или в рабочих процессах по шардам user_id
+        self.workers = None
+        if use_workers:
+            from workers import ShardedUpdateProcessor, ShardRouterMiddleware
+            self.workers = ShardedUpdateProcessor(workers_count, api_base_url, outbound_rate)
+            self.dp.update.outer_middleware(ShardRouterMiddleware(self.workers))
+        else:
+            self.dp.include_router(router)
+        self.allowed_updates = router.resolve_used_update_types()
+        
+        # Роль процесса: all (все в одном), interactive (только сообщения), delivery (только рассылка)
+        self.role = role
+        
+        # Флаг для остановки фоновых задач
+        self._running = False
+        self._tasks = []
+        self._signal_listener = None
+        self._signal_sender = None
+        
+        # Событие остановки для режима webhook
+        self._stop_event = asyncio.Event()
+        
+        # Планировщик отправки напоминаний и очистка старых записей
+        due_index = DueIndex(get_db()) if DUE_INDEX_ENABLED else None
+        self.user_settings = get_user_settings()
+        self.scheduler = ReminderScheduler(
+            self.bot, get_db(), self.stats, due_index=due_index, user_settings=self.user_settings
+        )
+        self.retention = RetentionJob(get_db(), stats=self.stats)
+        self.db_maintenance = MaintenanceJob(get_db(), stats=self.stats) if DB_MAINTENANCE_ENABLED else None
+        self.backup = BackupService(get_db(), stats=self.stats) if DB_BACKUP_ENABLED else None
+        self.broadcasts = BroadcastService(self.bot, get_db(), stats=self.stats, user_settings=self.user_settings)
+        
+        logger.info(f"Бот v2.0 инициализирован (роль: {self.role})")
     
-    async def check_reminders(self):
-        """Фоновая задача для проверки напоминаний"""
-        while self._running:
+    async def _start_background_tasks(self):
+        """Запуск фоновых задач, общих для polling, webhook и процесса рассылки"""
+        self._running = True
+        if self.workers:
+            self.workers.start()
+        
+        if self.role == 'interactive':
+            # Рассылка в отдельном процессе: сообщаем ему об изменениях через сокет
+            self._signal_sender = DeliverySignalSender(DELIVERY_SIGNAL_HOST, DELIVERY_SIGNAL_PORT)
+            reminder_events.subscribe(self._signal_sender)
+            return
+        
+        if self.role == 'delivery' or self.workers:
+            # Обработчики работают в других процессах: события приходят по сокету
+            self._signal_listener = DeliverySignalListener(
+                DELIVERY_SIGNAL_BIND_HOST, DELIVERY_SIGNAL_PORT, self._on_reminder_event
+            )
+            await self._signal_listener.start()
+        else:
+            reminder_events.subscribe(self._on_reminder_event)
+        
+        # Время работы для /stats: обработчики в других процессах читают его из базы
+        get_db().set_started_at(self.stats['start_time'])
+        
+        self._tasks.append(asyncio.create_task(self.scheduler.check_reminders()))
+        self._tasks.append(asyncio.create_task(self.retention.run()))
+        if self.db_maintenance:
+            self._tasks.append(asyncio.create_task(self.db_maintenance.run()))
+        if self.backup:
+            # Копии снимает только процесс, в котором работает рассылка, чтобы не дублировать их
+            self._tasks.append(asyncio.create_task(self.backup.run()))
+        # Объявления отправляет процесс рассылки напоминаний: их исходящие запросы идут
+        # через общий планировщик по фоновой полосе и не задерживают напоминания
+        self.broadcasts.resume()
+    
+    def _on_reminder_event(self, event: str, reminder_time=None, user_id: int = None):
+        """События обработчиков: рассылки - сервису объявлений, пользователи - кэшу настроек, остальное - планировщику"""
+        if event == EVENT_BROADCAST:
+            self.broadcasts.resume()
+        elif event == EVENT_USER:
+            # В одном процессе обработчики уже записали настройки в этот же кэш
+            if self._signal_listener is not None:
+                self.user_settings.invalidate(user_id)
+        else:
+            self.scheduler.notify(event, reminder_time)
+    
+    async def _stop_background_tasks(self):
+        """Остановка фоновых задач"""
+        self._running = False
+        self.scheduler.stop()
+        self.retention.stop()
+        if self.db_maintenance:
+            self.db_maintenance.stop()
+        if self.backup:
+            self.backup.stop()
+        await self.broadcasts.stop()
+        reminder_events.unsubscribe(self._on_reminder_event)
+        if self._signal_listener:
+            self._signal_listener.close()
+            self._signal_listener = None
+        if self._signal_sender:
+            reminder_events.unsubscribe(self._signal_sender)
+            self._signal_sender.close()
+            self._signal_sender = None
+        for task in self._tasks:
+            task.cancel()
             try:
-                # Получаем напоминания, которые нужно отправить
-                due_reminders = db_v2.get_due_reminders()
-                
-                for reminder_id, user_id, reminder_time, reminder_text in due_reminders:
-                    try:
-                        # Отправляем напоминание
-                        await send_reminder_to_user_v2(self.bot, user_id, reminder_time, reminder_text)
-                        
-                        # Отмечаем как отправленное
-                        db_v2.mark_reminder_sent(reminder_id)
-                        
-                        self.stats['reminders_sent'] += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки напоминания {reminder_id}: {e}")
-                        self.stats['errors_count'] += 1
-                
-                # Очистка старых напоминаний (раз в час)
-                current_minute = datetime.now().minute
-                if current_minute == 0:
-                    db_v2.cleanup_old_reminders()
-                
-            except Exception as e:
-                logger.error(f"Ошибка в проверке напоминаний: {e}")
-                self.stats['errors_count'] += 1
-            
-            # Ждем 60 секунд до следующей проверки
-            await asyncio.sleep(60)
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+        if self.workers:
+            await asyncio.get_running_loop().run_in_executor(None, self.workers.stop)
     
     async def start_polling(self):
         """Запуск бота в режиме polling"""
         try:
-            self._running = True
-            
             # Запускаем фоновую задачу проверки напоминаний
-            reminder_task = asyncio.create_task(self.check_reminders())
+            await self._start_background_tasks()
             
             logger.info("Бот v2.0 запущен в режиме polling")
             logger.info("Новые возможности:")
@@ -97,32 +247,130 @@ class ReminderBotV2:
             logger.info("- Расширенные форматы дат")
             
             # Запускаем polling
-            await self.dp.start_polling(self.bot)
+            await self.dp.start_polling(self.bot, allowed_updates=self.allowed_updates)
             
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
             raise
         finally:
-            self._running = False
-            if 'reminder_task' in locals():
-                reminder_task.cancel()
-                try:
-                    await reminder_task
-                except asyncio.CancelledError:
-                    pass
+            await self._stop_background_tasks()
+    
+    def create_webhook_app(self, secret_token: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH):
+        """
+        Создать aiohttp-приложение для приема обновлений через webhook
+        
+        Args:
+            secret_token: Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+            path: Путь, на котором принимаются обновления
+            
+        Returns:
+            web.Application: Приложение с тем же роутером, что и в режиме polling
+            
+        Raises:
+            ValueError: Если секрет не задан (запросы без заголовка принимались бы от кого угодно)
+        """
+        from aiohttp import web
+        from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+        
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET не задан. Без секрета webhook принимает обновления от кого угодно.")
+        
+        app = web.Application()
+        SimpleRequestHandler(
+            dispatcher=self.dp,
+            bot=self.bot,
+            secret_token=secret_token
+        ).register(app, path=path)
+        setup_application(app, self.dp, bot=self.bot)
+        return app
+    
+    async def start_webhook(self):
+        """Запуск бота в режиме webhook"""
+        from aiohttp import web
+        
+        runner = web.AppRunner(self.create_webhook_app())
+        try:
+            await self._start_background_tasks()
+            
+            await runner.setup()
+            site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+            await site.start()
+            
+            if WEBHOOK_BASE_URL:
+                await self.bot.set_webhook(
+                    url=WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=self.allowed_updates
+                )
+            else:
+                logger.warning("WEBHOOK_BASE_URL не задан, webhook в Telegram не регистрируется")
+            
+            logger.info(f"Бот v2.0 запущен в режиме webhook на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+            
+            # Ждем сигнала остановки
+            self._install_signal_handlers()
+            await self._stop_event.wait()
+            logger.info("Получен сигнал остановки webhook")
+            
+        except Exception as e:
+            logger.error(f"Ошибка при запуске бота в режиме webhook: {e}")
+            raise
+        finally:
+            # Сначала перестаем принимать новые запросы, затем останавливаем фоновые задачи
+            await runner.cleanup()
+            await self._stop_background_tasks()
+    
+    def _install_signal_handlers(self):
+        """Остановка по SIGINT/SIGTERM (на Windows обработчики не поддерживаются)"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+    
+    async def start_delivery(self):
+        """Запуск процесса рассылки напоминаний без приема обновлений (BOT_ROLE=delivery)"""
+        try:
+            await self._start_background_tasks()
+            logger.info("Бот v2.0 запущен как процесс рассылки напоминаний")
+            
+            self._install_signal_handlers()
+            await self._stop_event.wait()
+            logger.info("Получен сигнал остановки процесса рассылки")
+            
+        except Exception as e:
+            logger.error(f"Ошибка в процессе рассылки: {e}")
+            raise
+        finally:
+            await self._stop_background_tasks()
+    
+    async def run(self):
+        """Запуск бота в режиме, выбранном в конфигурации (BOT_ROLE, BOT_MODE)"""
+        if self.role == 'delivery':
+            await self.start_delivery()
+        elif BOT_MODE == 'webhook':
+            await self.start_webhook()
+        else:
+            await self.start_polling()
     
     async def stop(self):
         """Остановка бота"""
         self._running = False
+        self._stop_event.set()
         await self.bot.session.close()
         logger.info("Бот v2.0 остановлен")
     
     def get_stats(self) -> dict:
         """Получить статистику работы бота"""
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = get_clock().now() - self.stats['start_time']
         
         return {
             **self.stats,
+            'outbound': self.outbound.metrics() if self.outbound else {},
+            'user_cache': self.user_settings.metrics(),
+            'last_maintenance': self.db_maintenance.last_report if self.db_maintenance else None,
+            'last_backup': self.backup.last_report if self.backup else None,
             'uptime_seconds': int(uptime.total_seconds()),
             'uptime_str': str(uptime).split('.')[0]
         }
@@ -133,7 +381,7 @@ async def main():
     bot = ReminderBotV2()
     
     try:
-        await bot.start_polling()
+        await bot.run()
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
     except Exception as e:
@@ -0,0 +1,169 @@
+"""
+Объявления администратора всем пользователям (/broadcast)
+
+Получатели читаются из базы пакетами по возрастанию user_id. Пакет
+отправляется несколькими параллельными отправками с общим темпом
+BROADCAST_RATE_PER_SECOND по фоновой полосе исходящих запросов
+(outbound.LANE_BROADCAST): она получает только разрешения, не нужные
+рассылке напоминаний, ответам на кнопки и меню. После каждого пакета
+в базу записывается контрольная точка, и после перезапуска рассылка
+продолжается с места остановки (прерванный пакет может дойти повторно).
+Пользователи, заблокировавшие бота, отмечаются и больше не попадают
+в получатели.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from clock import get_clock
+from config import BROADCAST_RATE_PER_SECOND, BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE
+from outbound import outbound_lane, LANE_BROADCAST
+
+logger = logging.getLogger(__name__)
+
+# Результаты отправки одному получателю (совпадают со счетчиками в таблице broadcasts)
+SEND_SENT = 'sent'
+SEND_FAILED = 'failed'
+SEND_BLOCKED = 'blocked'
+
+# Сколько раз повторять отправку после ответа Telegram "слишком много запросов"
+MAX_RETRIES = 3
+
+
+class BroadcastService:
+    """Отправка объявлений с темпом, контрольными точками и возобновлением"""
+
+    def __init__(
+        self,
+        bot,
+        database,
+        stats: Optional[dict] = None,
+        rate_per_second: float = BROADCAST_RATE_PER_SECOND,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        batch_size: int = BROADCAST_BATCH_SIZE,
+        user_settings=None,
+        clock=None
+    ):
+        """
+        Args:
+            bot: Экземпляр бота
+            database: База данных напоминаний (рассылки и получатели)
+            stats: Словарь статистики бота (необязательно)
+            rate_per_second: Сообщений объявлений в секунду (на все рассылки вместе)
+            concurrency: Одновременных отправок
+            batch_size: Получателей в пакете между контрольными точками
+            user_settings: Кэш настроек пользователей (отметка о блокировке попадает и в него)
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.bot = bot
+        self.db = database
+        self.stats = stats
+        self.interval = 1 / rate_per_second
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.user_settings = user_settings
+        self.clock = clock or get_clock()
+
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._next_slot = 0.0
+
+    def resume(self) -> int:
+        """
+        Запустить незавершенные рассылки из базы (при старте и после создания новой)
+
+        Returns:
+            int: Количество запущенных рассылок
+        """
+        started = 0
+        for broadcast in self.db.get_broadcasts(running_only=True):
+            task = self._tasks.get(broadcast['id'])
+            if task is None or task.done():
+                self._tasks[broadcast['id']] = asyncio.create_task(self.run_broadcast(broadcast))
+                started += 1
+        return started
+
+    async def run_broadcast(self, broadcast: dict) -> dict:
+        """
+        Отправить рассылку начиная с контрольной точки
+
+        Args:
+            broadcast: Запись таблицы broadcasts (см. get_broadcasts)
+
+        Returns:
+            dict: Счетчики sent, failed, blocked с начала рассылки
+        """
+        broadcast_id = broadcast['id']
+        counters = {key: broadcast[key] for key in (SEND_SENT, SEND_FAILED, SEND_BLOCKED)}
+        last_user_id = broadcast['last_user_id']
+        semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Рассылка {broadcast_id}: старт после пользователя {last_user_id}")
+
+        try:
+            for batch in self.db.iter_broadcast_recipients(last_user_id, self.batch_size):
+                results = await asyncio.gather(*(
+                    self._send(user_id, broadcast['text'], semaphore) for user_id in batch
+                ))
+                for result in results:
+                    counters[result] += 1
+                last_user_id = batch[-1]
+                self.db.save_broadcast_progress(broadcast_id, last_user_id, **counters)
+
+            self.db.save_broadcast_progress(broadcast_id, last_user_id, status='done', **counters)
+            logger.info(
+                f"Рассылка {broadcast_id} завершена: доставлено {counters[SEND_SENT]}, "
+                f"ошибок {counters[SEND_FAILED]}, заблокировали бота {counters[SEND_BLOCKED]}"
+            )
+        except asyncio.CancelledError:
+            logger.info(f"Рассылка {broadcast_id} остановлена на пользователе {last_user_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки {broadcast_id}: {e}")
+            # Не возобновляется при перезапуске: ошибка, скорее всего, повторится
+            self.db.save_broadcast_progress(broadcast_id, last_user_id, status='failed', **counters)
+        return counters
+
+    async def _wait_slot(self):
+        """Дождаться очередного разрешения общего темпа объявлений"""
+        now = self.clock.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self.interval
+        await self.clock.sleep(slot - now)
+
+    async def _send(self, user_id: int, text: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            for _ in range(MAX_RETRIES + 1):
+                await self._wait_slot()
+                try:
+                    with outbound_lane(LANE_BROADCAST):
+                        await self.bot.send_message(chat_id=user_id, text=text)
+                    self._count('broadcast_sent')
+                    return SEND_SENT
+                except TelegramRetryAfter as e:
+                    # Общий лимит превышен: ждем, сколько просит Telegram, и пробуем снова
+                    logger.warning(f"Рассылка: Telegram просит подождать {e.retry_after} с")
+                    await self.clock.sleep(e.retry_after)
+                except TelegramForbiddenError:
+                    if self.user_settings is not None:
+                        self.user_settings.set_blocked(user_id)
+                    else:
+                        self.db.set_user_blocked(user_id)
+                    self._count('broadcast_blocked')
+                    return SEND_BLOCKED
+                except Exception as e:
+                    logger.warning(f"Рассылка: не удалось отправить пользователю {user_id}: {e}")
+                    return SEND_FAILED
+            return SEND_FAILED
+
+    def _count(self, key: str):
+        if self.stats is not None:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    async def stop(self):
+        """Остановить рассылки и дождаться их завершения (прогресс сохранен по последний завершенный пакет)"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
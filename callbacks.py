@@ -0,0 +1,166 @@
+"""
+Компактная callback_data кнопок: версия формата, код действия, флаги и аргументы
+
+Формат (base64url без "="): байт версии, байт действия, байт флагов, затем
+аргументы - неотрицательные целые числа в varint (7 бит на байт). Кнопка
+с id напоминания занимает 8-10 символов и с запасом укладывается в лимит
+Telegram 64 байта, так что в кнопку можно добавить страницу, действие и т.п.
+
+Обработчик выбирается по коду действия одним поиском в словаре вместо
+перебора фильтров F.data.startswith(...). Кнопки в сообщениях, отправленных
+до перехода на этот формат ("reminder_5", "main_menu"), разбираются
+по таблицам LEGACY_*.
+"""
+import base64
+import binascii
+from typing import NamedTuple, Optional, Tuple
+
+# Версия формата: кнопки другой версии не разбираются (decode_callback вернет None).
+# Пока версия меньше 4, данные начинаются с "A" и не совпадают со строками старого формата
+CALLBACK_VERSION = 1
+
+# Лимит Telegram на callback_data
+MAX_CALLBACK_BYTES = 64
+
+# Флаг: открыть экран новым сообщением, не трогая текущее
+FLAG_NEW_MESSAGE = 1
+
+# Коды действий
+ACTION_MAIN_MENU = 1
+ACTION_SHOW_REMINDERS = 2
+ACTION_HELP = 3
+ACTION_ADD_HELP = 4
+ACTION_REMINDER = 5
+ACTION_DELETE = 6
+ACTION_CONFIRM_DELETE = 7
+ACTION_SEARCH_PAGE = 8
+ACTION_BULK_SELECT = 9
+ACTION_BULK_TOGGLE = 10
+ACTION_BULK_DELETE_SELECTED = 11
+ACTION_BULK_ASK = 12
+ACTION_BULK_CONFIRM = 13
+ACTION_SNOOZE = 14
+ACTION_BULK_CONFIRM_SELECTED = 15
+ACTION_SNOOZE_ALL = 16
+
+# Код действия -> число аргументов (None - переменное число, проверяет обработчик)
+ACTION_ARGS = {
+    ACTION_MAIN_MENU: 0,
+    ACTION_SHOW_REMINDERS: 0,
+    ACTION_HELP: 0,
+    ACTION_ADD_HELP: 0,
+    ACTION_REMINDER: 1,            # id напоминания
+    ACTION_DELETE: 1,              # id напоминания
+    ACTION_CONFIRM_DELETE: 1,      # id напоминания
+    ACTION_SEARCH_PAGE: 1,         # номер страницы
+    ACTION_BULK_SELECT: 0,
+    ACTION_BULK_TOGGLE: 1,         # id напоминания
+    ACTION_BULK_DELETE_SELECTED: 0,
+    ACTION_BULK_ASK: 1,            # что удалить (BULK_SCOPES в handlers.py)
+    ACTION_BULK_CONFIRM: 1,        # что удалить
+    ACTION_SNOOZE: 3,              # id напоминания, вариант SNOOZE_OPTIONS, минута исходного времени
+    ACTION_BULK_CONFIRM_SELECTED: 0,
+    ACTION_SNOOZE_ALL: None,       # вариант SNOOZE_OPTIONS, минута первого, затем пары (id, сдвиг в минутах)
+}
+
+# Старый формат (кнопки, отправленные до перехода на компактную запись):
+# строка целиком или префикс с числовым аргументом
+LEGACY_ACTIONS = {
+    "main_menu": ACTION_MAIN_MENU,
+    "show_reminders": ACTION_SHOW_REMINDERS,
+    "help": ACTION_HELP,
+    "add_reminder_help": ACTION_ADD_HELP,
+}
+LEGACY_PREFIXES = (
+    ("confirm_delete_", ACTION_CONFIRM_DELETE),
+    ("delete_", ACTION_DELETE),
+    ("reminder_", ACTION_REMINDER),
+)
+
+
+class CallbackData(NamedTuple):
+    """Разобранная callback_data"""
+    action: int
+    args: Tuple[int, ...] = ()
+    new_message: bool = False
+
+
+def encode_callback(action: int, *args: int, new_message: bool = False) -> str:
+    """
+    Упаковать действие кнопки в callback_data
+
+    Args:
+        action: Код действия (ACTION_*)
+        *args: Аргументы действия (неотрицательные целые, сколько указано в ACTION_ARGS)
+        new_message: Открыть экран новым сообщением
+
+    Returns:
+        str: callback_data для InlineKeyboardButton
+    """
+    if action not in ACTION_ARGS or ACTION_ARGS[action] not in (None, len(args)):
+        raise ValueError(f"Действие {action} не принимает {len(args)} аргументов")
+
+    packed = bytearray((CALLBACK_VERSION, action, FLAG_NEW_MESSAGE if new_message else 0))
+    for value in args:
+        if value < 0:
+            raise ValueError(f"Отрицательный аргумент кнопки: {value}")
+        while value > 0x7F:
+            packed.append(value & 0x7F | 0x80)
+            value >>= 7
+        packed.append(value)
+
+    data = base64.urlsafe_b64encode(bytes(packed)).rstrip(b"=").decode("ascii")
+    if len(data) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт")
+    return data
+
+
+def _decode_packed(data: str) -> Optional[CallbackData]:
+    try:
+        packed = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(packed) < 3 or packed[0] != CALLBACK_VERSION:
+        return None
+
+    action, flags = packed[1], packed[2]
+    args = []
+    value = shift = 0
+    for byte in packed[3:]:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            args.append(value)
+            value = shift = 0
+    if shift or action not in ACTION_ARGS or ACTION_ARGS[action] not in (None, len(args)):
+        return None
+    return CallbackData(action, tuple(args), bool(flags & FLAG_NEW_MESSAGE))
+
+
+def _decode_legacy(data: str) -> Optional[CallbackData]:
+    action = LEGACY_ACTIONS.get(data)
+    if action is not None:
+        return CallbackData(action)
+    for prefix, action in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            argument = data[len(prefix):]
+            if not (argument.isascii() and argument.isdigit()):
+                return None
+            return CallbackData(action, (int(argument),))
+    return None
+
+
+def decode_callback(data: Optional[str]) -> Optional[CallbackData]:
+    """
+    Разобрать callback_data кнопки
+
+    Args:
+        data: callback_data из нажатия (текущий или старый строковый формат)
+
+    Returns:
+        Optional[CallbackData]: Действие и аргументы или None, если кнопка не распознана
+            (другая версия формата, поврежденные данные)
+    """
+    if not data:
+        return None
+    return _decode_packed(data) or _decode_legacy(data)
@@ -0,0 +1,142 @@
+"""
+Источник времени бота
+
+Весь код берет текущее время через get_clock().now(), а ожидания - через
+clock.sleep() и clock.wait(). По умолчанию это системные часы по Омску.
+VirtualClock позволяет прогнать дни работы планировщика за секунды:
+время сдвигается сразу к ближайшему таймеру, как только все задачи
+дошли до ожидания.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from config import OMSK_TIMEZONE
+
+# Сколько итераций цикла событий даем задачам, чтобы дойти до следующего ожидания
+SETTLE_ITERATIONS = 50
+
+
+class SystemClock:
+    """Реальное время"""
+
+    def now(self) -> datetime:
+        """Текущее время в часовом поясе Омска"""
+        return datetime.now(OMSK_TIMEZONE)
+
+    def monotonic(self) -> float:
+        """Монотонные секунды для измерения интервалов"""
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """
+        Ждать события не дольше timeout секунд
+
+        Returns:
+            bool: True если событие наступило, False по таймауту
+        """
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class VirtualClock:
+    """Виртуальное время для симуляций и тестов"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        """
+        Args:
+            start: Начальный момент (по умолчанию - текущее время по Омску)
+        """
+        self._start = start or datetime.now(OMSK_TIMEZONE)
+        self._now = self._start
+        self._timers: List[Tuple[datetime, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return (self._now - self._start).total_seconds()
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        # Округляем вверх до микросекунды (точность datetime), иначе ожидание меньше
+        # микросекунды не сдвигает время и цикл вида "спать до момента X" не завершается
+        deadline = self._now + timedelta(microseconds=math.ceil(seconds * 1_000_000))
+        heapq.heappush(self._timers, (deadline, next(self._seq), future))
+        await future
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        if event.is_set():
+            return True
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        done, pending = await asyncio.wait({waiter, sleeper}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return waiter in done
+
+    async def advance(self, seconds: float):
+        """Сдвинуть время вперед, срабатывая таймеры по порядку"""
+        await self.run_until(self._now + timedelta(seconds=seconds))
+
+    async def run_until(self, moment: datetime):
+        """
+        Выполнять задачи, перескакивая к ближайшим таймерам, до момента moment
+
+        Args:
+            moment: Конечный момент виртуального времени
+        """
+        while True:
+            await self._settle()
+
+            while self._timers and self._timers[0][2].done():
+                heapq.heappop(self._timers)
+
+            if not self._timers or self._timers[0][0] > moment:
+                self._now = max(self._now, moment)
+                await self._settle()
+                return
+
+            self._now = max(self._now, self._timers[0][0])
+            while self._timers and self._timers[0][0] <= self._now:
+                _, _, future = heapq.heappop(self._timers)
+                if not future.done():
+                    future.set_result(None)
+
+    async def _settle(self):
+        for _ in range(SETTLE_ITERATIONS):
+            await asyncio.sleep(0)
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """Текущий источник времени"""
+    return _clock
+
+
+def set_clock(clock):
+    """
+    Заменить источник времени (для симуляций и тестов)
+
+    Returns:
+        Предыдущий источник времени
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
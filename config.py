@@ -6,10 +6,8 @@ import logging
 from datetime import timezone, timedelta
 from pathlib import Path
 
-# Получение токена бота из переменных окружения
+# Получение токена бота из переменных окружения (проверяется при создании бота, см. get_bot_token)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в переменных окружения. Добавьте его в .env файл.")
 
 # Часовой пояс Омска (+6 UTC)
 OMSK_TIMEZONE = timezone(timedelta(hours=6))
@@ -17,6 +15,9 @@ OMSK_TIMEZONE = timezone(timedelta(hours=6))
 # Пути к файлам
 PROJECT_ROOT = Path(__file__).parent
 DB_PATH = os.getenv('DB_PATH', PROJECT_ROOT / 'reminders.db')
+# Число файлов базы, по которым распределяются пользователи (1 - один файл).
+# Номер файла входит в id напоминаний, поэтому меняется только вместе с переносом данных
+DB_SHARDS = int(os.getenv('DB_SHARDS', '1'))
 LOG_FILE = os.getenv('LOG_FILE', PROJECT_ROOT / 'bot.log')
 
 # Настройки логирования
@@ -30,10 +31,132 @@ CHECK_INTERVAL_SECONDS = int(os.getenv('CHECK_INTERVAL_SECONDS', '60'))
 NOTIFICATION_RETRY_ATTEMPTS = int(os.getenv('NOTIFICATION_RETRY_ATTEMPTS', '3'))
 NOTIFICATION_RETRY_DELAY_SECONDS = int(os.getenv('NOTIFICATION_RETRY_DELAY_SECONDS', '5'))
 
+# Выборка наступивших напоминаний пакетами (ограничивает память после простоя)
+DUE_BATCH_SIZE = int(os.getenv('DUE_BATCH_SIZE', '200'))
+
+# Индекс ближайших напоминаний в памяти (колесо времени) вместо запросов к базе
+DUE_INDEX_ENABLED = os.getenv('DUE_INDEX_ENABLED', 'false').lower() == 'true'
+DUE_INDEX_HORIZON_HOURS = int(os.getenv('DUE_INDEX_HORIZON_HOURS', '3'))
+
+# Объединять наступившие одновременно напоминания одного пользователя в одно сообщение
+COALESCE_DELIVERY = os.getenv('COALESCE_DELIVERY', 'true').lower() == 'true'
+COALESCE_MAX_ITEMS = int(os.getenv('COALESCE_MAX_ITEMS', '10'))
+
+# Групповая фиксация: добавления напоминаний, пришедшие в пределах GROUP_COMMIT_DELAY_MS,
+# записываются одной транзакцией (не больше GROUP_COMMIT_MAX_BATCH за раз)
+GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'true').lower() == 'true'
+GROUP_COMMIT_DELAY_MS = int(os.getenv('GROUP_COMMIT_DELAY_MS', '5'))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv('GROUP_COMMIT_MAX_BATCH', '100'))
+
+# Импорт напоминаний из файлов .csv/.ics и выгрузка /export: максимум строк и размер файла
+# (Bot API отдает ботам файлы до 20 МБ), строк в одной транзакции импорта и в пакете выгрузки
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '100000'))
+IMPORT_MAX_FILE_MB = int(os.getenv('IMPORT_MAX_FILE_MB', '20'))
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+
+# Что делать с напоминаниями, опоздавшими больше чем на STALE_REMINDER_MINUTES (например, после простоя):
+# send - отправить как обычно, summary - одно сводное сообщение пользователю, drop - не отправлять
+STALE_REMINDER_POLICY = os.getenv('STALE_REMINDER_POLICY', 'send').lower()
+STALE_REMINDER_MINUTES = int(os.getenv('STALE_REMINDER_MINUTES', '60'))
+
+# Количество рабочих процессов для обработки обновлений (0 = все в одном процессе)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))
+
+# Защита от флуда: сообщений в минуту на пользователя, допустимая серия подряд,
+# общий лимит обновлений в секунду (0 - без лимита) и реакция: drop или warn
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_MESSAGES_PER_MINUTE = int(os.getenv('RATE_LIMIT_MESSAGES_PER_MINUTE', '30'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '5'))
+RATE_LIMIT_GLOBAL_PER_SECOND = int(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', '200'))
+RATE_LIMIT_MODE = os.getenv('RATE_LIMIT_MODE', 'warn')
+
+# Исходящие запросы: общий лимит в секунду, интервал между сообщениями в один чат
+# и полосы приоритета (ответы на кнопки > рассылка напоминаний > меню)
+OUTBOUND_LANES_ENABLED = os.getenv('OUTBOUND_LANES_ENABLED', 'true').lower() == 'true'
+OUTBOUND_RATE_PER_SECOND = float(os.getenv('OUTBOUND_RATE_PER_SECOND', '30'))
+OUTBOUND_PER_CHAT_INTERVAL = float(os.getenv('OUTBOUND_PER_CHAT_INTERVAL', '1.0'))
+# Доля общего лимита исходящих запросов для этого процесса (0 = по роли:
+# all - весь лимит, interactive и delivery - по половине)
+OUTBOUND_RATE_SHARE = float(os.getenv('OUTBOUND_RATE_SHARE', '0'))
+
+# Администраторы бота (ADMIN_USER_ID, несколько - через запятую)
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_ID', '').split(',') if user_id.strip()}
+
+# Объявления администратора (/broadcast): темп отправки (ниже общего лимита Telegram, чтобы
+# оставить место рассылке напоминаний), одновременных отправок и получателей в пакете
+# (после каждого пакета сохраняется контрольная точка)
+BROADCAST_RATE_PER_SECOND = float(os.getenv('BROADCAST_RATE_PER_SECOND', '20'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))
+
+# Результатов поиска /find на одной странице
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+
+# Настройки пользователей (язык, часовой пояс, тихие часы, блокировка) в памяти процесса:
+# сколько пользователей держать в кэше (давно не обращавшиеся вытесняются)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+
+# Хранение отправленных напоминаний
+DB_CLEANUP_DAYS = int(os.getenv('DB_CLEANUP_DAYS', '30'))
+RETENTION_INTERVAL_MINUTES = int(os.getenv('RETENTION_INTERVAL_MINUTES', '60'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv('RETENTION_BATCH_PAUSE_MS', '50'))
+
+# Обслуживание базы: PRAGMA optimize и checkpoint WAL каждые DB_MAINTENANCE_INTERVAL_MINUTES,
+# полный ANALYZE раз в DB_ANALYZE_INTERVAL_HOURS, возврат свободных страниц (incremental_vacuum)
+# порциями по DB_VACUUM_PAGES_PER_STEP только в тихие часы по Омску (например, 3-5)
+DB_MAINTENANCE_ENABLED = os.getenv('DB_MAINTENANCE_ENABLED', 'true').lower() == 'true'
+DB_MAINTENANCE_INTERVAL_MINUTES = int(os.getenv('DB_MAINTENANCE_INTERVAL_MINUTES', '60'))
+DB_ANALYZE_INTERVAL_HOURS = int(os.getenv('DB_ANALYZE_INTERVAL_HOURS', '24'))
+DB_MAINTENANCE_QUIET_HOURS = os.getenv('DB_MAINTENANCE_QUIET_HOURS', '3-5')
+DB_VACUUM_PAGES_PER_STEP = int(os.getenv('DB_VACUUM_PAGES_PER_STEP', '500'))
+DB_VACUUM_MAX_PAGES = int(os.getenv('DB_VACUUM_MAX_PAGES', '50000'))
+DB_VACUUM_STEP_PAUSE_MS = int(os.getenv('DB_VACUUM_STEP_PAUSE_MS', '50'))
+# Перевести существующий файл базы в режим auto_vacuum = INCREMENTAL при запуске
+# (однократный полный VACUUM: переписывает файл и блокирует запись на время работы)
+DB_AUTO_VACUUM_CONVERT = os.getenv('DB_AUTO_VACUUM_CONVERT', 'false').lower() == 'true'
+
+# Резервные копии базы через SQLite backup API (по шагам, не блокируя запись):
+# интервал, директория, сколько копий хранить, страниц за шаг и пауза между шагами
+DB_BACKUP_ENABLED = os.getenv('DB_BACKUP_ENABLED', 'false').lower() == 'true'
+DB_BACKUP_INTERVAL_HOURS = float(os.getenv('DB_BACKUP_INTERVAL_HOURS', '24'))
+DB_BACKUP_DIR = os.getenv('DB_BACKUP_DIR', PROJECT_ROOT / 'backups')
+DB_BACKUP_KEEP = int(os.getenv('DB_BACKUP_KEEP', '7'))
+DB_BACKUP_PAGES_PER_STEP = int(os.getenv('DB_BACKUP_PAGES_PER_STEP', '100'))
+DB_BACKUP_STEP_PAUSE_MS = int(os.getenv('DB_BACKUP_STEP_PAUSE_MS', '10'))
+# Создать копию сразу при запуске, не дожидаясь интервала
+CREATE_BACKUP = os.getenv('CREATE_BACKUP', 'false').lower() == 'true'
+
+# История отправленных напоминаний в месячных файлах SQLite (основная таблица хранит только ожидающие)
+HISTORY_ENABLED = os.getenv('HISTORY_ENABLED', 'false').lower() == 'true'
+HISTORY_DIR = os.getenv('HISTORY_DIR', '')
+
 # Настройки мониторинга
 HEALTH_CHECK_ENABLED = os.getenv('HEALTH_CHECK_ENABLED', 'true').lower() == 'true'
 HEALTH_CHECK_PORT = int(os.getenv('HEALTH_CHECK_PORT', '8080'))
 
+# Режим получения обновлений: polling (getUpdates) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+
+# Роль процесса: all (все в одном процессе), interactive (только обработка сообщений),
+# delivery (только рассылка напоминаний). interactive и delivery работают с одной базой
+BOT_ROLE = os.getenv('BOT_ROLE', 'all').lower()
+
+# Сокет для сигналов процессу рассылки о новых и удаленных напоминаниях
+DELIVERY_SIGNAL_HOST = os.getenv('DELIVERY_SIGNAL_HOST', '127.0.0.1')
+DELIVERY_SIGNAL_BIND_HOST = os.getenv('DELIVERY_SIGNAL_BIND_HOST', '127.0.0.1')
+DELIVERY_SIGNAL_PORT = int(os.getenv('DELIVERY_SIGNAL_PORT', '8765'))
+
+# Адрес Bot API (пусто = api.telegram.org, либо локальный Bot API сервер)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+
+# Настройки webhook
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
 # Сообщения бота
 MESSAGES = {
     'start': (
@@ -81,8 +204,36 @@ MESSAGES = {
 }
 
 
-def setup_logging():
-    """Настройка системы логирования"""
+_logging_configured = False
+
+
+def get_bot_token() -> str:
+    """
+    Получить токен бота
+    
+    Returns:
+        str: Токен бота
+        
+    Raises:
+        ValueError: Если токен не задан
+    """
+    if not BOT_TOKEN:
+        raise ValueError("BOT_TOKEN не найден в переменных окружения. Добавьте его в .env файл.")
+    return BOT_TOKEN
+
+
+def setup_logging(force: bool = False):
+    """
+    Настройка системы логирования (повторные вызовы ничего не делают)
+    
+    Args:
+        force: Перенастроить логирование, даже если оно уже настроено
+    """
+    global _logging_configured
+    if _logging_configured and not force:
+        return
+    _logging_configured = True
+    
     # Создаем директорию для логов если её нет
     log_dir = Path(LOG_FILE).parent
     log_dir.mkdir(exist_ok=True)
@@ -121,7 +272,3 @@ def setup_logging():
     # Настройка уровня для aiogram
     logging.getLogger('aiogram').setLevel(logging.WARNING)
     logging.getLogger('aiohttp').setLevel(logging.WARNING)
-
-
-# Инициализация логирования при импорте модуля
-setup_logging()
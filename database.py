@@ -2,57 +2,409 @@
 Обновленный модуль для работы с базой данных напоминаний (версия 2.0)
 Поддерживает множественные напоминания на пользователя
 """
+import heapq
+import re
 import sqlite3
 import logging
-from datetime import datetime
-from typing import Optional, List, Tuple
-from config import DB_PATH, OMSK_TIMEZONE
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Tuple, Iterator
+from config import (
+    DB_PATH,
+    DB_SHARDS,
+    DB_CLEANUP_DAYS,
+    DB_AUTO_VACUUM_CONVERT,
+    RETENTION_BATCH_SIZE,
+    DUE_BATCH_SIZE,
+    HISTORY_ENABLED,
+    HISTORY_DIR
+)
+from clock import get_clock
 
 logger = logging.getLogger(__name__)
 
+# Версия схемы: хранится в PRAGMA user_version, чтобы не повторять миграции при каждом запуске
+SCHEMA_VERSION = 7
+
+# PRAGMA auto_vacuum = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Счетчики сводной статистики (таблица stats_counters): читаются без подсчета строк
+STATS_COUNTERS = (
+    'pending', 'active_users', 'created_total', 'sent_total', 'deleted_total', 'failed_total', 'started_at'
+)
+
+# Настройки пользователя (таблица users), которые кэшируются в памяти (user_settings.py)
+USER_SETTINGS_FIELDS = ('language', 'timezone', 'quiet_start', 'quiet_end', 'is_blocked')
+
+# Слова поискового запроса /find (остальные символы синтаксиса FTS5 отбрасываются)
+SEARCH_WORD_PATTERN = re.compile(r'\w+')
+
+# Ключ часа в таблице stats_hourly (время Омска)
+STATS_HOUR_FORMAT = '%Y-%m-%dT%H'
+
+# Схема месячного файла истории отправленных напоминаний (только добавление)
+HISTORY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS history.reminders_history (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        reminder_time TEXT NOT NULL,
+        reminder_text TEXT,
+        created_at TEXT NOT NULL,
+        sent_at TEXT NOT NULL
+    )
+'''
+
 
 class ReminderDatabaseV2:
     """Класс для работы с базой данных напоминаний (версия 2.0)"""
     
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, history_enabled: bool = HISTORY_ENABLED, history_dir: str = HISTORY_DIR):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            history_enabled: Переносить отправленные напоминания в месячные файлы истории
+            history_dir: Директория файлов истории (по умолчанию history/ рядом с базой)
+        """
         self.db_path = db_path
+        self.history_enabled = history_enabled
+        self.history_dir = Path(history_dir) if history_dir else Path(db_path).parent / 'history'
         self.init_database()
+        if DB_AUTO_VACUUM_CONVERT:
+            self.enable_incremental_vacuum()
     
     def init_database(self):
-        """Инициализация базы данных с новой структурой"""
+        """Инициализация базы данных с новой структурой (идемпотентна)"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # Создаем новую таблицу с поддержкой множественных напоминаний
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS reminders_v2 (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        reminder_time TEXT NOT NULL,
-                        reminder_text TEXT,
-                        created_at TEXT NOT NULL,
-                        is_sent BOOLEAN DEFAULT FALSE,
-                        UNIQUE(user_id, reminder_time)
-                    )
-                ''')
+                # Схема уже актуальна - ничего не делаем
+                cursor.execute("PRAGMA user_version")
+                version = cursor.fetchone()[0]
+                if version >= SCHEMA_VERSION:
+                    logger.debug("База данных v2 уже инициализирована")
+                    return
+                
+                if version < 3:
+                    # Освобожденные страницы возвращаются по частям через incremental_vacuum.
+                    # Режим задается до создания таблиц; существующий файл переводится
+                    # только по DB_AUTO_VACUUM_CONVERT, так как для этого нужен полный VACUUM
+                    cursor.execute("PRAGMA auto_vacuum")
+                    if cursor.fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                        cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+                        if not cursor.fetchone()[0]:
+                            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                        elif not DB_AUTO_VACUUM_CONVERT:
+                            logger.info(
+                                "База не в режиме инкрементальной очистки: свободные страницы не возвращаются "
+                                "(перевод - DB_AUTO_VACUUM_CONVERT=true, однократный VACUUM)"
+                            )
                 
-                # Миграция данных из старой таблицы (если существует)
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reminders'")
-                if cursor.fetchone():
-                    logger.info("Найдена старая таблица, выполняем миграцию...")
+                if version < 1:
+                    self._create_schema_v1(cursor)
+                
+                if version < 2:
+                    # Индекс для выборки напоминаний по времени в порядке наступления
                     cursor.execute('''
-                        INSERT OR IGNORE INTO reminders_v2 (user_id, reminder_time, created_at, is_sent)
-                        SELECT user_id, reminder_time, created_at, is_sent FROM reminders
+                        CREATE INDEX IF NOT EXISTS idx_reminders_due
+                        ON reminders_v2 (is_sent, reminder_time)
                     ''')
-                    logger.info("Миграция данных завершена")
                 
+                if version < 4:
+                    self._create_broadcast_tables(cursor)
+                
+                if version < 5:
+                    self._create_stats_tables(cursor)
+                
+                if version < 6:
+                    self._create_users_table(cursor)
+                
+                if version < 7:
+                    self._create_search_index(cursor)
+                
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
                 conn.commit()
+                
+                # WAL: чтение (например, потоковая выборка) не блокирует запись
+                cursor.execute("PRAGMA journal_mode=WAL")
                 logger.info("База данных v2 инициализирована")
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
     
+    def _create_schema_v1(self, cursor: sqlite3.Cursor):
+        """Создание основной таблицы и миграция из таблицы версии 1.0"""
+        # Создаем новую таблицу с поддержкой множественных напоминаний
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reminders_v2 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                reminder_time TEXT NOT NULL,
+                reminder_text TEXT,
+                created_at TEXT NOT NULL,
+                is_sent BOOLEAN DEFAULT FALSE,
+                UNIQUE(user_id, reminder_time)
+            )
+        ''')
+        
+        # Миграция данных из старой таблицы (если существует)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reminders'")
+        if cursor.fetchone():
+            logger.info("Найдена старая таблица, выполняем миграцию...")
+            cursor.execute('''
+                INSERT OR IGNORE INTO reminders_v2 (user_id, reminder_time, created_at, is_sent)
+                SELECT user_id, reminder_time, created_at, is_sent FROM reminders
+            ''')
+            logger.info("Миграция данных завершена")
+    
+    def _create_broadcast_tables(self, cursor: sqlite3.Cursor):
+        """Рассылки администратора с контрольной точкой (отметки о блокировке - в таблице users)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                created_by INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                last_user_id INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                finished_at TEXT
+            )
+        ''')
+    
+    def _create_stats_tables(self, cursor: sqlite3.Cursor):
+        """Сводная статистика, которую поддерживают сами операции записи, и ее начальные значения"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_hourly (
+                hour TEXT PRIMARY KEY,
+                created INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                lag_sum REAL NOT NULL DEFAULT 0,
+                lag_max REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        # Активные напоминания каждого пользователя: по переходам 0 <-> 1 считаются активные пользователи
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_counters (
+                user_id INTEGER PRIMARY KEY,
+                pending INTEGER NOT NULL
+            )
+        ''')
+
+        # Начальные значения по уже накопленным данным (однократный подсчет при миграции)
+        cursor.execute('''
+            INSERT OR IGNORE INTO user_counters (user_id, pending)
+            SELECT user_id, COUNT(*) FROM reminders_v2 WHERE is_sent = FALSE GROUP BY user_id
+        ''')
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(pending), 0) FROM user_counters")
+        active_users, pending = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(is_sent = TRUE), 0) FROM reminders_v2")
+        created_total, sent_total = cursor.fetchone()
+        # Отправленные напоминания, уже перенесенные в файлы истории
+        archived = self._count_history_reminders()
+        created_total += archived
+        sent_total += archived
+        initial = {
+            'pending': pending,
+            'active_users': active_users,
+            'created_total': created_total,
+            'sent_total': sent_total
+        }
+        cursor.executemany(
+            "INSERT OR IGNORE INTO stats_counters (name, value) VALUES (?, ?)",
+            [(name, initial.get(name, 0)) for name in STATS_COUNTERS]
+        )
+
+    def _create_users_table(self, cursor: sqlite3.Cursor):
+        """Пользователи с настройками; отметки о блокировке переносятся из blocked_users"""
+        # Пустые настройки - значения бота по умолчанию (язык Telegram, время Омска, без тихих часов)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                language TEXT,
+                timezone TEXT,
+                quiet_start INTEGER,
+                quiet_end INTEGER,
+                is_blocked INTEGER NOT NULL DEFAULT 0,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO users (user_id, first_seen, last_seen)
+            SELECT user_id, MIN(created_at), MAX(created_at) FROM reminders_v2 GROUP BY user_id
+        ''')
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blocked_users'")
+        if cursor.fetchone():
+            cursor.execute('''
+                INSERT INTO users (user_id, is_blocked, first_seen, last_seen)
+                SELECT user_id, 1, blocked_at, blocked_at FROM blocked_users WHERE true
+                ON CONFLICT(user_id) DO UPDATE SET is_blocked = 1
+            ''')
+            cursor.execute("DROP TABLE blocked_users")
+
+    def _create_search_index(self, cursor: sqlite3.Cursor):
+        """
+        Полнотекстовый индекс FTS5 по текстам активных напоминаний (/find)
+        
+        Таблица без собственного содержимого (content=''): тексты не дублируются, результаты
+        читаются из reminders_v2 по rowid = id. Владелец - отдельная колонка с токеном
+        u<user_id>, поиск ограничивается пользователем внутри индекса. Индекс ведут
+        триггеры, отправленные напоминания из него удаляются.
+        """
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reminders_fts USING fts5(
+                reminder_text, owner, content='', tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS reminders_fts_insert AFTER INSERT ON reminders_v2
+            WHEN NEW.reminder_text IS NOT NULL AND NOT NEW.is_sent BEGIN
+                INSERT INTO reminders_fts (rowid, reminder_text, owner)
+                VALUES (NEW.id, NEW.reminder_text, 'u' || NEW.user_id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS reminders_fts_delete AFTER DELETE ON reminders_v2
+            WHEN OLD.reminder_text IS NOT NULL AND NOT OLD.is_sent BEGIN
+                INSERT INTO reminders_fts (reminders_fts, rowid, reminder_text, owner)
+                VALUES ('delete', OLD.id, OLD.reminder_text, 'u' || OLD.user_id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS reminders_fts_update
+            AFTER UPDATE OF reminder_text, is_sent, user_id ON reminders_v2 BEGIN
+                INSERT INTO reminders_fts (reminders_fts, rowid, reminder_text, owner)
+                SELECT 'delete', OLD.id, OLD.reminder_text, 'u' || OLD.user_id
+                WHERE OLD.reminder_text IS NOT NULL AND NOT OLD.is_sent;
+                INSERT INTO reminders_fts (rowid, reminder_text, owner)
+                SELECT NEW.id, NEW.reminder_text, 'u' || NEW.user_id
+                WHERE NEW.reminder_text IS NOT NULL AND NOT NEW.is_sent;
+            END
+        ''')
+        cursor.execute('''
+            INSERT INTO reminders_fts (rowid, reminder_text, owner)
+            SELECT id, reminder_text, 'u' || user_id FROM reminders_v2
+            WHERE reminder_text IS NOT NULL AND NOT is_sent
+        ''')
+
+    def _ensure_users(self, cursor: sqlite3.Cursor, user_ids):
+        """Добавить в users владельцев новых напоминаний (в транзакции добавления)"""
+        now = get_clock().now().isoformat()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO users (user_id, first_seen, last_seen) VALUES (?, ?, ?)",
+            [(user_id, now, now) for user_id in user_ids]
+        )
+
+    def _update_stats(
+        self,
+        cursor: sqlite3.Cursor,
+        user_deltas: Optional[dict] = None,
+        created: int = 0,
+        sent: int = 0,
+        deleted: int = 0,
+        failed: int = 0,
+        lags: List[float] = ()
+    ):
+        """
+        Обновить сводную статистику в транзакции операции записи
+
+        Args:
+            cursor: Курсор открытой транзакции
+            user_deltas: user_id -> изменение количества активных напоминаний
+            created: Создано напоминаний
+            sent: Доставлено напоминаний
+            deleted: Удалено пользователями
+            failed: Ошибок доставки
+            lags: Задержки доставки в секундах (от reminder_time)
+        """
+        deltas = {
+            'created_total': created,
+            'sent_total': sent,
+            'deleted_total': deleted,
+            'failed_total': failed,
+            'pending': 0,
+            'active_users': 0
+        }
+
+        for user_id, delta in (user_deltas or {}).items():
+            if not delta:
+                continue
+            cursor.execute("SELECT pending FROM user_counters WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            old = row[0] if row else 0
+            new = max(0, old + delta)
+            if new:
+                cursor.execute('''
+                    INSERT INTO user_counters (user_id, pending) VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET pending = excluded.pending
+                ''', (user_id, new))
+            else:
+                cursor.execute("DELETE FROM user_counters WHERE user_id = ?", (user_id,))
+            deltas['pending'] += new - old
+            deltas['active_users'] += (new > 0) - (old > 0)
+
+        cursor.executemany(
+            "UPDATE stats_counters SET value = value + ? WHERE name = ?",
+            [(delta, name) for name, delta in deltas.items() if delta]
+        )
+
+        if created or sent or deleted or failed:
+            cursor.execute('''
+                INSERT INTO stats_hourly (hour, created, sent, deleted, failed, lag_sum, lag_max)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hour) DO UPDATE SET
+                    created = created + excluded.created,
+                    sent = sent + excluded.sent,
+                    deleted = deleted + excluded.deleted,
+                    failed = failed + excluded.failed,
+                    lag_sum = lag_sum + excluded.lag_sum,
+                    lag_max = MAX(lag_max, excluded.lag_max)
+            ''', (
+                get_clock().now().strftime(STATS_HOUR_FORMAT),
+                created, sent, deleted, failed, sum(lags), max(lags, default=0)
+            ))
+
+    def _record_removed(self, cursor: sqlite3.Cursor, rows: List[tuple], delivered: bool = True):
+        """
+        Учесть в статистике напоминания, которые перестали быть активными после отправки
+
+        Args:
+            cursor: Курсор открытой транзакции
+            rows: Строки (user_id, reminder_time, is_sent) до изменения
+            delivered: True - доставлены, False - пропущены как устаревшие (без задержки и отправки)
+        """
+        now = get_clock().now()
+        user_deltas = {}
+        lags = []
+        for user_id, reminder_time, is_sent in rows:
+            if is_sent:
+                continue
+            user_deltas[user_id] = user_deltas.get(user_id, 0) - 1
+            if delivered:
+                lags.append(max(0.0, (now - datetime.fromisoformat(reminder_time)).total_seconds()))
+        self._update_stats(cursor, user_deltas, sent=len(lags), lags=lags)
+
+    def _replaced_pending(self, cursor: sqlite3.Cursor, user_id: int, reminder_time: datetime) -> bool:
+        """Есть ли у пользователя активное напоминание на это время (INSERT OR REPLACE его заменит)"""
+        cursor.execute(
+            "SELECT 1 FROM reminders_v2 WHERE user_id = ? AND reminder_time = ? AND is_sent = FALSE",
+            (user_id, reminder_time.isoformat())
+        )
+        return cursor.fetchone() is not None
+
     def add_reminder(self, user_id: int, reminder_time: datetime, reminder_text: str = None) -> bool:
         """
         Добавить напоминание для пользователя
@@ -68,6 +420,11 @@ class ReminderDatabaseV2:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                # При замене (REPLACE) срабатывает триггер удаления: старый текст уходит из поиска
+                cursor.execute("PRAGMA recursive_triggers = ON")
+                # Проверка замены, добавление и статистика - одна транзакция записи
+                cursor.execute("BEGIN IMMEDIATE")
+                replaced = self._replaced_pending(cursor, user_id, reminder_time)
                 
                 # Добавляем новое напоминание (или заменяем существующее на то же время)
                 cursor.execute('''
@@ -77,8 +434,10 @@ class ReminderDatabaseV2:
                     user_id,
                     reminder_time.isoformat(),
                     reminder_text,
-                    datetime.now(OMSK_TIMEZONE).isoformat()
+                    get_clock().now().isoformat()
                 ))
+                self._update_stats(cursor, {user_id: 0 if replaced else 1}, created=1)
+                self._ensure_users(cursor, (user_id,))
                 
                 conn.commit()
                 logger.info(f"Добавлено напоминание для пользователя {user_id} на {reminder_time}")
@@ -88,6 +447,101 @@ class ReminderDatabaseV2:
             logger.error(f"Ошибка добавления напоминания: {e}")
             return False
     
+    def add_reminders(self, reminders: List[Tuple[int, datetime, Optional[str]]]) -> Optional[List[Tuple[int, int]]]:
+        """
+        Добавить несколько напоминаний одной транзакцией (групповая фиксация)
+        
+        Args:
+            reminders: Список (user_id, reminder_time, reminder_text)
+            
+        Returns:
+            Optional[List[Tuple[int, int]]]: Для каждого напоминания (id, количество активных
+                напоминаний пользователя после добавления) или None при ошибке
+        """
+        if not reminders:
+            return []
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                created_at = get_clock().now().isoformat()
+                
+                # Замены (REPLACE) вызывают триггер удаления поискового индекса
+                cursor.execute("PRAGMA recursive_triggers = ON")
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                reminder_ids = []
+                user_deltas = {}
+                for user_id, reminder_time, reminder_text in reminders:
+                    if not self._replaced_pending(cursor, user_id, reminder_time):
+                        user_deltas[user_id] = user_deltas.get(user_id, 0) + 1
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO reminders_v2 (user_id, reminder_time, reminder_text, created_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', (user_id, reminder_time.isoformat(), reminder_text, created_at))
+                    reminder_ids.append(cursor.lastrowid)
+                self._update_stats(cursor, user_deltas, created=len(reminders))
+                self._ensure_users(cursor, {user_id for user_id, _, _ in reminders})
+                
+                # Счетчики читаются в той же транзакции - без отдельного соединения на каждого пользователя
+                # и без подсчета строк (у пользователей с большой историей это заметно)
+                user_ids = sorted({user_id for user_id, _, _ in reminders})
+                placeholders = ', '.join('?' * len(user_ids))
+                cursor.execute(
+                    f"SELECT user_id, pending FROM user_counters WHERE user_id IN ({placeholders})",
+                    user_ids
+                )
+                counts = dict(cursor.fetchall())
+                
+                conn.commit()
+                logger.info(f"Добавлено напоминаний одной транзакцией: {len(reminders)}")
+                return [
+                    (reminder_id, counts.get(user_id, 0))
+                    for reminder_id, (user_id, _, _) in zip(reminder_ids, reminders)
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка группового добавления напоминаний: {e}")
+            return None
+
+    def import_reminders(self, user_id: int, reminders: List[Tuple[datetime, Optional[str]]]) -> Optional[int]:
+        """
+        Добавить пакет напоминаний пользователя одной транзакцией (импорт из файла)
+
+        Напоминания на время, которое у пользователя уже занято, пропускаются:
+        повторный импорт того же файла ничего не меняет.
+
+        Args:
+            user_id: ID пользователя Telegram
+            reminders: Список (reminder_time, reminder_text)
+
+        Returns:
+            Optional[int]: Количество добавленных напоминаний или None при ошибке
+        """
+        if not reminders:
+            return 0
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                created_at = get_clock().now().isoformat()
+                cursor = conn.executemany('''
+                    INSERT OR IGNORE INTO reminders_v2 (user_id, reminder_time, reminder_text, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (
+                    (user_id, reminder_time.isoformat(), reminder_text, created_at)
+                    for reminder_time, reminder_text in reminders
+                ))
+                added = cursor.rowcount
+                cursor = conn.cursor()
+                self._update_stats(cursor, {user_id: added}, created=added)
+                self._ensure_users(cursor, (user_id,))
+                conn.commit()
+                return added
+
+        except Exception as e:
+            logger.error(f"Ошибка импорта напоминаний пользователя {user_id}: {e}")
+            return None
+
     def get_user_reminders(self, user_id: int) -> List[Tuple[int, datetime, str]]:
         """
         Получить все активные напоминания пользователя
@@ -119,36 +573,250 @@ class ReminderDatabaseV2:
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний пользователя: {e}")
             return []
+
+    def iter_user_reminders(self, user_id: int, batch_size: int = DUE_BATCH_SIZE) -> Iterator[List[Tuple[int, datetime, str]]]:
+        """
+        Потоковая выборка активных напоминаний пользователя (для выгрузки)
+
+        Args:
+            user_id: ID пользователя
+            batch_size: Размер пакета
+
+        Yields:
+            List[Tuple[int, datetime, str]]: Пакет (id, reminder_time, reminder_text) в порядке времени
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, reminder_time, reminder_text
+                FROM reminders_v2
+                WHERE user_id = ? AND is_sent = FALSE
+                ORDER BY reminder_time
+            ''', (user_id,))
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [
+                    (reminder_id, datetime.fromisoformat(reminder_time_str), reminder_text or "")
+                    for reminder_id, reminder_time_str, reminder_text in rows
+                ]
+        finally:
+            conn.close()
+
+    def search_reminders(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 10,
+        offset: int = 0
+    ) -> List[Tuple[int, datetime, str]]:
+        """
+        Найти активные напоминания пользователя по словам текста (полнотекстовый индекс)
+        
+        Каждое слово запроса ищется как начало слова текста ("молок" находит "молоко"),
+        в результате - напоминания со всеми словами, самые подходящие первыми (bm25).
+        
+        Args:
+            user_id: ID пользователя
+            query: Текст запроса
+            limit: Размер страницы
+            offset: Сколько результатов пропустить
+            
+        Returns:
+            List[Tuple[int, datetime, str]]: Список (id, reminder_time, reminder_text)
+        """
+        words = SEARCH_WORD_PATTERN.findall(query)
+        if not words:
+            return []
+        
+        # Слова берутся в кавычки: операторы FTS5 (AND, NEAR, *, :) из запроса не выполняются
+        match = f'owner:"u{user_id}" AND ' + ' AND '.join(f'reminder_text:"{word}"*' for word in words)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute('''
+                    SELECT r.id, r.reminder_time, r.reminder_text
+                    FROM reminders_fts
+                    JOIN reminders_v2 r ON r.id = reminders_fts.rowid
+                    WHERE reminders_fts MATCH ? AND r.user_id = ? AND r.is_sent = FALSE
+                    ORDER BY bm25(reminders_fts, 1.0, 0.0), r.reminder_time
+                    LIMIT ? OFFSET ?
+                ''', (match, user_id, limit, offset)).fetchall()
+                return [
+                    (reminder_id, datetime.fromisoformat(reminder_time), reminder_text)
+                    for reminder_id, reminder_time, reminder_text in rows
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка поиска напоминаний пользователя {user_id}: {e}")
+            return []
     
     def get_due_reminders(self) -> List[Tuple[int, int, datetime, str]]:
         """
         Получить напоминания, которые нужно отправить
         
+        Для больших объемов используйте iter_due_reminders.
+        
         Returns:
             List[Tuple[int, int, datetime, str]]: Список (id, user_id, reminder_time, reminder_text)
         """
         try:
-            current_time = datetime.now(OMSK_TIMEZONE)
+            return [reminder for batch in self.iter_due_reminders() for reminder in batch]
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения напоминаний: {e}")
+            return []
+    
+    def iter_due_reminders(
+        self,
+        batch_size: int = DUE_BATCH_SIZE,
+        current_time: Optional[datetime] = None,
+        group_by_user: bool = False
+    ) -> Iterator[List[Tuple[int, int, datetime, str]]]:
+        """
+        Потоковая выборка наступивших напоминаний пакетами в порядке времени
+        
+        Курсор читается через fetchmany, поэтому после долгого простоя в памяти
+        находится не больше batch_size строк. В режиме WAL открытый курсор
+        не мешает отмечать напоминания отправленными из других соединений.
+        
+        Args:
+            batch_size: Размер пакета
+            current_time: Текущее время (по умолчанию - get_clock().now())
+            group_by_user: Выдавать напоминания одного пользователя подряд в пределах пакета
+                (выборка по-прежнему идет по времени без сортировки всех опоздавших строк)
+            
+        Yields:
+            List[Tuple[int, int, datetime, str]]: Пакет (id, user_id, reminder_time, reminder_text)
+        """
+        current_time = current_time or get_clock().now()
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, reminder_time, reminder_text
+                FROM reminders_v2
+                WHERE is_sent = FALSE AND reminder_time <= ?
+                ORDER BY reminder_time, id
+            ''', (current_time.isoformat(),))
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                batch = [
+                    (reminder_id, user_id, datetime.fromisoformat(reminder_time_str), reminder_text or "")
+                    for reminder_id, user_id, reminder_time_str, reminder_text in rows
+                ]
+                yield _group_by_user(batch) if group_by_user else batch
+        finally:
+            conn.close()
+    
+    def iter_pending_ids(
+        self,
+        start_time: Optional[datetime],
+        end_time: datetime,
+        batch_size: int = DUE_BATCH_SIZE
+    ) -> Iterator[List[Tuple[int, datetime]]]:
+        """
+        Потоковая выборка id ожидающих напоминаний за интервал времени
+        
+        Args:
+            start_time: Начало интервала включительно (None - все опоздавшие)
+            end_time: Конец интервала (не включая)
+            batch_size: Размер пакета
+            
+        Yields:
+            List[Tuple[int, datetime]]: Пакет (id, reminder_time)
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, reminder_time
+                FROM reminders_v2
+                WHERE is_sent = FALSE AND reminder_time >= ? AND reminder_time < ?
+                ORDER BY reminder_time, id
+            ''', (start_time.isoformat() if start_time else '', end_time.isoformat()))
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [
+                    (reminder_id, datetime.fromisoformat(reminder_time_str))
+                    for reminder_id, reminder_time_str in rows
+                ]
+        finally:
+            conn.close()
+    
+    def iter_reminders_by_ids(
+        self,
+        reminder_ids,
+        batch_size: int = DUE_BATCH_SIZE,
+        group_by_user: bool = False
+    ) -> Iterator[List[Tuple[int, int, datetime, str]]]:
+        """
+        Выборка неотправленных напоминаний по списку id пакетами
+        
+        Удаленные и уже отправленные напоминания пропускаются.
+        
+        Args:
+            reminder_ids: id напоминаний (например, array('q') из индекса)
+            batch_size: Размер пакета
+            group_by_user: Собрать напоминания пользователя в пакете подряд (по времени)
             
+        Yields:
+            List[Tuple[int, int, datetime, str]]: Пакет (id, user_id, reminder_time, reminder_text)
+        """
+        for start in range(0, len(reminder_ids), batch_size):
+            chunk = list(reminder_ids[start:start + batch_size])
+            placeholders = ','.join('?' * len(chunk))
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(f'''
+                        SELECT id, user_id, reminder_time, reminder_text
+                        FROM reminders_v2
+                        WHERE is_sent = FALSE AND id IN ({placeholders})
+                        ORDER BY reminder_time, id
+                    ''', chunk)
+                    rows = cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Ошибка получения напоминаний по id: {e}")
+                continue
+            
+            if rows:
+                batch = [
+                    (reminder_id, user_id, datetime.fromisoformat(reminder_time_str), reminder_text or "")
+                    for reminder_id, user_id, reminder_time_str, reminder_text in rows
+                ]
+                yield _group_by_user(batch) if group_by_user else batch
+    
+    def get_next_reminder_time(self) -> Optional[datetime]:
+        """
+        Получить время ближайшего неотправленного напоминания
+        
+        Returns:
+            Optional[datetime]: Время ближайшего напоминания или None, если их нет
+        """
+        try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT id, user_id, reminder_time, reminder_text
-                    FROM reminders_v2
-                    WHERE is_sent = FALSE AND reminder_time <= ?
-                ''', (current_time.isoformat(),))
-                
-                results = []
-                for row in cursor.fetchall():
-                    reminder_id, user_id, reminder_time_str, reminder_text = row
-                    reminder_time = datetime.fromisoformat(reminder_time_str)
-                    results.append((reminder_id, user_id, reminder_time, reminder_text or ""))
+                    SELECT MIN(reminder_time) FROM reminders_v2
+                    WHERE is_sent = FALSE
+                ''')
                 
-                return results
+                row = cursor.fetchone()
+                return datetime.fromisoformat(row[0]) if row and row[0] else None
                 
         except Exception as e:
-            logger.error(f"Ошибка получения напоминаний: {e}")
-            return []
+            logger.error(f"Ошибка получения ближайшего напоминания: {e}")
+            return None
     
     def mark_reminder_sent(self, reminder_id: int) -> bool:
         """
@@ -162,13 +830,19 @@ class ReminderDatabaseV2:
         """
         try:
             with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE reminders_v2 
-                    SET is_sent = TRUE 
-                    WHERE id = ?
-                ''', (reminder_id,))
-                conn.commit()
+                if self.history_enabled:
+                    # Отправленное напоминание уходит из основной таблицы в файл истории
+                    self._move_to_history(conn, 'id = ?', (reminder_id,))
+                else:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        UPDATE reminders_v2 
+                        SET is_sent = TRUE 
+                        WHERE id = ? AND is_sent = FALSE
+                        RETURNING user_id, reminder_time, FALSE
+                    ''', (reminder_id,))
+                    self._record_removed(cursor, cursor.fetchall())
+                    conn.commit()
                 
                 logger.info(f"Напоминание {reminder_id} отмечено как отправленное")
                 return True
@@ -177,6 +851,43 @@ class ReminderDatabaseV2:
             logger.error(f"Ошибка обновления напоминания: {e}")
             return False
     
+    def mark_reminders_sent(self, reminder_ids: List[int], delivered: bool = True) -> int:
+        """
+        Отметить несколько напоминаний отправленными в одной транзакции
+        
+        Args:
+            reminder_ids: ID напоминаний
+            delivered: False - напоминания пропущены (устарели), в статистику доставки не идут
+            
+        Returns:
+            int: Количество обновленных напоминаний
+        """
+        if not reminder_ids:
+            return 0
+        
+        placeholders = ', '.join('?' * len(reminder_ids))
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                if self.history_enabled:
+                    return self._move_to_history(
+                        conn, f"id IN ({placeholders})", tuple(reminder_ids), delivered=delivered
+                    )
+                
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    UPDATE reminders_v2 SET is_sent = TRUE
+                    WHERE id IN ({placeholders}) AND is_sent = FALSE
+                    RETURNING user_id, reminder_time, FALSE
+                ''', tuple(reminder_ids))
+                rows = cursor.fetchall()
+                self._record_removed(cursor, rows, delivered)
+                conn.commit()
+                return len(rows)
+                
+        except Exception as e:
+            logger.error(f"Ошибка обновления напоминаний: {e}")
+            return 0
+    
     def delete_reminder(self, reminder_id: int, user_id: int) -> bool:
         """
         Удалить конкретное напоминание пользователя
@@ -194,9 +905,14 @@ class ReminderDatabaseV2:
                 cursor.execute('''
                     DELETE FROM reminders_v2 
                     WHERE id = ? AND user_id = ?
+                    RETURNING is_sent
                 ''', (reminder_id, user_id))
+                rows = cursor.fetchall()
                 
-                deleted_count = cursor.rowcount
+                deleted_count = len(rows)
+                if deleted_count:
+                    pending = sum(not is_sent for is_sent, in rows)
+                    self._update_stats(cursor, {user_id: -pending}, deleted=deleted_count)
                 conn.commit()
                 
                 if deleted_count > 0:
@@ -210,6 +926,142 @@ class ReminderDatabaseV2:
             logger.error(f"Ошибка удаления напоминания: {e}")
             return False
     
+    def delete_reminders(
+        self,
+        user_id: int,
+        reminder_ids: Optional[List[int]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> int:
+        """
+        Удалить несколько активных напоминаний пользователя одним запросом
+        
+        Без reminder_ids и границ времени удаляются все активные напоминания.
+        
+        Args:
+            user_id: ID пользователя (для безопасности)
+            reminder_ids: Удалить только эти напоминания
+            start_time: Удалить напоминания со временем не раньше этой границы
+            end_time: Удалить напоминания со временем раньше этой границы
+            
+        Returns:
+            int: Количество удаленных напоминаний
+        """
+        if reminder_ids is not None and not reminder_ids:
+            return 0
+        
+        conditions = ["user_id = ?", "is_sent = FALSE"]
+        params = [user_id]
+        if reminder_ids is not None:
+            conditions.append(f"id IN ({', '.join('?' * len(reminder_ids))})")
+            params.extend(reminder_ids)
+        if start_time is not None:
+            conditions.append("reminder_time >= ?")
+            params.append(start_time.isoformat())
+        if end_time is not None:
+            conditions.append("reminder_time < ?")
+            params.append(end_time.isoformat())
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"DELETE FROM reminders_v2 WHERE {' AND '.join(conditions)}", params)
+                deleted_count = cursor.rowcount
+                if deleted_count:
+                    self._update_stats(cursor, {user_id: -deleted_count}, deleted=deleted_count)
+                conn.commit()
+                
+                logger.info(f"Удалено напоминаний пользователя {user_id}: {deleted_count}")
+                return deleted_count
+                
+        except Exception as e:
+            logger.error(f"Ошибка удаления напоминаний: {e}")
+            return 0
+    
+    def snooze_reminder(
+        self,
+        reminder_id: int,
+        user_id: int,
+        new_time: datetime,
+        reminder_time: Optional[datetime] = None
+    ) -> bool:
+        """
+        Отложить отправленное напоминание: та же строка снова ожидает отправки в new_time
+
+        При включенной истории отправленная строка уже перенесена в месячный файл -
+        она возвращается оттуда с прежним id (файл находится по reminder_time).
+
+        Args:
+            reminder_id: ID напоминания
+            user_id: ID пользователя (для безопасности)
+            new_time: Новое время напоминания
+            reminder_time: Исходное время напоминания (для поиска в истории)
+
+        Returns:
+            bool: True если напоминание отложено (False - не найдено, уже отложено
+                или на это время у пользователя есть другое напоминание)
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE reminders_v2 SET reminder_time = ?, is_sent = FALSE
+                    WHERE id = ? AND user_id = ? AND is_sent = TRUE
+                ''', (new_time.isoformat(), reminder_id, user_id))
+                snoozed = cursor.rowcount > 0
+                if snoozed:
+                    self._update_stats(cursor, {user_id: 1})
+                conn.commit()
+
+                if not snoozed and self.history_enabled and reminder_time is not None:
+                    snoozed = self._restore_from_history(conn, reminder_id, user_id, new_time, reminder_time)
+
+                if snoozed:
+                    logger.info(f"Напоминание {reminder_id} пользователя {user_id} отложено на {new_time.isoformat()}")
+                else:
+                    logger.warning(f"Напоминание {reminder_id} пользователя {user_id} не отложено")
+                return snoozed
+
+        except sqlite3.IntegrityError:
+            logger.warning(f"У пользователя {user_id} уже есть напоминание на {new_time.isoformat()}")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка переноса напоминания: {e}")
+            return False
+
+    def _restore_from_history(
+        self,
+        conn: sqlite3.Connection,
+        reminder_id: int,
+        user_id: int,
+        new_time: datetime,
+        reminder_time: datetime
+    ) -> bool:
+        """Вернуть напоминание из месячного файла истории в основную таблицу с новым временем"""
+        path = self._history_path(reminder_time.strftime('%Y-%m'))
+        if not path.exists():
+            return False
+
+        cursor = conn.cursor()
+        cursor.execute("ATTACH DATABASE ? AS history", (str(path),))
+        try:
+            cursor.execute('''
+                INSERT INTO reminders_v2 (id, user_id, reminder_time, reminder_text, created_at, is_sent)
+                SELECT id, user_id, ?, reminder_text, created_at, FALSE
+                FROM history.reminders_history WHERE id = ? AND user_id = ?
+            ''', (new_time.isoformat(), reminder_id, user_id))
+            restored = cursor.rowcount > 0
+            if restored:
+                cursor.execute("DELETE FROM history.reminders_history WHERE id = ?", (reminder_id,))
+                self._update_stats(cursor, {user_id: 1})
+            conn.commit()
+            return restored
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE history")
+
     def get_reminders_count(self, user_id: int) -> int:
         """
         Получить количество активных напоминаний пользователя
@@ -223,45 +1075,1034 @@ class ReminderDatabaseV2:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT COUNT(*) FROM reminders_v2
-                    WHERE user_id = ? AND is_sent = FALSE
-                ''', (user_id,))
-                
-                return cursor.fetchone()[0]
+                # Счетчик ведут операции записи (см. _update_stats)
+                cursor.execute("SELECT pending FROM user_counters WHERE user_id = ?", (user_id,))
+                row = cursor.fetchone()
+                return row[0] if row else 0
                 
         except Exception as e:
             logger.error(f"Ошибка подсчета напоминаний: {e}")
             return 0
     
-    def cleanup_old_reminders(self, days_old: int = 7):
+    def get_file_paths(self) -> List[str]:
+        """Файлы базы (для резервного копирования и обслуживания)"""
+        return [str(self.db_path)]
+    
+    def get_file_databases(self) -> List['ReminderDatabaseV2']:
+        """Базы отдельных файлов (для обслуживания)"""
+        return [self]
+    
+    def get_storage_info(self) -> dict:
+        """
+        Размер файла базы и состояние страниц
+        
+        Returns:
+            dict: {'size_bytes', 'wal_bytes', 'page_size', 'page_count', 'freelist_pages', 'auto_vacuum'}
+        """
+        wal_path = Path(f"{self.db_path}-wal")
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+            page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+            freelist_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        
+        return {
+            'size_bytes': Path(self.db_path).stat().st_size,
+            'wal_bytes': wal_path.stat().st_size if wal_path.exists() else 0,
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_pages': freelist_pages,
+            'auto_vacuum': auto_vacuum
+        }
+    
+    def optimize(self, analyze: bool = False):
         """
-        Очистка старых отправленных напоминаний
+        Обновить статистику планировщика запросов
         
         Args:
-            days_old: Количество дней для хранения старых напоминаний
+            analyze: Полный ANALYZE по всем таблицам (иначе только PRAGMA optimize,
+                который пересчитывает статистику, когда она заметно устарела)
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            if analyze:
+                conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Перевести файл в режим auto_vacuum = INCREMENTAL (полный VACUUM, если режим другой)
+        
+        Returns:
+            bool: True, если база в инкрементальном режиме
         """
         try:
-            cutoff_time = datetime.now(OMSK_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
-            cutoff_time = cutoff_time.replace(day=cutoff_time.day - days_old)
-            
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    DELETE FROM reminders_v2
-                    WHERE is_sent = TRUE AND created_at < ?
-                ''', (cutoff_time.isoformat(),))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                if deleted_count > 0:
-                    logger.info(f"Удалено {deleted_count} старых напоминаний")
-                    
+                cursor.execute("PRAGMA auto_vacuum")
+                if cursor.fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                    return True
+                logger.info(f"Перевод базы {self.db_path} в режим инкрементальной очистки (однократный VACUUM)...")
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+                cursor.execute("PRAGMA auto_vacuum")
+                return cursor.fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+        except Exception as e:
+            logger.error(f"Ошибка перевода базы в режим инкрементальной очистки: {e}")
+            return False
+    
+    def incremental_vacuum(self, pages: int) -> int:
+        """
+        Вернуть файловой системе до pages свободных страниц (короткая транзакция)
+        
+        Args:
+            pages: Максимум страниц за вызов
+            
+        Returns:
+            int: Количество освобожденных страниц
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                return 0
+            # execute() делает один шаг (одна страница), executescript выполняет прагму до конца
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return before - cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    
+    def checkpoint(self, mode: str = 'PASSIVE') -> Tuple[int, int, int]:
+        """
+        Перенести страницы из WAL в основной файл
+        
+        Args:
+            mode: PASSIVE (не ждет читателей и писателей) или TRUNCATE (еще и обрезает WAL)
+            
+        Returns:
+            Tuple[int, int, int]: (занято - 1/0, страниц в WAL, перенесено страниц)
+        """
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f"Неизвестный режим checkpoint: {mode}")
+        
+        with sqlite3.connect(self.db_path) as conn:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+    
+    def get_retention_cutoff(self, days_old: int = DB_CLEANUP_DAYS) -> datetime:
+        """
+        Граница хранения отправленных напоминаний
+        
+        Args:
+            days_old: Количество дней хранения
+            
+        Returns:
+            datetime: Полночь (по Омску) days_old дней назад
+        """
+        today = get_clock().now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=days_old)
+    
+    def get_id_range(self) -> Optional[Tuple[int, int]]:
+        """
+        Получить диапазон id (rowid) таблицы напоминаний
+        
+        Returns:
+            Optional[Tuple[int, int]]: (минимальный id, максимальный id) или None для пустой таблицы
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT MIN(id), MAX(id) FROM reminders_v2')
+                min_id, max_id = cursor.fetchone()
+                return (min_id, max_id) if min_id is not None else None
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения диапазона id: {e}")
+            return None
+    
+    def delete_sent_reminders_in_range(self, start_id: int, end_id: int, cutoff_time: datetime) -> int:
+        """
+        Удалить отправленные напоминания старше cutoff_time в диапазоне id [start_id, end_id)
+        
+        Каждый вызов - отдельная короткая транзакция по диапазону rowid,
+        чтобы не блокировать запись надолго.
+        
+        Args:
+            start_id: Начало диапазона id (включительно)
+            end_id: Конец диапазона id (не включительно)
+            cutoff_time: Удаляются напоминания со временем раньше этой границы
+            
+        Returns:
+            int: Количество удаленных напоминаний
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM reminders_v2
+                    WHERE id >= ? AND id < ? AND is_sent = TRUE AND reminder_time < ?
+                ''', (start_id, end_id, cutoff_time.isoformat()))
+                
+                deleted_count = cursor.rowcount
+                conn.commit()
+                return deleted_count
+                
         except Exception as e:
-            logger.error(f"Ошибка очистки старых напоминаний: {e}")
+            logger.error(f"Ошибка удаления старых напоминаний: {e}")
+            return 0
+    
+    def cleanup_old_reminders(self, days_old: int = DB_CLEANUP_DAYS, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        """
+        Очистка старых отправленных напоминаний (синхронно, пакетами по batch_size id)
+        
+        Для фоновой очистки используйте maintenance.RetentionJob, который делает паузы между пакетами.
+        
+        Args:
+            days_old: Количество дней для хранения старых напоминаний
+            batch_size: Размер диапазона id в одной транзакции
+            
+        Returns:
+            int: Количество удаленных напоминаний
+        """
+        id_range = self.get_id_range()
+        if not id_range:
+            return 0
+        
+        cutoff_time = self.get_retention_cutoff(days_old)
+        min_id, max_id = id_range
+        deleted_count = 0
+        
+        for start_id in range(min_id, max_id + 1, batch_size):
+            deleted_count += self.delete_sent_reminders_in_range(start_id, start_id + batch_size, cutoff_time)
+        
+        if deleted_count > 0:
+            logger.info(f"Удалено {deleted_count} старых напоминаний")
+        return deleted_count
+    
+    def _history_path(self, month: str) -> Path:
+        """Путь к файлу истории за месяц в формате ГГГГ-ММ"""
+        return self.history_dir / f"reminders_{month.replace('-', '_')}.db"
+    
+    def _move_to_history(self, conn: sqlite3.Connection, where: str, params: tuple, delivered: bool = True) -> int:
+        """
+        Перенести напоминания, подходящие под условие, в месячные файлы истории
+        
+        Файл выбирается по месяцу reminder_time и подключается через ATTACH DATABASE,
+        перенос и удаление из основной таблицы выполняются в одной транзакции.
+        
+        Args:
+            conn: Соединение с основной базой (без открытой транзакции)
+            where: SQL-условие для таблицы reminders_v2
+            params: Параметры условия
+            delivered: Еще не отмеченные напоминания доставлены (False - пропущены), для статистики
+            
+        Returns:
+            int: Количество перенесенных напоминаний
+        """
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT DISTINCT substr(reminder_time, 1, 7) FROM reminders_v2 WHERE {where}",
+            params
+        )
+        months = [row[0] for row in cursor.fetchall()]
+        if not months:
+            return 0
+        
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        sent_at = get_clock().now().isoformat()
+        moved_count = 0
+        
+        for month in months:
+            cursor.execute("ATTACH DATABASE ? AS history", (str(self._history_path(month)),))
+            try:
+                cursor.execute(HISTORY_TABLE_SQL)
+                month_where = f"({where}) AND substr(reminder_time, 1, 7) = ?"
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO history.reminders_history
+                        (id, user_id, reminder_time, reminder_text, created_at, sent_at)
+                    SELECT id, user_id, reminder_time, reminder_text, created_at, ?
+                    FROM reminders_v2 WHERE {month_where}
+                ''', (sent_at, *params, month))
+                cursor.execute(
+                    f"DELETE FROM reminders_v2 WHERE {month_where} RETURNING user_id, reminder_time, is_sent",
+                    (*params, month)
+                )
+                rows = cursor.fetchall()
+                self._record_removed(cursor, rows, delivered)
+                moved_count += len(rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.execute("DETACH DATABASE history")
+        
+        return moved_count
+    
+    def archive_sent_reminders_in_range(self, start_id: int, end_id: int) -> int:
+        """
+        Перенести в историю уже отправленные напоминания из диапазона id [start_id, end_id)
+        
+        Нужно для строк, отправленных до включения истории.
+        
+        Returns:
+            int: Количество перенесенных напоминаний
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return self._move_to_history(
+                    conn, 'id >= ? AND id < ? AND is_sent = TRUE', (start_id, end_id)
+                )
+        except Exception as e:
+            logger.error(f"Ошибка переноса напоминаний в историю: {e}")
+            return 0
+    
+    def list_history_partitions(self) -> List[Tuple[str, Path]]:
+        """
+        Список месячных файлов истории
+        
+        Returns:
+            List[Tuple[str, Path]]: Список (месяц ГГГГ-ММ, путь к файлу) по возрастанию месяца
+        """
+        if not self.history_dir.exists():
+            return []
+        
+        partitions = []
+        for path in sorted(self.history_dir.glob('reminders_*.db')):
+            month = path.stem[len('reminders_'):].replace('_', '-')
+            partitions.append((month, path))
+        return partitions
+    
+    def iter_sent_reminders(self, user_id: Optional[int] = None) -> Iterator[Tuple[int, int, datetime, str]]:
+        """
+        Итератор по отправленным напоминаниям: основная таблица и все файлы истории
+        
+        Args:
+            user_id: Только напоминания этого пользователя (None - все)
+            
+        Yields:
+            Tuple[int, int, datetime, str]: (id, user_id, reminder_time, reminder_text)
+        """
+        user_filter = " AND user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+        
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT id, user_id, reminder_time, reminder_text FROM reminders_v2 "
+                f"WHERE is_sent = TRUE{user_filter} ORDER BY id",
+                params
+            )
+            for reminder_id, row_user_id, reminder_time_str, reminder_text in cursor:
+                yield reminder_id, row_user_id, datetime.fromisoformat(reminder_time_str), reminder_text or ""
+        
+        for _, path in self.list_history_partitions():
+            with sqlite3.connect(path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT id, user_id, reminder_time, reminder_text FROM reminders_history "
+                    f"WHERE 1 = 1{user_filter} ORDER BY id",
+                    params
+                )
+                for reminder_id, row_user_id, reminder_time_str, reminder_text in cursor:
+                    yield reminder_id, row_user_id, datetime.fromisoformat(reminder_time_str), reminder_text or ""
+    
+    def count_sent_reminders(self, user_id: Optional[int] = None) -> int:
+        """
+        Количество отправленных напоминаний с учетом файлов истории
+        
+        Args:
+            user_id: Только напоминания этого пользователя (None - все)
+            
+        Returns:
+            int: Количество отправленных напоминаний
+        """
+        user_filter = " AND user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT COUNT(*) FROM reminders_v2 WHERE is_sent = TRUE{user_filter}", params)
+                total = cursor.fetchone()[0]
+            
+            return total + self._count_history_reminders(user_id)
+                
+        except Exception as e:
+            logger.error(f"Ошибка подсчета отправленных напоминаний: {e}")
+            return 0
+    
+    def _count_history_reminders(self, user_id: Optional[int] = None) -> int:
+        """Количество напоминаний во всех файлах истории (каждый файл - отдельным соединением)"""
+        user_filter = " WHERE user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+        
+        total = 0
+        for _, path in self.list_history_partitions():
+            with sqlite3.connect(path) as conn:
+                total += conn.execute(f"SELECT COUNT(*) FROM reminders_history{user_filter}", params).fetchone()[0]
+        return total
+    
+    def drop_history_partitions(self, cutoff_time: datetime) -> int:
+        """
+        Удалить файлы истории за месяцы, целиком закончившиеся до cutoff_time
+        
+        Args:
+            cutoff_time: Граница хранения
+            
+        Returns:
+            int: Количество удаленных файлов
+        """
+        cutoff_month = cutoff_time.strftime('%Y-%m')
+        dropped_count = 0
+        
+        for month, path in self.list_history_partitions():
+            if month < cutoff_month:
+                try:
+                    path.unlink()
+                    dropped_count += 1
+                    logger.info(f"Удален файл истории за {month}: {path}")
+                except OSError as e:
+                    logger.error(f"Не удалось удалить файл истории {path}: {e}")
+        
+        return dropped_count
+
+    def create_broadcast(self, text: str, created_by: int) -> Optional[int]:
+        """
+        Создать рассылку администратора
+
+        Args:
+            text: Текст сообщения (HTML)
+            created_by: ID администратора
+
+        Returns:
+            Optional[int]: ID рассылки или None при ошибке
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute(
+                    "INSERT INTO broadcasts (text, created_by, created_at) VALUES (?, ?, ?)",
+                    (text, created_by, get_clock().now().isoformat())
+                )
+                conn.commit()
+                logger.info(f"Создана рассылка {cursor.lastrowid} от администратора {created_by}")
+                return cursor.lastrowid
+
+        except Exception as e:
+            logger.error(f"Ошибка создания рассылки: {e}")
+            return None
+
+    def get_broadcasts(self, running_only: bool = False, limit: int = 10) -> List[dict]:
+        """
+        Рассылки, новые первыми
+
+        Args:
+            running_only: Только незавершенные (для возобновления после перезапуска)
+            limit: Максимум рассылок
+
+        Returns:
+            List[dict]: Поля таблицы broadcasts
+        """
+        where = "WHERE status = 'running'" if running_only else ""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute(f"SELECT * FROM broadcasts {where} ORDER BY id DESC LIMIT ?", (limit,))
+                return [dict(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"Ошибка получения рассылок: {e}")
+            return []
+
+    def save_broadcast_progress(
+        self,
+        broadcast_id: int,
+        last_user_id: int,
+        sent: int,
+        failed: int,
+        blocked: int,
+        status: str = 'running'
+    ) -> bool:
+        """
+        Сохранить контрольную точку рассылки: после перезапуска она продолжится с last_user_id
+
+        Args:
+            broadcast_id: ID рассылки
+            last_user_id: Последний обработанный получатель
+            sent, failed, blocked: Счетчики с начала рассылки
+            status: running, done, failed или cancelled
+
+        Returns:
+            bool: True если сохранено
+        """
+        finished_at = get_clock().now().isoformat() if status != 'running' else None
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    UPDATE broadcasts
+                    SET last_user_id = ?, sent = ?, failed = ?, blocked = ?, status = ?, finished_at = ?
+                    WHERE id = ?
+                ''', (last_user_id, sent, failed, blocked, status, finished_at, broadcast_id))
+                conn.commit()
+                return True
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения прогресса рассылки {broadcast_id}: {e}")
+            return False
+
+    def iter_broadcast_recipients(self, after_user_id: int = 0, batch_size: int = DUE_BATCH_SIZE) -> Iterator[List[int]]:
+        """
+        Получатели рассылки по возрастанию user_id, без заблокировавших бота
+
+        Получатели - все известные боту пользователи (таблица users). Каждый пакет - отдельный короткий запрос по ключу (user_id > последнего),
+        поэтому между пакетами соединение не держится и запись не ждет.
+
+        Args:
+            after_user_id: Начать после этого пользователя (контрольная точка)
+            batch_size: Размер пакета
+
+        Yields:
+            List[int]: Пакет user_id
+        """
+        while True:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute('''
+                    SELECT user_id FROM users
+                    WHERE user_id > ? AND is_blocked = 0
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (after_user_id, batch_size)).fetchall()
+            if not rows:
+                return
+            batch = [user_id for user_id, in rows]
+            yield batch
+            after_user_id = batch[-1]
+
+    def set_user_blocked(self, user_id: int, blocked: bool = True) -> bool:
+        """
+        Отметить, что пользователь заблокировал бота (или снова его запустил)
+
+        Args:
+            user_id: ID пользователя
+            blocked: True - заблокировал, False - снять отметку
+
+        Returns:
+            bool: True если выполнено
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                now = get_clock().now().isoformat()
+                conn.execute('''
+                    INSERT INTO users (user_id, is_blocked, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET is_blocked = excluded.is_blocked
+                ''', (user_id, int(blocked), now, now))
+                conn.commit()
+                return True
+
+        except Exception as e:
+            logger.error(f"Ошибка отметки блокировки пользователя {user_id}: {e}")
+            return False
+
+    def upsert_user(self, user_id: int, language: Optional[str] = None, unblock: bool = False) -> Optional[dict]:
+        """
+        Добавить пользователя или обновить время последнего обращения
+
+        Args:
+            user_id: ID пользователя Telegram
+            language: Язык из профиля Telegram (не заменяет уже сохраненный)
+            unblock: Снять отметку о блокировке (пользователь снова запустил бота)
+
+        Returns:
+            Optional[dict]: Настройки пользователя (USER_SETTINGS_FIELDS) или None при ошибке
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                now = get_clock().now().isoformat()
+                row = conn.execute(f'''
+                    INSERT INTO users (user_id, language, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        last_seen = excluded.last_seen,
+                        language = COALESCE(language, excluded.language),
+                        is_blocked = CASE WHEN ? THEN 0 ELSE is_blocked END
+                    RETURNING {', '.join(USER_SETTINGS_FIELDS)}
+                ''', (user_id, language, now, now, unblock)).fetchone()
+                conn.commit()
+                return dict(zip(USER_SETTINGS_FIELDS, row))
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения пользователя {user_id}: {e}")
+            return None
+
+    def get_users(self, user_ids) -> dict:
+        """
+        Настройки нескольких пользователей одним запросом
+
+        Args:
+            user_ids: ID пользователей
+
+        Returns:
+            dict: user_id -> настройки (USER_SETTINGS_FIELDS); неизвестных пользователей нет в ответе
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+        placeholders = ', '.join('?' * len(user_ids))
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    f"SELECT user_id, {', '.join(USER_SETTINGS_FIELDS)} FROM users WHERE user_id IN ({placeholders})",
+                    user_ids
+                ).fetchall()
+                return {row[0]: dict(zip(USER_SETTINGS_FIELDS, row[1:])) for row in rows}
+
+        except Exception as e:
+            logger.error(f"Ошибка чтения настроек пользователей: {e}")
+            return {}
+
+    def record_delivery_failures(self, count: int) -> bool:
+        """
+        Учесть в статистике напоминания, которые не удалось доставить после всех попыток
+
+        Args:
+            count: Количество напоминаний
+
+        Returns:
+            bool: True если выполнено
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self._update_stats(conn.cursor(), failed=count)
+                conn.commit()
+                return True
+
+        except Exception as e:
+            logger.error(f"Ошибка записи статистики доставки: {e}")
+            return False
+
+    def set_started_at(self, started_at: datetime) -> bool:
+        """
+        Запомнить время запуска процесса рассылки (для времени работы в /stats)
+
+        Returns:
+            bool: True если выполнено
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "UPDATE stats_counters SET value = ? WHERE name = 'started_at'",
+                    (int(started_at.timestamp()),)
+                )
+                conn.commit()
+                return True
+
+        except Exception as e:
+            logger.error(f"Ошибка записи времени запуска: {e}")
+            return False
+
+    def get_stats_summary(self, hours: int = 24) -> dict:
+        """
+        Сводная статистика без подсчета строк: счетчики и почасовые итоги
+
+        Args:
+            hours: За сколько последних часов вернуть почасовые итоги
+
+        Returns:
+            dict: Счетчики STATS_COUNTERS и 'hourly' - {час: {created, sent, deleted,
+                failed, lag_sum, lag_max}} (пустой словарь при ошибке)
+        """
+        since = (get_clock().now() - timedelta(hours=hours - 1)).strftime(STATS_HOUR_FORMAT)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                summary = dict(conn.execute("SELECT name, value FROM stats_counters").fetchall())
+                summary['hourly'] = {
+                    row['hour']: {key: row[key] for key in row.keys() if key != 'hour'}
+                    for row in conn.execute(
+                        "SELECT * FROM stats_hourly WHERE hour >= ? ORDER BY hour", (since,)
+                    )
+                }
+                return summary
+
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики: {e}")
+            return {}
+
+
+def _group_by_user(batch: list) -> list:
+    """Переставить пакет напоминаний так, чтобы напоминания пользователя шли подряд (по времени)"""
+    first_position = {}
+    for position, reminder in enumerate(batch):
+        first_position.setdefault(reminder[1], position)
+    return sorted(batch, key=lambda reminder: first_position[reminder[1]])
+
+
+def _rebatch(rows: Iterator[tuple], batch_size: int) -> Iterator[list]:
+    """Собрать поток строк в пакеты по batch_size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ShardedReminderDatabase:
+    """
+    Напоминания в нескольких файлах SQLite, распределенных по user_id
+
+    У каждого файла своя блокировка записи, поэтому добавление и удаление
+    напоминаний разных пользователей не ждут друг друга. Интерфейс совпадает
+    с ReminderDatabaseV2: id напоминания кодирует номер файла
+    (id = локальный_id * shards + номер), выборка наступивших напоминаний
+    сливает потоки всех файлов в общем порядке.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        shards: int = DB_SHARDS,
+        history_enabled: bool = HISTORY_ENABLED,
+        history_dir: str = HISTORY_DIR
+    ):
+        """
+        Args:
+            db_path: Путь к базе: файлы называются reminders.shard0.db, reminders.shard1.db, ...
+            shards: Количество файлов
+            history_enabled: Переносить отправленные напоминания в месячные файлы истории
+            history_dir: Директория файлов истории (у каждого файла базы - своя поддиректория)
+        """
+        self.db_path = db_path
+        self.history_enabled = history_enabled
+        base_history_dir = Path(history_dir) if history_dir else Path(db_path).parent / 'history'
+        self.shards = [
+            ReminderDatabaseV2(
+                str(Path(db_path).with_suffix(f'.shard{number}.db')),
+                history_enabled=history_enabled,
+                history_dir=str(base_history_dir / f'shard{number}')
+            )
+            for number in range(shards)
+        ]
+
+    def shard_for_user(self, user_id: int) -> ReminderDatabaseV2:
+        """Файл базы пользователя"""
+        return self.shards[user_id % len(self.shards)]
+
+    def _to_global(self, number: int, local_id: int) -> int:
+        return local_id * len(self.shards) + number
+
+    def _split_ids(self, reminder_ids) -> dict:
+        """Разложить id по файлам: номер файла -> локальные id"""
+        by_shard = {}
+        for reminder_id in reminder_ids:
+            local_id, number = divmod(reminder_id, len(self.shards))
+            by_shard.setdefault(number, []).append(local_id)
+        return by_shard
+
+    def _local_range(self, number: int, start_id: int, end_id: int) -> Tuple[int, int]:
+        """Локальный диапазон id файла для глобального диапазона [start_id, end_id)"""
+        count = len(self.shards)
+        return -((number - start_id) // count), -((number - end_id) // count)
+
+    def add_reminder(self, user_id: int, reminder_time: datetime, reminder_text: str = None) -> bool:
+        return self.shard_for_user(user_id).add_reminder(user_id, reminder_time, reminder_text)
+
+    def add_reminders(self, reminders: List[Tuple[int, datetime, Optional[str]]]) -> List[Optional[Tuple[int, int]]]:
+        """Групповое добавление: одна транзакция на каждый затронутый файл (None - для файлов с ошибкой)"""
+        positions = {}
+        for position, reminder in enumerate(reminders):
+            positions.setdefault(reminder[0] % len(self.shards), []).append(position)
+
+        results = [None] * len(reminders)
+        for number, shard_positions in positions.items():
+            added = self.shards[number].add_reminders([reminders[position] for position in shard_positions])
+            if added is None:
+                continue
+            for position, (reminder_id, count) in zip(shard_positions, added):
+                results[position] = (self._to_global(number, reminder_id), count)
+        return results
+
+    def get_user_reminders(self, user_id: int) -> List[Tuple[int, datetime, str]]:
+        number = user_id % len(self.shards)
+        return [
+            (self._to_global(number, reminder_id), reminder_time, reminder_text)
+            for reminder_id, reminder_time, reminder_text in self.shards[number].get_user_reminders(user_id)
+        ]
+
+    def import_reminders(self, user_id: int, reminders: List[Tuple[datetime, Optional[str]]]) -> Optional[int]:
+        return self.shard_for_user(user_id).import_reminders(user_id, reminders)
+
+    def iter_user_reminders(self, user_id: int, batch_size: int = DUE_BATCH_SIZE) -> Iterator[List[Tuple[int, datetime, str]]]:
+        number = user_id % len(self.shards)
+        for batch in self.shards[number].iter_user_reminders(user_id, batch_size):
+            yield [
+                (self._to_global(number, reminder_id), reminder_time, reminder_text)
+                for reminder_id, reminder_time, reminder_text in batch
+            ]
+
+    def search_reminders(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 10,
+        offset: int = 0
+    ) -> List[Tuple[int, datetime, str]]:
+        number = user_id % len(self.shards)
+        return [
+            (self._to_global(number, reminder_id), reminder_time, reminder_text)
+            for reminder_id, reminder_time, reminder_text in self.shards[number].search_reminders(
+                user_id, query, limit, offset
+            )
+        ]
+
+    def get_due_reminders(self) -> List[Tuple[int, int, datetime, str]]:
+        return [reminder for batch in self.iter_due_reminders() for reminder in batch]
+
+    def iter_due_reminders(
+        self,
+        batch_size: int = DUE_BATCH_SIZE,
+        current_time: Optional[datetime] = None,
+        group_by_user: bool = False
+    ) -> Iterator[List[Tuple[int, int, datetime, str]]]:
+        """
+        Потоковая выборка наступивших напоминаний из всех файлов (см. ReminderDatabaseV2.iter_due_reminders)
+
+        Потоки файлов сливаются через heapq.merge, в памяти - не больше пакета на файл.
+        Группировка по пользователю - в пакетах уже слитого потока.
+        """
+        current_time = current_time or get_clock().now()
+
+        def rows(number: int):
+            for batch in self.shards[number].iter_due_reminders(batch_size, current_time):
+                for reminder_id, user_id, reminder_time, reminder_text in batch:
+                    yield self._to_global(number, reminder_id), user_id, reminder_time, reminder_text
+
+        merged = heapq.merge(
+            *(rows(number) for number in range(len(self.shards))),
+            key=lambda reminder: (reminder[2], reminder[0])
+        )
+        batches = _rebatch(merged, batch_size)
+        if group_by_user:
+            return (_group_by_user(batch) for batch in batches)
+        return batches
+
+    def iter_pending_ids(
+        self,
+        start_time: Optional[datetime],
+        end_time: datetime,
+        batch_size: int = DUE_BATCH_SIZE
+    ) -> Iterator[List[Tuple[int, datetime]]]:
+        def rows(number: int):
+            for batch in self.shards[number].iter_pending_ids(start_time, end_time, batch_size):
+                for reminder_id, reminder_time in batch:
+                    yield self._to_global(number, reminder_id), reminder_time
+
+        merged = heapq.merge(
+            *(rows(number) for number in range(len(self.shards))),
+            key=lambda item: (item[1], item[0])
+        )
+        return _rebatch(merged, batch_size)
+
+    def iter_reminders_by_ids(
+        self,
+        reminder_ids,
+        batch_size: int = DUE_BATCH_SIZE,
+        group_by_user: bool = False
+    ) -> Iterator[List[Tuple[int, int, datetime, str]]]:
+        for number, local_ids in sorted(self._split_ids(reminder_ids).items()):
+            for batch in self.shards[number].iter_reminders_by_ids(local_ids, batch_size, group_by_user):
+                yield [
+                    (self._to_global(number, reminder_id), user_id, reminder_time, reminder_text)
+                    for reminder_id, user_id, reminder_time, reminder_text in batch
+                ]
+
+    def get_next_reminder_time(self) -> Optional[datetime]:
+        times = [time for time in (shard.get_next_reminder_time() for shard in self.shards) if time is not None]
+        return min(times) if times else None
+
+    def mark_reminder_sent(self, reminder_id: int) -> bool:
+        local_id, number = divmod(reminder_id, len(self.shards))
+        return self.shards[number].mark_reminder_sent(local_id)
+
+    def mark_reminders_sent(self, reminder_ids: List[int], delivered: bool = True) -> int:
+        return sum(
+            self.shards[number].mark_reminders_sent(local_ids, delivered)
+            for number, local_ids in self._split_ids(reminder_ids).items()
+        )
+
+    def delete_reminder(self, reminder_id: int, user_id: int) -> bool:
+        local_id, number = divmod(reminder_id, len(self.shards))
+        if number != user_id % len(self.shards):
+            logger.warning(f"Напоминание {reminder_id} не найдено для пользователя {user_id}")
+            return False
+        return self.shards[number].delete_reminder(local_id, user_id)
+
+    def snooze_reminder(
+        self,
+        reminder_id: int,
+        user_id: int,
+        new_time: datetime,
+        reminder_time: Optional[datetime] = None
+    ) -> bool:
+        local_id, number = divmod(reminder_id, len(self.shards))
+        if number != user_id % len(self.shards):
+            logger.warning(f"Напоминание {reminder_id} не найдено для пользователя {user_id}")
+            return False
+        return self.shards[number].snooze_reminder(local_id, user_id, new_time, reminder_time)
+
+    def delete_reminders(
+        self,
+        user_id: int,
+        reminder_ids: Optional[List[int]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> int:
+        local_ids = None
+        if reminder_ids is not None:
+            # Напоминания пользователя только в его файле, чужие id отбрасываются
+            local_ids = self._split_ids(reminder_ids).get(user_id % len(self.shards), [])
+        return self.shard_for_user(user_id).delete_reminders(user_id, local_ids, start_time, end_time)
+
+    def get_reminders_count(self, user_id: int) -> int:
+        return self.shard_for_user(user_id).get_reminders_count(user_id)
+
+    def get_file_paths(self) -> List[str]:
+        return [path for shard in self.shards for path in shard.get_file_paths()]
+
+    def get_file_databases(self) -> List[ReminderDatabaseV2]:
+        return list(self.shards)
+
+    def get_retention_cutoff(self, days_old: int = DB_CLEANUP_DAYS) -> datetime:
+        return self.shards[0].get_retention_cutoff(days_old)
+
+    def get_id_range(self) -> Optional[Tuple[int, int]]:
+        ranges = [
+            (self._to_global(number, id_range[0]), self._to_global(number, id_range[1]))
+            for number, id_range in enumerate(shard.get_id_range() for shard in self.shards)
+            if id_range
+        ]
+        if not ranges:
+            return None
+        return min(start for start, _ in ranges), max(end for _, end in ranges)
+
+    def delete_sent_reminders_in_range(self, start_id: int, end_id: int, cutoff_time: datetime) -> int:
+        return sum(
+            shard.delete_sent_reminders_in_range(*self._local_range(number, start_id, end_id), cutoff_time)
+            for number, shard in enumerate(self.shards)
+        )
+
+    def cleanup_old_reminders(self, days_old: int = DB_CLEANUP_DAYS, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        return sum(shard.cleanup_old_reminders(days_old, batch_size) for shard in self.shards)
+
+    def archive_sent_reminders_in_range(self, start_id: int, end_id: int) -> int:
+        return sum(
+            shard.archive_sent_reminders_in_range(*self._local_range(number, start_id, end_id))
+            for number, shard in enumerate(self.shards)
+        )
+
+    def list_history_partitions(self) -> List[Tuple[str, Path]]:
+        return sorted(partition for shard in self.shards for partition in shard.list_history_partitions())
+
+    def iter_sent_reminders(self, user_id: Optional[int] = None) -> Iterator[Tuple[int, int, datetime, str]]:
+        numbers = [user_id % len(self.shards)] if user_id is not None else range(len(self.shards))
+        for number in numbers:
+            for reminder_id, row_user_id, reminder_time, reminder_text in self.shards[number].iter_sent_reminders(user_id):
+                yield self._to_global(number, reminder_id), row_user_id, reminder_time, reminder_text
+
+    def count_sent_reminders(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return self.shard_for_user(user_id).count_sent_reminders(user_id)
+        return sum(shard.count_sent_reminders() for shard in self.shards)
+
+    def drop_history_partitions(self, cutoff_time: datetime) -> int:
+        return sum(shard.drop_history_partitions(cutoff_time) for shard in self.shards)
+
+    # Рассылки хранятся в первом файле, пользователи и их настройки - в файле пользователя
+
+    def create_broadcast(self, text: str, created_by: int) -> Optional[int]:
+        return self.shards[0].create_broadcast(text, created_by)
+
+    def get_broadcasts(self, running_only: bool = False, limit: int = 10) -> List[dict]:
+        return self.shards[0].get_broadcasts(running_only, limit)
+
+    def save_broadcast_progress(
+        self,
+        broadcast_id: int,
+        last_user_id: int,
+        sent: int,
+        failed: int,
+        blocked: int,
+        status: str = 'running'
+    ) -> bool:
+        return self.shards[0].save_broadcast_progress(broadcast_id, last_user_id, sent, failed, blocked, status)
+
+    def iter_broadcast_recipients(self, after_user_id: int = 0, batch_size: int = DUE_BATCH_SIZE) -> Iterator[List[int]]:
+        """Получатели всех файлов по возрастанию user_id (у файлов непересекающиеся пользователи)"""
+        streams = [
+            (user_id for batch in shard.iter_broadcast_recipients(after_user_id, batch_size) for user_id in batch)
+            for shard in self.shards
+        ]
+        yield from _rebatch(heapq.merge(*streams), batch_size)
+
+    def set_user_blocked(self, user_id: int, blocked: bool = True) -> bool:
+        return self.shard_for_user(user_id).set_user_blocked(user_id, blocked)
+
+    def upsert_user(self, user_id: int, language: Optional[str] = None, unblock: bool = False) -> Optional[dict]:
+        return self.shard_for_user(user_id).upsert_user(user_id, language, unblock)
+
+    def get_users(self, user_ids) -> dict:
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(user_id % len(self.shards), []).append(user_id)
+        users = {}
+        for number, shard_user_ids in by_shard.items():
+            users.update(self.shards[number].get_users(shard_user_ids))
+        return users
+
+    # Статистика ведется в каждом файле, время запуска и ошибки доставки - в первом
+
+    def record_delivery_failures(self, count: int) -> bool:
+        return self.shards[0].record_delivery_failures(count)
+
+    def set_started_at(self, started_at: datetime) -> bool:
+        return self.shards[0].set_started_at(started_at)
+
+    def get_stats_summary(self, hours: int = 24) -> dict:
+        """Сумма счетчиков и почасовых итогов всех файлов (задержка - максимум)"""
+        summary = {}
+        hourly = {}
+        for shard_summary in (shard.get_stats_summary(hours) for shard in self.shards):
+            for hour, values in shard_summary.pop('hourly', {}).items():
+                total = hourly.setdefault(hour, dict.fromkeys(values, 0))
+                for key, value in values.items():
+                    total[key] = max(total[key], value) if key == 'lag_max' else total[key] + value
+            for name, value in shard_summary.items():
+                summary[name] = max(summary.get(name, 0), value) if name == 'started_at' else summary.get(name, 0) + value
+        summary['hourly'] = dict(sorted(hourly.items()))
+        return summary
+
+
+_db_instance: Optional[ReminderDatabaseV2] = None
+_db_lock = threading.Lock()
+
+
+def get_db() -> ReminderDatabaseV2:
+    """
+    Получить общий экземпляр базы данных (создается при первом обращении)
+    
+    Returns:
+        ReminderDatabaseV2: Экземпляр базы данных по пути DB_PATH
+            (ShardedReminderDatabase при DB_SHARDS > 1)
+    """
+    global _db_instance
+    if _db_instance is None:
+        with _db_lock:
+            if _db_instance is None:
+                _db_instance = ShardedReminderDatabase() if DB_SHARDS > 1 else ReminderDatabaseV2()
+    return _db_instance
 
 
-# Глобальный экземпляр базы данных
-db_v2 = ReminderDatabaseV2()
-db = db_v2  # Алиас для совместимости
+def __getattr__(name: str):
+    """Ленивые алиасы db_v2 и db для совместимости со старым кодом"""
+    if name in ('db_v2', 'db'):
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
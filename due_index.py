@@ -0,0 +1,245 @@
+"""
+Компактный индекс наступающих напоминаний в памяти
+
+Иерархическое колесо времени: напоминания текущего часа лежат в минутных
+слотах (array('q') с id), напоминания следующих часов горизонта - в часовых
+корзинах (id и смещение минуты внутри часа). При наступлении часа корзина
+раскладывается по минутам, а горизонт дозагружается из SQLite. Напоминания
+дальше горизонта в памяти не держатся.
+
+Индекс хранит только id: удаленные и уже отправленные напоминания
+отфильтровываются при выборке строк из базы, поэтому удалять их из колеса
+не нужно.
+
+О новых напоминаниях индекс узнает по подсказкам mark_dirty. В раздельном
+режиме они приходят UDP-датаграммами и могут потеряться, поэтому не реже
+раза в resync_seconds ближайшие минуты горизонта сверяются с базой.
+"""
+import logging
+import math
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from clock import get_clock
+from config import CHECK_INTERVAL_SECONDS, DUE_BATCH_SIZE, DUE_INDEX_HORIZON_HOURS, OMSK_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=OMSK_TIMEZONE)
+
+
+def epoch_minute(moment: datetime) -> int:
+    """Номер минуты от начала эпохи (по времени Омска)"""
+    return int((moment - _EPOCH).total_seconds() // 60)
+
+
+def minute_to_datetime(minute: int) -> datetime:
+    """Начало минуты по ее номеру"""
+    return _EPOCH + timedelta(minutes=minute)
+
+
+class DueIndex:
+    """Колесо времени с минутными слотами и часовыми корзинами"""
+
+    def __init__(
+        self,
+        database,
+        horizon_hours: int = DUE_INDEX_HORIZON_HOURS,
+        batch_size: int = DUE_BATCH_SIZE,
+        resync_seconds: int = CHECK_INTERVAL_SECONDS
+    ):
+        """
+        Args:
+            database: База данных напоминаний (источник истины)
+            horizon_hours: На сколько часов вперед держать напоминания в памяти
+            batch_size: Размер пакета при загрузке из базы
+            resync_seconds: Как часто сверять ближайшие минуты с базой (на случай потерянных подсказок)
+        """
+        self.db = database
+        self.horizon_hours = max(1, horizon_hours)
+        self.batch_size = batch_size
+        self.resync_seconds = resync_seconds
+        # Сверяемое окно: до следующей сверки наступит не больше этих минут
+        self.resync_minutes = math.ceil(resync_seconds / 60) + 1
+
+        # Минутные слоты текущего часа: номер минуты -> id
+        self._minutes: Dict[int, array] = {}
+        # Часовые корзины горизонта: номер часа -> (id, минута внутри часа)
+        self._hours: Dict[int, Tuple[array, array]] = {}
+        self._current_hour: Optional[int] = None
+        # Номер часа, до которого (не включая) горизонт загружен из базы
+        self._loaded_until: Optional[int] = None
+        # Минуты, в которые добавлены напоминания после загрузки
+        self._dirty: Set[int] = set()
+        # Время следующей сверки ближайших минут с базой
+        self._resync_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._minutes.values()) + sum(
+            len(ids) for ids, _ in self._hours.values()
+        )
+
+    def add(self, reminder_id: int, minute: int):
+        """
+        Добавить id в слот минуты (минуты за горизонтом игнорируются - их загрузит sync)
+
+        Args:
+            reminder_id: ID напоминания
+            minute: Номер минуты (см. epoch_minute)
+        """
+        if self._current_hour is None:
+            return
+
+        hour = minute // 60
+        if hour <= self._current_hour:
+            # Опоздавшие напоминания попадают в минутные слоты как есть и выбираются первыми
+            slot = self._minutes.get(minute)
+            if slot is None:
+                slot = self._minutes[minute] = array('q')
+            slot.append(reminder_id)
+        elif hour < self._loaded_until:
+            bucket = self._hours.get(hour)
+            if bucket is None:
+                bucket = self._hours[hour] = (array('q'), array('B'))
+            bucket[0].append(reminder_id)
+            bucket[1].append(minute % 60)
+
+    def mark_dirty(self, reminder_time: datetime):
+        """
+        Отметить минуту, в которую добавлено напоминание
+
+        Перечитывается из базы при следующем sync, так как событие не содержит id.
+        """
+        self._dirty.add(epoch_minute(reminder_time))
+
+    def sync(self, now: Optional[datetime] = None):
+        """
+        Продвинуть колесо к текущему часу, дозагрузить горизонт и перечитать измененные минуты
+
+        Args:
+            now: Текущее время (по умолчанию - сейчас по Омску)
+        """
+        now = now or get_clock().now()
+        now_hour = epoch_minute(now) // 60
+
+        if self._current_hour is None:
+            # Первая загрузка: все ожидающие напоминания до конца горизонта, включая опоздавшие
+            self._current_hour = now_hour
+            self._loaded_until = now_hour + self.horizon_hours
+            self._load(None, self._loaded_until)
+            self._resync_at = now + timedelta(seconds=self.resync_seconds)
+        else:
+            while self._current_hour < now_hour:
+                self._current_hour += 1
+                self._cascade(self._current_hour)
+
+            horizon_end = now_hour + self.horizon_hours
+            if horizon_end > self._loaded_until:
+                # После долгой паузы пропущенные часы тоже загружаются (как опоздавшие)
+                start = self._loaded_until
+                self._loaded_until = horizon_end
+                self._load(start, horizon_end)
+
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            self._reload_minutes(dirty)
+
+        if now >= self._resync_at:
+            self._resync_at = now + timedelta(seconds=self.resync_seconds)
+            self._resync(epoch_minute(now) + self.resync_minutes)
+
+    def pop_due(self, now: Optional[datetime] = None) -> array:
+        """
+        Забрать id всех напоминаний, чья минута наступила
+
+        Returns:
+            array: id в порядке минут
+        """
+        now_minute = epoch_minute(now or get_clock().now())
+        due = array('q')
+        for minute in sorted(m for m in self._minutes if m <= now_minute):
+            due.extend(self._minutes.pop(minute))
+        return due
+
+    def next_due_time(self) -> Optional[datetime]:
+        """
+        Время ближайшего напоминания в горизонте
+
+        Returns:
+            Optional[datetime]: Начало минуты ближайшего напоминания или None
+        """
+        if self._minutes:
+            return minute_to_datetime(min(self._minutes))
+        for hour in sorted(self._hours):
+            ids, offsets = self._hours[hour]
+            if ids:
+                return minute_to_datetime(hour * 60 + min(offsets))
+        return None
+
+    def memory_bytes(self) -> int:
+        """Приблизительный объем буферов id в байтах"""
+        total = sum(slot.buffer_info()[1] * slot.itemsize for slot in self._minutes.values())
+        for ids, offsets in self._hours.values():
+            total += ids.buffer_info()[1] * ids.itemsize + offsets.buffer_info()[1] * offsets.itemsize
+        return total
+
+    def _cascade(self, hour: int):
+        """Разложить часовую корзину по минутным слотам"""
+        bucket = self._hours.pop(hour, None)
+        if bucket is None:
+            return
+        for reminder_id, offset in zip(*bucket):
+            self.add(reminder_id, hour * 60 + offset)
+
+    def _load(self, start_hour: Optional[int], end_hour: int):
+        """Загрузить ожидающие напоминания за диапазон часов из базы"""
+        start_time = minute_to_datetime(start_hour * 60) if start_hour is not None else None
+        end_time = minute_to_datetime(end_hour * 60)
+
+        loaded = 0
+        for batch in self.db.iter_pending_ids(start_time, end_time, self.batch_size):
+            for reminder_id, reminder_time in batch:
+                self.add(reminder_id, epoch_minute(reminder_time))
+            loaded += len(batch)
+
+        logger.debug(f"Индекс напоминаний: загружено {loaded} до {end_time.isoformat()}")
+
+    def _resync(self, end_minute: int):
+        """Добавить ожидающие в базе напоминания до end_minute (включая опоздавшие), которых нет в индексе"""
+        end_minute = min(end_minute, self._loaded_until * 60)
+        known = set()
+        for slot in self._minutes.values():
+            known.update(slot)
+        for hour, (ids, _) in self._hours.items():
+            if hour * 60 < end_minute:
+                known.update(ids)
+
+        found = 0
+        for batch in self.db.iter_pending_ids(None, minute_to_datetime(end_minute), self.batch_size):
+            for reminder_id, reminder_time in batch:
+                if reminder_id not in known:
+                    self.add(reminder_id, epoch_minute(reminder_time))
+                    found += 1
+
+        if found:
+            logger.warning(f"Индекс напоминаний: при сверке с базой найдено пропущенных напоминаний: {found}")
+
+    def _reload_minutes(self, minutes: Set[int]):
+        """Перечитать из базы минуты с новыми напоминаниями (без дублей id)"""
+        for minute in minutes:
+            hour = minute // 60
+            if hour >= self._loaded_until:
+                continue
+
+            if hour <= self._current_hour:
+                known = set(self._minutes.get(minute, ()))
+            else:
+                ids, offsets = self._hours.get(hour, ((), ()))
+                known = {reminder_id for reminder_id, offset in zip(ids, offsets) if offset == minute % 60}
+
+            start_time = minute_to_datetime(minute)
+            for batch in self.db.iter_pending_ids(start_time, start_time + timedelta(minutes=1), self.batch_size):
+                for reminder_id, reminder_time in batch:
+                    if reminder_id not in known:
+                        self.add(reminder_id, epoch_minute(reminder_time))
@@ -0,0 +1,124 @@
+"""
+События об изменении напоминаний и их доставка в процесс рассылки
+
+Обработчики публикуют события (добавлено/удалено, создана рассылка, изменен
+пользователь) в reminder_events.
+В режиме одного процесса на события подписан планировщик напоминаний,
+в раздельном режиме (BOT_ROLE=interactive/delivery) события передаются
+процессу рассылки UDP-датаграммами через локальный сокет.
+"""
+import asyncio
+import json
+import logging
+import socket
+from datetime import datetime
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Типы событий
+EVENT_ADDED = 'added'
+EVENT_DELETED = 'deleted'
+EVENT_BROADCAST = 'broadcast'
+# Изменились настройки пользователя: слушатель получает третьим аргументом user_id
+EVENT_USER = 'user'
+
+ReminderListener = Callable[..., None]
+
+
+class ReminderEvents:
+    """Простая синхронная шина событий об изменении напоминаний"""
+
+    def __init__(self):
+        self._listeners: List[ReminderListener] = []
+
+    def subscribe(self, listener: ReminderListener):
+        """Подписаться на события"""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ReminderListener):
+        """Отписаться от событий"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def publish(self, event: str, reminder_time: Optional[datetime] = None, user_id: Optional[int] = None):
+        """
+        Опубликовать событие
+
+        Args:
+            event: Тип события (EVENT_ADDED, EVENT_DELETED, EVENT_BROADCAST, EVENT_USER)
+            reminder_time: Время напоминания (для добавленных напоминаний)
+            user_id: ID пользователя (для EVENT_USER)
+        """
+        args = (event, reminder_time) if user_id is None else (event, reminder_time, user_id)
+        for listener in list(self._listeners):
+            try:
+                listener(*args)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика события {event}: {e}")
+
+
+class DeliverySignalSender:
+    """Отправка событий процессу рассылки (без ожидания ответа)"""
+
+    def __init__(self, host: str, port: int):
+        self.address = (host, port)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def __call__(self, event: str, reminder_time: Optional[datetime] = None, user_id: Optional[int] = None):
+        payload = {'event': event}
+        if reminder_time is not None:
+            payload['reminder_time'] = reminder_time.isoformat()
+        if user_id is not None:
+            payload['user_id'] = user_id
+        try:
+            self._socket.sendto(json.dumps(payload).encode('utf-8'), self.address)
+        except OSError as e:
+            # Процесс рассылки может быть перезапущен: при старте он сам перечитает базу
+            logger.debug(f"Процесс рассылки недоступен: {e}")
+
+    def close(self):
+        self._socket.close()
+
+
+class _SignalProtocol(asyncio.DatagramProtocol):
+    def __init__(self, callback: ReminderListener):
+        self.callback = callback
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            payload = json.loads(data.decode('utf-8'))
+            reminder_time = payload.get('reminder_time')
+            args = (payload['event'], datetime.fromisoformat(reminder_time) if reminder_time else None)
+            if payload.get('user_id') is not None:
+                args += (int(payload['user_id']),)
+            self.callback(*args)
+        except Exception as e:
+            logger.warning(f"Некорректный сигнал от {addr}: {e}")
+
+
+class DeliverySignalListener:
+    """Прием событий в процессе рассылки"""
+
+    def __init__(self, host: str, port: int, callback: ReminderListener):
+        self.address = (host, port)
+        self.callback = callback
+        self._transport = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _SignalProtocol(self.callback),
+            local_addr=self.address
+        )
+        logger.info(f"Прием сигналов процесса рассылки на {self.address[0]}:{self.address[1]}")
+
+    def close(self):
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+
+# Глобальная шина событий
+reminder_events = ReminderEvents()
@@ -2,19 +2,53 @@
 Обновленные обработчики сообщений для Telegram-бота "Напоминалка" (версия 2.0)
 Поддержка множественных напоминаний и кнопок
 """
+import asyncio
+import html
 import logging
+import os
+import tempfile
+from datetime import timedelta
+from typing import Optional
+
 from aiogram import Router, types, F
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import MESSAGES
-from database import db_v2
+from callbacks import (
+    encode_callback,
+    decode_callback,
+    ACTION_MAIN_MENU,
+    ACTION_SHOW_REMINDERS,
+    ACTION_HELP,
+    ACTION_ADD_HELP,
+    ACTION_REMINDER,
+    ACTION_DELETE,
+    ACTION_CONFIRM_DELETE,
+    ACTION_SEARCH_PAGE,
+    ACTION_BULK_SELECT,
+    ACTION_BULK_TOGGLE,
+    ACTION_BULK_DELETE_SELECTED,
+    ACTION_BULK_ASK,
+    ACTION_BULK_CONFIRM,
+    ACTION_BULK_CONFIRM_SELECTED,
+    ACTION_SNOOZE,
+    ACTION_SNOOZE_ALL
+)
+from config import MESSAGES, ADMIN_USER_IDS, IMPORT_MAX_FILE_MB, IMPORT_MAX_ROWS, SEARCH_PAGE_SIZE
+from database import get_db, STATS_HOUR_FORMAT
+from due_index import epoch_minute, minute_to_datetime
+from events import reminder_events, EVENT_ADDED, EVENT_DELETED, EVENT_BROADCAST, EVENT_USER
+from middlewares import UserSettingsMiddleware
+from transfer import FORMATS, FORMAT_CSV, detect_format, import_file, export_reminders
+from write_batcher import add_reminder
 from utils import (
     validate_reminder_time_v2,
     format_datetime_for_user,
     format_time_for_user,
     format_datetime_short,
+    get_current_omsk_time,
     get_time_until_reminder
 )
 
@@ -22,59 +56,104 @@ logger = logging.getLogger(__name__)
 
 # Создаем роутер для обработчиков
 router = Router()
+# Пользователь регистрируется при первом обращении, обработчики получают его настройки
+router.message.outer_middleware(UserSettingsMiddleware())
+router.callback_query.outer_middleware(UserSettingsMiddleware())
+
+
+# Обработчики нажатий кнопок: код действия (callbacks.py) -> обработчик (callback, *аргументы)
+CALLBACK_HANDLERS = {}
+
+# Что удаляет массовое удаление (аргумент ACTION_BULK_ASK / ACTION_BULK_CONFIRM)
+BULK_SCOPE_ALL = 0
+BULK_SCOPE_TODAY = 1
+BULK_SCOPES = {BULK_SCOPE_ALL: "все напоминания", BULK_SCOPE_TODAY: "напоминания на сегодня"}
+
+# Кнопки "отложить" под отправленным напоминанием: вариант -> (текст кнопки, сдвиг от текущего
+# времени; None - завтра в то же время, что и исходное напоминание)
+SNOOZE_10_MIN = 0
+SNOOZE_1_HOUR = 1
+SNOOZE_TOMORROW = 2
+SNOOZE_OPTIONS = {
+    SNOOZE_10_MIN: ("+10 мин", timedelta(minutes=10)),
+    SNOOZE_1_HOUR: ("+1 ч", timedelta(hours=1)),
+    SNOOZE_TOMORROW: ("Завтра", None),
+}
 
+# Отметки напоминаний на экране выбора: выбранные хранятся в самой клавиатуре сообщения
+CHECKBOX_OFF = "⬜"
+CHECKBOX_ON = "✅"
 
-def get_main_keyboard() -> InlineKeyboardMarkup:
-    """Создать основную клавиатуру с кнопками"""
+# Аргумент /export: выгрузить вместе с отправленными напоминаниями (включая файлы истории)
+EXPORT_ALL = "all"
+
+MAIN_MENU_TEXT = "🏠 Главное меню\n\nВыберите действие:"
+
+
+def get_main_keyboard(keep_message: bool = False) -> InlineKeyboardMarkup:
+    """
+    Создать основную клавиатуру с кнопками
+    
+    Args:
+        keep_message: Кнопки открывают экраны новым сообщением
+            (для напоминаний и подтверждений, которые должны остаться в чате)
+    """
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(
         text="📋 Мои напоминания",
-        callback_data="show_reminders"
+        callback_data=encode_callback(ACTION_SHOW_REMINDERS, new_message=keep_message)
     ))
     builder.add(InlineKeyboardButton(
         text="ℹ️ Помощь",
-        callback_data="help"
+        callback_data=encode_callback(ACTION_HELP, new_message=keep_message)
     ))
     builder.adjust(1)  # По одной кнопке в ряд
     return builder.as_markup()
 
 
+def _reminder_button_text(reminder_time, reminder_text: str) -> str:
+    """Текст кнопки напоминания: время и начало текста"""
+    text_preview = reminder_text[:20] + "..." if reminder_text and len(reminder_text) > 20 else reminder_text
+    
+    button_text = f"🕐 {format_datetime_short(reminder_time)}"
+    if text_preview:
+        button_text += f" - {text_preview}"
+    return button_text
+
+
 def get_reminders_keyboard(user_id: int) -> InlineKeyboardMarkup:
     """Создать клавиатуру со списком напоминаний"""
     builder = InlineKeyboardBuilder()
     
-    reminders = db_v2.get_user_reminders(user_id)
+    reminders = get_db().get_user_reminders(user_id)
     
     if not reminders:
         builder.add(InlineKeyboardButton(
             text="➕ Добавить напоминание",
-            callback_data="add_reminder_help"
+            callback_data=encode_callback(ACTION_ADD_HELP)
         ))
     else:
         # Добавляем кнопки для каждого напоминания
         for reminder_id, reminder_time, reminder_text in reminders:
-            time_str = format_datetime_short(reminder_time)
-            text_preview = reminder_text[:20] + "..." if reminder_text and len(reminder_text) > 20 else reminder_text
-            
-            button_text = f"🕐 {time_str}"
-            if text_preview:
-                button_text += f" - {text_preview}"
-            
             builder.add(InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"reminder_{reminder_id}"
+                text=_reminder_button_text(reminder_time, reminder_text),
+                callback_data=encode_callback(ACTION_REMINDER, reminder_id)
             ))
         
         # Кнопка добавления нового напоминания
         builder.add(InlineKeyboardButton(
             text="➕ Добавить еще",
-            callback_data="add_reminder_help"
+            callback_data=encode_callback(ACTION_ADD_HELP)
+        ))
+        builder.add(InlineKeyboardButton(
+            text="☑️ Выбрать для удаления",
+            callback_data=encode_callback(ACTION_BULK_SELECT)
         ))
     
     # Кнопка возврата в главное меню
     builder.add(InlineKeyboardButton(
         text="🔙 Назад",
-        callback_data="main_menu"
+        callback_data=encode_callback(ACTION_MAIN_MENU)
     ))
     
     builder.adjust(1)  # По одной кнопке в ряд
@@ -87,11 +166,11 @@ def get_reminder_detail_keyboard(reminder_id: int) -> InlineKeyboardMarkup:
     
     builder.add(InlineKeyboardButton(
         text="🗑️ Удалить",
-        callback_data=f"delete_{reminder_id}"
+        callback_data=encode_callback(ACTION_DELETE, reminder_id)
     ))
     builder.add(InlineKeyboardButton(
         text="🔙 К списку",
-        callback_data="show_reminders"
+        callback_data=encode_callback(ACTION_SHOW_REMINDERS)
     ))
     
     builder.adjust(1)
@@ -104,17 +183,62 @@ def get_delete_confirmation_keyboard(reminder_id: int) -> InlineKeyboardMarkup:
     
     builder.add(InlineKeyboardButton(
         text="✅ Да, удалить",
-        callback_data=f"confirm_delete_{reminder_id}"
+        callback_data=encode_callback(ACTION_CONFIRM_DELETE, reminder_id)
     ))
     builder.add(InlineKeyboardButton(
         text="❌ Отмена",
-        callback_data=f"reminder_{reminder_id}"
+        callback_data=encode_callback(ACTION_REMINDER, reminder_id)
     ))
     
     builder.adjust(2)  # По две кнопки в ряд
     return builder.as_markup()
 
 
+def get_delivered_reminder_keyboard(reminder_id: int, reminder_time) -> InlineKeyboardMarkup:
+    """Создать клавиатуру отправленного напоминания: кнопки "отложить" и главное меню"""
+    builder = InlineKeyboardBuilder()
+    builder.row(*(
+        InlineKeyboardButton(
+            text=f"⏰ {title}",
+            callback_data=encode_callback(ACTION_SNOOZE, reminder_id, option, epoch_minute(reminder_time))
+        )
+        for option, (title, _) in SNOOZE_OPTIONS.items()
+    ))
+    builder.attach(InlineKeyboardBuilder.from_markup(get_main_keyboard(keep_message=True)))
+    return builder.as_markup()
+
+
+def get_digest_keyboard(reminders: list) -> InlineKeyboardMarkup:
+    """
+    Создать клавиатуру сообщения с несколькими напоминаниями: "отложить все" и главное меню
+
+    Кнопки несут id и время каждого напоминания; если все не помещаются
+    в callback_data, откладываются первые из них.
+
+    Args:
+        reminders: Список (reminder_id, reminder_datetime) в порядке времени
+    """
+    builder = InlineKeyboardBuilder()
+    for count in range(len(reminders), 0, -1):
+        first_minute = min(epoch_minute(reminder_time) for _, reminder_time in reminders[:count])
+        pairs = []
+        for reminder_id, reminder_time in reminders[:count]:
+            pairs += [reminder_id, epoch_minute(reminder_time) - first_minute]
+        try:
+            builder.row(*(
+                InlineKeyboardButton(
+                    text=f"⏰ {title}",
+                    callback_data=encode_callback(ACTION_SNOOZE_ALL, option, first_minute, *pairs)
+                )
+                for option, (title, _) in SNOOZE_OPTIONS.items()
+            ))
+            break
+        except ValueError:
+            continue
+    builder.attach(InlineKeyboardBuilder.from_markup(get_main_keyboard(keep_message=True)))
+    return builder.as_markup()
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start"""
@@ -141,6 +265,9 @@ async def cmd_start(message: Message):
             reply_markup=get_main_keyboard(),
             parse_mode="HTML"
         )
+        # Пользователь мог раньше заблокировать бота: UserSettingsMiddleware уже снял отметку
+        # в базе и в кэше этого процесса, процесс рассылки сбрасывает свою копию по событию
+        reminder_events.publish(EVENT_USER, user_id=user_id)
         logger.info(f"Пользователь {user_id} запустил бота v2.0")
         
     except Exception as e:
@@ -151,7 +278,8 @@ async def cmd_start(message: Message):
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
     try:
-        await show_help(message.from_user.id, message.answer)
+        text, reply_markup = render_help()
+        await message.answer(text, reply_markup=reply_markup, parse_mode="HTML")
         logger.info(f"Пользователь {message.from_user.id} запросил помощь")
     except Exception as e:
         logger.error(f"Ошибка в обработчике /help: {e}")
@@ -161,49 +289,126 @@ async def cmd_help(message: Message):
 async def cmd_list_reminders(message: Message):
     """Обработчик команды /list или /reminders"""
     try:
-        await show_reminders_list(message.from_user.id, message.answer)
+        text, reply_markup = render_reminders_list(message.from_user.id)
+        await message.answer(text, reply_markup=reply_markup, parse_mode="HTML")
         logger.info(f"Пользователь {message.from_user.id} запросил список напоминаний")
     except Exception as e:
         logger.error(f"Ошибка в обработчике /list: {e}")
 
 
-@router.callback_query(F.data == "main_menu")
+def _markup_dump(reply_markup: InlineKeyboardMarkup = None):
+    """Клавиатура в виде словаря для сравнения (без служебных полей объектов aiogram)"""
+    return reply_markup.model_dump(exclude_none=True) if reply_markup else None
+
+
+async def show_screen(callback: CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup = None):
+    """
+    Показать экран навигации, отредактировав сообщение с кнопкой
+    
+    Если содержимое не изменилось, запрос к API не выполняется. Новое сообщение
+    отправляется, только если редактировать нельзя: сообщение недоступно
+    (слишком старое), Telegram отказал в редактировании или у кнопки стоит
+    флаг нового сообщения (encode_callback(..., new_message=True)).
+    
+    Args:
+        callback: Нажатие кнопки
+        text: Текст экрана (HTML)
+        reply_markup: Клавиатура экрана
+    """
+    message = callback.message
+    data = decode_callback(callback.data)
+    
+    if isinstance(message, Message) and not (data and data.new_message):
+        if message.html_text == text and _markup_dump(message.reply_markup) == _markup_dump(reply_markup):
+            return
+        
+        try:
+            await message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+            logger.debug(f"Не удалось отредактировать сообщение, отправляем новое: {e}")
+    
+    await callback.bot.send_message(
+        chat_id=callback.from_user.id,
+        text=text,
+        reply_markup=reply_markup,
+        parse_mode="HTML"
+    )
+
+
+def on_callback(action: int):
+    """Зарегистрировать обработчик кнопки с кодом действия action в CALLBACK_HANDLERS"""
+    def register(handler):
+        CALLBACK_HANDLERS[action] = handler
+        return handler
+    return register
+
+
+async def _answer_callback_error(callback: CallbackQuery):
+    """
+    Сообщить об ошибке обработки нажатия
+
+    Обработчики отвечают на нажатие до обновления экрана, поэтому при ошибке
+    на этапе показа ответ уже отправлен - повторный ответ Telegram отклонит.
+    """
+    try:
+        await callback.answer("Произошла ошибка")
+    except Exception as e:
+        logger.debug(f"Не удалось ответить на нажатие: {e}")
+
+
+@router.callback_query()
+async def callback_dispatch(callback: CallbackQuery):
+    """
+    Единая точка входа нажатий кнопок: разбор callback_data и выбор
+    обработчика по коду действия (один поиск в словаре на нажатие)
+    """
+    data = decode_callback(callback.data)
+    handler = CALLBACK_HANDLERS.get(data.action) if data else None
+    if handler is None:
+        logger.warning(f"Неизвестная кнопка от пользователя {callback.from_user.id}: {callback.data!r}")
+        await callback.answer("Кнопка устарела, откройте меню командой /start")
+        return
+    
+    await handler(callback, *data.args)
+
+
+@on_callback(ACTION_MAIN_MENU)
 async def callback_main_menu(callback: CallbackQuery):
     """Обработчик кнопки главного меню"""
     try:
-        await callback.message.answer(
-            "🏠 Главное меню\n\nВыберите действие:",
-            reply_markup=get_main_keyboard()
-        )
         await callback.answer()
+        await show_screen(callback, MAIN_MENU_TEXT, get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в callback main_menu: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data == "show_reminders")
+@on_callback(ACTION_SHOW_REMINDERS)
 async def callback_show_reminders(callback: CallbackQuery):
     """Обработчик кнопки показа напоминаний"""
     try:
-        await show_reminders_list_new_message(callback.from_user.id, callback.message.answer)
         await callback.answer()
+        await show_screen(callback, *render_reminders_list(callback.from_user.id))
     except Exception as e:
         logger.error(f"Ошибка в callback show_reminders: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data == "help")
+@on_callback(ACTION_HELP)
 async def callback_help(callback: CallbackQuery):
     """Обработчик кнопки помощи"""
     try:
-        await show_help_new_message(callback.from_user.id, callback.message.answer)
         await callback.answer()
+        await show_screen(callback, *render_help())
     except Exception as e:
         logger.error(f"Ошибка в callback help: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data == "add_reminder_help")
+@on_callback(ACTION_ADD_HELP)
 async def callback_add_reminder_help(callback: CallbackQuery):
     """Обработчик кнопки помощи по добавлению напоминания"""
     try:
@@ -221,29 +426,24 @@ async def callback_add_reminder_help(callback: CallbackQuery):
         builder = InlineKeyboardBuilder()
         builder.add(InlineKeyboardButton(
             text="🔙 К напоминаниям",
-            callback_data="show_reminders"
+            callback_data=encode_callback(ACTION_SHOW_REMINDERS)
         ))
         
-        await callback.message.edit_text(
-            help_text,
-            reply_markup=builder.as_markup(),
-            parse_mode="HTML"
-        )
         await callback.answer()
+        await show_screen(callback, help_text, builder.as_markup())
     except Exception as e:
         logger.error(f"Ошибка в callback add_reminder_help: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data.startswith("reminder_"))
-async def callback_reminder_detail(callback: CallbackQuery):
+@on_callback(ACTION_REMINDER)
+async def callback_reminder_detail(callback: CallbackQuery, reminder_id: int):
     """Обработчик кнопки детального просмотра напоминания"""
     try:
-        reminder_id = int(callback.data.split("_")[1])
         user_id = callback.from_user.id
         
         # Получаем информацию о напоминании
-        reminders = db_v2.get_user_reminders(user_id)
+        reminders = get_db().get_user_reminders(user_id)
         reminder_info = None
         
         for r_id, r_time, r_text in reminders:
@@ -265,60 +465,457 @@ async def callback_reminder_detail(callback: CallbackQuery):
         )
         
         if reminder_text:
-            detail_text += f"\n💬 Текст: {reminder_text}"
+            detail_text += f"\n💬 Текст: {html.escape(reminder_text)}"
         
-        await callback.message.edit_text(
-            detail_text,
-            reply_markup=get_reminder_detail_keyboard(reminder_id),
-            parse_mode="HTML"
-        )
         await callback.answer()
+        await show_screen(callback, detail_text, get_reminder_detail_keyboard(reminder_id))
         
     except Exception as e:
         logger.error(f"Ошибка в callback reminder_detail: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data.startswith("delete_"))
-async def callback_delete_reminder(callback: CallbackQuery):
+@on_callback(ACTION_DELETE)
+async def callback_delete_reminder(callback: CallbackQuery, reminder_id: int):
     """Обработчик кнопки удаления напоминания"""
     try:
-        reminder_id = int(callback.data.split("_")[1])
-        
-        await callback.message.edit_text(
+        await callback.answer()
+        await show_screen(
+            callback,
             f"🗑️ Удалить напоминание #{reminder_id}?\n\nЭто действие нельзя отменить.",
-            reply_markup=get_delete_confirmation_keyboard(reminder_id)
+            get_delete_confirmation_keyboard(reminder_id)
         )
-        await callback.answer()
         
     except Exception as e:
         logger.error(f"Ошибка в callback delete_reminder: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
 
 
-@router.callback_query(F.data.startswith("confirm_delete_"))
-async def callback_confirm_delete(callback: CallbackQuery):
+@on_callback(ACTION_CONFIRM_DELETE)
+async def callback_confirm_delete(callback: CallbackQuery, reminder_id: int):
     """Обработчик подтверждения удаления напоминания"""
     try:
-        reminder_id = int(callback.data.split("_")[2])
         user_id = callback.from_user.id
         
-        if db_v2.delete_reminder(reminder_id, user_id):
-            await callback.message.edit_text(
-                "✅ Напоминание удалено!",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                    InlineKeyboardButton(text="🔙 К списку", callback_data="show_reminders")
-                ]])
-            )
-            logger.info(f"Пользователь {user_id} удалил напоминание {reminder_id}")
-        else:
+        if not get_db().delete_reminder(reminder_id, user_id):
             await callback.answer("Не удалось удалить напоминание")
+            return
         
+        reminder_events.publish(EVENT_DELETED)
         await callback.answer()
+        await show_screen(
+            callback,
+            "✅ Напоминание удалено!",
+            InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="🔙 К списку", callback_data=encode_callback(ACTION_SHOW_REMINDERS))
+            ]])
+        )
+        logger.info(f"Пользователь {user_id} удалил напоминание {reminder_id}")
         
     except Exception as e:
         logger.error(f"Ошибка в callback confirm_delete: {e}")
-        await callback.answer("Произошла ошибка")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_SNOOZE)
+async def callback_snooze(callback: CallbackQuery, reminder_id: int, option: int, minute: int):
+    """Обработчик кнопок "отложить": напоминание переносится на новое время той же строкой"""
+    try:
+        if option not in SNOOZE_OPTIONS:
+            await callback.answer("Неизвестное действие")
+            return
+        
+        user_id = callback.from_user.id
+        reminder_time = minute_to_datetime(minute)
+        new_time = _snooze_time(option, reminder_time)
+        if not get_db().snooze_reminder(reminder_id, user_id, new_time, reminder_time):
+            await callback.answer("Не удалось отложить: напоминание уже отложено или на это время есть другое")
+            return
+        
+        reminder_events.publish(EVENT_ADDED, new_time)
+        await callback.answer(f"⏰ Напомню {format_datetime_short(new_time)}")
+        
+        # Кнопки "отложить" убираются, чтобы повторное нажатие не переносило напоминание еще раз
+        text = callback.message.html_text if isinstance(callback.message, Message) else "🔔 <b>Напоминание</b>"
+        await show_screen(
+            callback,
+            f"{text}\n\n⏰ Отложено на {format_datetime_short(new_time)}",
+            get_main_keyboard(keep_message=True)
+        )
+        logger.info(f"Пользователь {user_id} отложил напоминание {reminder_id}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback snooze: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_SNOOZE_ALL)
+async def callback_snooze_all(callback: CallbackQuery, option: int, minute: int, *pairs: int):
+    """Обработчик кнопок "отложить" под сообщением с несколькими напоминаниями (интервалы между ними сохраняются)"""
+    try:
+        if option not in SNOOZE_OPTIONS or not pairs or len(pairs) % 2:
+            await callback.answer("Неизвестное действие")
+            return
+        
+        user_id = callback.from_user.id
+        first_time = minute_to_datetime(minute)
+        first_new_time = _snooze_time(option, first_time)
+        snoozed = []
+        for reminder_id, offset in zip(pairs[::2], pairs[1::2]):
+            reminder_time = first_time + timedelta(minutes=offset)
+            if SNOOZE_OPTIONS[option][1] is None:
+                new_time = _snooze_time(option, reminder_time)
+            else:
+                new_time = first_new_time + timedelta(minutes=offset)
+            if get_db().snooze_reminder(reminder_id, user_id, new_time, reminder_time):
+                reminder_events.publish(EVENT_ADDED, new_time)
+                snoozed.append(new_time)
+        
+        if not snoozed:
+            await callback.answer("Не удалось отложить: напоминания уже отложены или на это время есть другие")
+            return
+        
+        await callback.answer(f"⏰ Отложено напоминаний: {len(snoozed)}")
+        
+        text = callback.message.html_text if isinstance(callback.message, Message) else "🔔 <b>Напоминания</b>"
+        await show_screen(
+            callback,
+            f"{text}\n\n⏰ Отложено напоминаний: {len(snoozed)}, первое - на {format_datetime_short(min(snoozed))}",
+            get_main_keyboard(keep_message=True)
+        )
+        logger.info(f"Пользователь {user_id} отложил напоминания: {len(snoozed)}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback snooze_all: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_SELECT)
+async def callback_bulk_select(callback: CallbackQuery):
+    """Обработчик кнопки выбора напоминаний для удаления (отмена на экране подтверждения сохраняет отметки)"""
+    try:
+        selected = _selected_reminder_ids(callback.message.reply_markup)
+        
+        await callback.answer()
+        await show_screen(callback, *render_bulk_select(callback.from_user.id, selected))
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_select: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_TOGGLE)
+async def callback_bulk_toggle(callback: CallbackQuery, reminder_id: int):
+    """Обработчик отметки напоминания на экране выбора"""
+    try:
+        selected = _selected_reminder_ids(callback.message.reply_markup) ^ {reminder_id}
+        
+        await callback.answer()
+        await show_screen(callback, *render_bulk_select(callback.from_user.id, selected))
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_toggle: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_DELETE_SELECTED)
+async def callback_bulk_delete_selected(callback: CallbackQuery):
+    """Обработчик кнопки "Удалить выбранные": запрос подтверждения"""
+    try:
+        selected = _selected_reminder_ids(callback.message.reply_markup)
+        text, keyboard = render_bulk_delete_confirmation(callback.from_user.id, selected)
+        if not keyboard:
+            await callback.answer("Отметьте напоминания для удаления")
+            return
+        
+        await callback.answer()
+        await show_screen(callback, text, keyboard)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_delete_selected: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_CONFIRM_SELECTED)
+async def callback_bulk_confirm_selected(callback: CallbackQuery):
+    """Обработчик подтверждения удаления отмеченных напоминаний (одним запросом к базе)"""
+    try:
+        selected = _selected_reminder_ids(callback.message.reply_markup)
+        if not selected:
+            await callback.answer("Отметьте напоминания для удаления")
+            return
+        
+        user_id = callback.from_user.id
+        deleted_count = get_db().delete_reminders(user_id, sorted(selected))
+        await _show_bulk_result(callback, deleted_count)
+        logger.info(f"Пользователь {user_id} удалил выбранные напоминания: {deleted_count}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_confirm_selected: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_ASK)
+async def callback_bulk_ask(callback: CallbackQuery, scope: int):
+    """Обработчик кнопок "Удалить все" и "Удалить сегодняшние": запрос подтверждения"""
+    try:
+        if scope not in BULK_SCOPES:
+            await callback.answer("Неизвестное действие")
+            return
+        
+        start_time, end_time = _bulk_scope_range(scope)
+        count = sum(
+            (start_time is None or start_time <= reminder_time) and (end_time is None or reminder_time < end_time)
+            for _, reminder_time, _ in get_db().get_user_reminders(callback.from_user.id)
+        )
+        if not count:
+            await callback.answer("Нечего удалять")
+            return
+        
+        builder = InlineKeyboardBuilder()
+        builder.add(InlineKeyboardButton(
+            text="✅ Да, удалить",
+            callback_data=encode_callback(ACTION_BULK_CONFIRM, scope)
+        ))
+        builder.add(InlineKeyboardButton(text="❌ Отмена", callback_data=encode_callback(ACTION_BULK_SELECT)))
+        builder.adjust(2)
+        
+        await callback.answer()
+        await show_screen(
+            callback,
+            f"🗑️ Удалить {BULK_SCOPES[scope]} ({count})?\n\nЭто действие нельзя отменить.",
+            builder.as_markup()
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_ask: {e}")
+        await _answer_callback_error(callback)
+
+
+@on_callback(ACTION_BULK_CONFIRM)
+async def callback_bulk_confirm(callback: CallbackQuery, scope: int):
+    """Обработчик подтверждения удаления всех/сегодняшних напоминаний"""
+    try:
+        if scope not in BULK_SCOPES:
+            await callback.answer("Неизвестное действие")
+            return
+        
+        user_id = callback.from_user.id
+        start_time, end_time = _bulk_scope_range(scope)
+        deleted_count = get_db().delete_reminders(user_id, start_time=start_time, end_time=end_time)
+        await _show_bulk_result(callback, deleted_count)
+        logger.info(f"Пользователь {user_id} удалил {BULK_SCOPES[scope]}: {deleted_count}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback bulk_confirm: {e}")
+        await _answer_callback_error(callback)
+
+
+async def _show_bulk_result(callback: CallbackQuery, deleted_count: int):
+    """Одно сообщение с итогом массового удаления"""
+    if deleted_count:
+        reminder_events.publish(EVENT_DELETED)
+        text = f"✅ Удалено напоминаний: {deleted_count}"
+    else:
+        text = "Напоминания уже удалены или отправлены"
+    
+    await callback.answer()
+    await show_screen(
+        callback,
+        text,
+        InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="🔙 К списку", callback_data=encode_callback(ACTION_SHOW_REMINDERS))
+        ]])
+    )
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    """Обработчик команды /export [csv|ics] [all]: выгрузка напоминаний файлом (all - вместе с отправленными)"""
+    path = None
+    try:
+        user_id = message.from_user.id
+        args = (command.args or "").lower().split()
+        include_sent = EXPORT_ALL in args
+        formats = [arg for arg in args if arg != EXPORT_ALL]
+        file_format = formats[0] if formats else FORMAT_CSV
+        if len(formats) > 1 or file_format not in FORMATS:
+            await message.answer(
+                "❌ Формат выгрузки: <code>/export csv</code> или <code>/export ics</code>, "
+                "с отправленными - <code>/export csv all</code>",
+                parse_mode="HTML"
+            )
+            return
+        
+        # Файл пишется в потоке пакетами, список напоминаний целиком в память не загружается
+        fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+        os.close(fd)
+        exported = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: export_reminders(get_db(), user_id, path, file_format, include_sent=include_sent)
+        )
+        
+        if not exported:
+            await message.answer("📋 У вас пока нет напоминаний для выгрузки", reply_markup=get_main_keyboard())
+            return
+        
+        await message.answer_document(
+            FSInputFile(path, filename=f"reminders.{file_format}"),
+            caption=f"📤 Выгружено напоминаний: {exported}"
+        )
+        logger.info(f"Пользователь {message.from_user.id} выгрузил {exported} напоминаний в {file_format}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /export: {e}")
+        await message.answer("❌ Не удалось выгрузить напоминания. Попробуйте позже.")
+    finally:
+        if path:
+            os.unlink(path)
+
+
+@router.message(Command("find"))
+async def cmd_find(message: Message, command: CommandObject):
+    """Обработчик команды /find <слова>: поиск по текстам напоминаний"""
+    try:
+        query = (command.args or "").strip()
+        if not query:
+            await message.answer(
+                "🔎 Что найти? Например: <code>/find молоко</code>",
+                parse_mode="HTML"
+            )
+            return
+        
+        text, keyboard = render_search_results(message.from_user.id, query)
+        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /find: {e}")
+        await message.answer("❌ Произошла ошибка")
+
+
+@on_callback(ACTION_SEARCH_PAGE)
+async def callback_search_page(callback: CallbackQuery, page: int):
+    """Обработчик кнопок страниц результатов поиска"""
+    try:
+        # Запрос может не поместиться в callback_data (64 байта) - берем его из заголовка экрана
+        query = _search_query_from_text(callback.message.text if isinstance(callback.message, Message) else None)
+        if query is None:
+            await callback.answer("Повторите поиск командой /find")
+            return
+        
+        await callback.answer()
+        await show_screen(callback, *render_search_results(callback.from_user.id, query, page))
+        
+    except Exception as e:
+        logger.error(f"Ошибка в callback search_page: {e}")
+        await _answer_callback_error(callback)
+
+
+@router.message(Command("broadcast"), F.from_user.id.in_(ADMIN_USER_IDS))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    """Обработчик команды /broadcast <текст> (только администраторы): объявление всем пользователям"""
+    try:
+        if not command.args:
+            # Без текста - состояние последних рассылок
+            broadcasts = get_db().get_broadcasts(limit=3)
+            if not broadcasts:
+                text = "📣 Рассылок пока не было\n\nОтправить: <code>/broadcast текст объявления</code>"
+            else:
+                text = "📣 <b>Последние рассылки</b>\n"
+                for broadcast in broadcasts:
+                    text += (
+                        f"\n#{broadcast['id']} ({broadcast['status']}): доставлено {broadcast['sent']}, "
+                        f"ошибок {broadcast['failed']}, заблокировали бота {broadcast['blocked']}"
+                    )
+            await message.answer(text, parse_mode="HTML")
+            return
+        
+        # Текст с форматированием, без самой команды
+        text = message.html_text.split(maxsplit=1)[1]
+        broadcast_id = get_db().create_broadcast(text, message.from_user.id)
+        if broadcast_id is None:
+            await message.answer("❌ Не удалось создать рассылку")
+            return
+        
+        # Рассылку отправляет процесс, в котором работает рассылка напоминаний
+        reminder_events.publish(EVENT_BROADCAST)
+        await message.answer(f"📣 Рассылка #{broadcast_id} запущена. Состояние: /broadcast")
+        logger.info(f"Администратор {message.from_user.id} запустил рассылку {broadcast_id}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /broadcast: {e}")
+        await message.answer("❌ Произошла ошибка")
+
+
+@router.message(Command("stats"), F.from_user.id.in_(ADMIN_USER_IDS))
+async def cmd_stats(message: Message):
+    """Обработчик команды /stats (только администраторы): сводная статистика бота"""
+    try:
+        # Счетчики ведутся при каждой записи, чтение не считает строки напоминаний
+        summary = await asyncio.get_running_loop().run_in_executor(None, get_db().get_stats_summary)
+        if not summary:
+            await message.answer("❌ Статистика недоступна")
+            return
+        await message.answer(render_stats(summary), parse_mode="HTML")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /stats: {e}")
+        await message.answer("❌ Произошла ошибка")
+
+
+@router.message(F.document)
+async def handle_import_document(message: Message):
+    """Обработчик файлов .csv/.ics: импорт напоминаний"""
+    path = None
+    try:
+        user_id = message.from_user.id
+        document = message.document
+        file_format = detect_format(document.file_name)
+        if file_format is None:
+            await message.answer(
+                "📎 Для импорта отправьте файл <code>.csv</code> (время;текст) или <code>.ics</code>",
+                parse_mode="HTML"
+            )
+            return
+        
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_MB * 1024 * 1024:
+            await message.answer(f"❌ Файл слишком большой (максимум {IMPORT_MAX_FILE_MB} МБ)")
+            return
+        
+        # Файл скачивается на диск по частям и разбирается построчно в потоке
+        fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+        os.close(fd)
+        telegram_file = await message.bot.get_file(document.file_id)
+        await message.bot.download_file(telegram_file.file_path, destination=path)
+        
+        report = await asyncio.get_running_loop().run_in_executor(
+            None, import_file, get_db(), user_id, path, file_format
+        )
+        
+        for reminder_time in report['wake_times']:
+            reminder_events.publish(EVENT_ADDED, reminder_time)
+        
+        response = f"📥 Импорт завершен\n\n✅ Добавлено напоминаний: {report['added']}"
+        if report['duplicates']:
+            response += f"\n🔁 Уже были в списке: {report['duplicates']}"
+        if report['past']:
+            response += f"\n⏰ Время уже прошло: {report['past']}"
+        if report['invalid']:
+            response += f"\n❌ Неверный формат: {report['invalid']}"
+        if report['failed']:
+            response += f"\n⚠️ Не удалось сохранить: {report['failed']}"
+        if report['truncated']:
+            response += f"\n✂️ Прочитаны только первые {IMPORT_MAX_ROWS} строк"
+        if report['error_lines']:
+            more = "..." if report['invalid'] + report['past'] > len(report['error_lines']) else ""
+            response += f"\n\nСтроки с ошибками: {', '.join(map(str, report['error_lines']))}{more}"
+        
+        await message.answer(response, reply_markup=get_main_keyboard(keep_message=True))
+        logger.info(f"Пользователь {user_id} импортировал {report['added']} напоминаний из {document.file_name}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка импорта файла: {e}")
+        await message.answer("❌ Не удалось импортировать файл. Попробуйте еще раз.", reply_markup=get_main_keyboard())
+    finally:
+        if path:
+            os.unlink(path)
 
 
 @router.message()
@@ -353,8 +950,12 @@ async def handle_text_message(message: Message):
             )
             return
         
-        # Сохраняем напоминание в базу данных
-        if db_v2.add_reminder(user_id, target_datetime):
+        # Сохраняем напоминание в базу данных (одной транзакцией с одновременными добавлениями)
+        saved = await add_reminder(user_id, target_datetime)
+        if saved:
+            _, count = saved
+            reminder_events.publish(EVENT_ADDED, target_datetime)
+            
             # Формируем ответ пользователю
             if is_today_only:
                 response = f"✅ Напоминание добавлено на сегодня в {format_time_for_user(target_datetime)}!"
@@ -362,10 +963,9 @@ async def handle_text_message(message: Message):
                 response = f"✅ Напоминание добавлено на {format_datetime_for_user(target_datetime)} в {format_time_for_user(target_datetime)}!"
             
             # Показываем количество напоминаний
-            count = db_v2.get_reminders_count(user_id)
             response += f"\n\n📊 У вас {count} активных напоминаний"
             
-            await message.answer(response, reply_markup=get_main_keyboard())
+            await message.answer(response, reply_markup=get_main_keyboard(keep_message=True))
             logger.info(f"Установлено напоминание для пользователя {user_id} на {target_datetime}")
         else:
             await message.answer(
@@ -385,9 +985,14 @@ async def handle_text_message(message: Message):
             logger.error(f"Не удалось отправить сообщение об ошибке: {send_error}")
 
 
-async def show_reminders_list(user_id: int, edit_func):
-    """Показать список напоминаний пользователя"""
-    reminders = db_v2.get_user_reminders(user_id)
+def render_reminders_list(user_id: int):
+    """
+    Экран со списком напоминаний пользователя
+    
+    Returns:
+        tuple: (текст, клавиатура)
+    """
+    reminders = get_db().get_user_reminders(user_id)
     
     if not reminders:
         text = (
@@ -405,81 +1010,174 @@ async def show_reminders_list(user_id: int, edit_func):
             text += f"{i}. 🕐 {time_str}\n"
             text += f"   ⏳ {until_str}\n"
             if reminder_text:
-                text += f"   💬 {reminder_text}\n"
+                text += f"   💬 {html.escape(reminder_text)}\n"
             text += "\n"
     
-    await edit_func(
-        text,
-        reply_markup=get_reminders_keyboard(user_id),
-        parse_mode="HTML"
-    )
+    return text, get_reminders_keyboard(user_id)
 
 
-async def show_help(user_id: int, edit_func):
-    """Показать справку"""
-    help_text = (
-        "ℹ️ <b>Справка по боту-напоминалке v2.0</b>\n\n"
-        "📝 <b>Поддерживаемые форматы:</b>\n"
-        "• <code>18:00</code> - напоминание на сегодня\n"
-        "• <code>18:00 12.06</code> - 12 июня текущего года\n"
-        "• <code>18:00 12.06.25</code> - 12 июня 2025 года\n"
-        "• <code>18:00 12.06.2025</code> - полный формат\n\n"
-        "✨ <b>Возможности:</b>\n"
-        "• Неограниченное количество напоминаний\n"
-        "• Удобное управление через кнопки\n"
-        "• Автоматическое определение года\n"
-        "• Все время по Омску (+6 UTC)\n\n"
-        "🔧 <b>Команды:</b>\n"
-        "• /start - главное меню\n"
-        "• /list - список напоминаний\n"
-        "• /help - эта справка"
-    )
+def _selected_reminder_ids(reply_markup: Optional[InlineKeyboardMarkup]) -> set:
+    """ID напоминаний, отмеченных на экране выбора (по клавиатуре сообщения)"""
+    if not reply_markup:
+        return set()
+    selected = set()
+    for row in reply_markup.inline_keyboard:
+        for button in row:
+            if not button.text.startswith(CHECKBOX_ON):
+                continue
+            data = decode_callback(button.callback_data)
+            if data and data.action == ACTION_BULK_TOGGLE:
+                selected.add(data.args[0])
+    return selected
+
+
+def _snooze_time(option: int, reminder_time):
+    """Новое время отложенного напоминания (с точностью до минуты)"""
+    now = get_current_omsk_time().replace(second=0, microsecond=0)
+    _, delay = SNOOZE_OPTIONS[option]
+    if delay is not None:
+        return now + delay
+    return (now + timedelta(days=1)).replace(hour=reminder_time.hour, minute=reminder_time.minute)
+
+
+def _bulk_scope_range(scope: int):
+    """Границы времени (start_time, end_time) напоминаний для удаления: все или на сегодня"""
+    if scope != BULK_SCOPE_TODAY:
+        return None, None
+    start_time = get_current_omsk_time().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start_time, start_time + timedelta(days=1)
+
+
+def render_bulk_select(user_id: int, selected: set):
+    """
+    Экран выбора напоминаний для удаления
+    
+    Args:
+        user_id: ID пользователя
+        selected: ID отмеченных напоминаний
+        
+    Returns:
+        tuple: (текст, клавиатура)
+    """
+    reminders = get_db().get_user_reminders(user_id)
+    selected = selected & {reminder_id for reminder_id, _, _ in reminders}
     
     builder = InlineKeyboardBuilder()
-    builder.add(InlineKeyboardButton(
-        text="🔙 Главное меню",
-        callback_data="main_menu"
-    ))
+    for reminder_id, reminder_time, reminder_text in reminders:
+        mark = CHECKBOX_ON if reminder_id in selected else CHECKBOX_OFF
+        builder.row(InlineKeyboardButton(
+            text=f"{mark} {_reminder_button_text(reminder_time, reminder_text)}",
+            callback_data=encode_callback(ACTION_BULK_TOGGLE, reminder_id)
+        ))
     
-    await edit_func(
-        help_text,
-        reply_markup=builder.as_markup(),
-        parse_mode="HTML"
-    )
-
+    if selected:
+        builder.row(InlineKeyboardButton(
+            text=f"🗑️ Удалить выбранные ({len(selected)})",
+            callback_data=encode_callback(ACTION_BULK_DELETE_SELECTED)
+        ))
+    if reminders:
+        builder.row(
+            InlineKeyboardButton(
+                text="🗑️ Удалить сегодняшние",
+                callback_data=encode_callback(ACTION_BULK_ASK, BULK_SCOPE_TODAY)
+            ),
+            InlineKeyboardButton(text="🗑️ Удалить все", callback_data=encode_callback(ACTION_BULK_ASK, BULK_SCOPE_ALL))
+        )
+    builder.row(InlineKeyboardButton(text="🔙 К списку", callback_data=encode_callback(ACTION_SHOW_REMINDERS)))
+    
+    if not reminders:
+        text = "📋 У вас пока нет напоминаний"
+    else:
+        text = f"☑️ Отметьте напоминания для удаления\n\nВыбрано: {len(selected)} из {len(reminders)}"
+    return text, builder.as_markup()
 
-async def show_reminders_list_new_message(user_id: int, send_func):
-    """Показать список напоминаний пользователя в новом сообщении"""
-    reminders = db_v2.get_user_reminders(user_id)
 
+def render_bulk_delete_confirmation(user_id: int, selected: set):
+    """
+    Экран подтверждения удаления отмеченных напоминаний
+    
+    Отмеченные напоминания остаются кнопками с отметкой: по ним кнопка
+    подтверждения узнает, что удалять, а нажатие на напоминание или отмена
+    возвращают к экрану выбора с теми же отметками.
+    
+    Args:
+        user_id: ID пользователя
+        selected: ID отмеченных напоминаний
+        
+    Returns:
+        tuple: (текст, клавиатура) или (None, None), если отмеченных напоминаний нет
+    """
+    reminders = [reminder for reminder in get_db().get_user_reminders(user_id) if reminder[0] in selected]
     if not reminders:
-        text = (
-            "📋 У вас пока нет напоминаний\n\n"
-            "Чтобы добавить напоминание, просто напишите время и дату.\n"
-            "Например: <code>18:00 12.06</code>"
-        )
-    else:
-        text = f"📋 Ваши напоминания ({len(reminders)}):\n\n"
+        return None, None
+    
+    builder = InlineKeyboardBuilder()
+    for reminder_id, reminder_time, reminder_text in reminders:
+        builder.row(InlineKeyboardButton(
+            text=f"{CHECKBOX_ON} {_reminder_button_text(reminder_time, reminder_text)}",
+            callback_data=encode_callback(ACTION_BULK_TOGGLE, reminder_id)
+        ))
+    builder.row(
+        InlineKeyboardButton(text="✅ Да, удалить", callback_data=encode_callback(ACTION_BULK_CONFIRM_SELECTED)),
+        InlineKeyboardButton(text="❌ Отмена", callback_data=encode_callback(ACTION_BULK_SELECT))
+    )
+    
+    text = f"🗑️ Удалить выбранные напоминания ({len(reminders)})?\n\nЭто действие нельзя отменить."
+    return text, builder.as_markup()
 
-        for i, (reminder_id, reminder_time, reminder_text) in enumerate(reminders, 1):
-            time_str = format_datetime_short(reminder_time)
-            until_str = get_time_until_reminder(reminder_time)
 
-            text += f"{i}. 🕐 {time_str}\n"
-            text += f"   ⏳ {until_str}\n"
-            if reminder_text:
-                text += f"   💬 {reminder_text}\n"
-            text += "\n"
+def _search_query_from_text(text: Optional[str]) -> Optional[str]:
+    """Запрос из заголовка экрана результатов ("🔎 Поиск «...»")"""
+    if not text or "«" not in text:
+        return None
+    return text.split("«", 1)[1].rsplit("»", 1)[0] or None
 
-    await send_func(
-        text,
-        reply_markup=get_reminders_keyboard(user_id),
-        parse_mode="HTML"
-    )
+
+def render_search_results(user_id: int, query: str, page: int = 0):
+    """
+    Экран результатов поиска /find (страница page)
+    
+    Returns:
+        tuple: (текст, клавиатура)
+    """
+    page = max(0, page)
+    # Лишний результат показывает, есть ли следующая страница
+    results = get_db().search_reminders(user_id, query, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE)
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+    
+    builder = InlineKeyboardBuilder()
+    title = f"🔎 Поиск «{html.escape(query)}»"
+    if not results:
+        text = f"{title}\n\nНичего не найдено" if page == 0 else f"{title}\n\nБольше результатов нет"
+    else:
+        text = f"{title}, страница {page + 1}:\n\n"
+        for i, (reminder_id, reminder_time, reminder_text) in enumerate(results, page * SEARCH_PAGE_SIZE + 1):
+            text += f"{i}. 🕐 {format_datetime_short(reminder_time)}\n   💬 {html.escape(reminder_text)}\n\n"
+            builder.row(InlineKeyboardButton(
+                text=f"🕐 {format_datetime_short(reminder_time)} - {reminder_text[:20]}",
+                callback_data=encode_callback(ACTION_REMINDER, reminder_id)
+            ))
+    
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=encode_callback(ACTION_SEARCH_PAGE, page - 1)))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=encode_callback(ACTION_SEARCH_PAGE, page + 1)))
+    if navigation:
+        builder.row(*navigation)
+    builder.row(InlineKeyboardButton(text="🔙 Главное меню", callback_data=encode_callback(ACTION_MAIN_MENU)))
+    
+    return text, builder.as_markup()
 
 
-async def show_help_new_message(user_id: int, send_func):
-    """Показать справку в новом сообщении"""
+def render_help():
+    """
+    Экран справки
+    
+    Returns:
+        tuple: (текст, клавиатура)
+    """
     help_text = (
         "ℹ️ <b>Справка по боту-напоминалке v2.0</b>\n\n"
         "📝 <b>Поддерживаемые форматы:</b>\n"
@@ -490,28 +1188,74 @@ async def show_help_new_message(user_id: int, send_func):
         "✨ <b>Возможности:</b>\n"
         "• Неограниченное количество напоминаний\n"
         "• Удобное управление через кнопки\n"
+        "• Удаление нескольких напоминаний сразу (☑️ в списке)\n"
         "• Автоматическое определение года\n"
         "• Все время по Омску (+6 UTC)\n\n"
         "🔧 <b>Команды:</b>\n"
         "• /start - главное меню\n"
         "• /list - список напоминаний\n"
-        "• /help - эта справка"
+        "• /find слова - поиск по текстам напоминаний\n"
+        "• /export - выгрузить напоминания (<code>/export ics</code> - для календаря, <code>all</code> - с отправленными)\n"
+        "• /help - эта справка\n\n"
+        "📎 Отправьте файл <code>.csv</code> (время;текст) или <code>.ics</code>, чтобы импортировать напоминания"
     )
-
+    
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(
         text="🔙 Главное меню",
-        callback_data="main_menu"
+        callback_data=encode_callback(ACTION_MAIN_MENU)
     ))
+    
+    return help_text, builder.as_markup()
 
-    await send_func(
-        help_text,
-        reply_markup=builder.as_markup(),
-        parse_mode="HTML"
+
+def render_stats(summary: dict) -> str:
+    """
+    Текст сводной статистики для /stats
+    
+    Args:
+        summary: Результат get_stats_summary
+        
+    Returns:
+        str: Текст сообщения (HTML)
+    """
+    now = get_current_omsk_time()
+    hourly = summary.get('hourly', {})
+    last_hour = hourly.get(now.strftime(STATS_HOUR_FORMAT), {})
+    day = {
+        key: sum(values[key] for values in hourly.values())
+        for key in ('created', 'sent', 'deleted', 'failed')
+    }
+    
+    if summary.get('started_at'):
+        uptime = int(now.timestamp()) - summary['started_at']
+        uptime_str = f"{uptime // 86400} д {uptime % 86400 // 3600} ч {uptime % 3600 // 60} мин"
+    else:
+        uptime_str = "нет данных"
+    
+    text = (
+        "📊 <b>Статистика бота</b>\n\n"
+        f"⏱ Работает: {uptime_str}\n"
+        f"👥 Активных пользователей: {summary.get('active_users', 0)}\n"
+        f"⏳ Ожидают отправки: {summary.get('pending', 0)}\n"
+        f"✅ Отправлено всего: {summary.get('sent_total', 0)}\n"
+        f"❌ Ошибок доставки: {summary.get('failed_total', 0)}\n\n"
+        f"<b>За текущий час:</b> создано {last_hour.get('created', 0)}, "
+        f"отправлено {last_hour.get('sent', 0)}, удалено {last_hour.get('deleted', 0)}\n"
+        f"<b>За 24 часа:</b> создано {day['created']}, отправлено {day['sent']}, "
+        f"удалено {day['deleted']}, ошибок {day['failed']}\n"
     )
+    if last_hour.get('sent'):
+        text += (
+            f"\n🐢 Задержка доставки за час: в среднем {last_hour['lag_sum'] / last_hour['sent']:.1f} с, "
+            f"максимум {last_hour['lag_max']:.1f} с"
+        )
+    return text
 
 
-async def send_reminder_to_user_v2(bot, user_id: int, reminder_datetime, reminder_text: str = None):
+async def send_reminder_to_user_v2(
+    bot, user_id: int, reminder_datetime, reminder_text: str = None, reminder_id: int = None
+):
     """
     Отправить напоминание пользователю (версия 2.0)
 
@@ -520,21 +1264,96 @@ async def send_reminder_to_user_v2(bot, user_id: int, reminder_datetime, reminde
         user_id: ID пользователя
         reminder_datetime: Время напоминания
         reminder_text: Дополнительный текст напоминания
+        reminder_id: ID напоминания (для кнопок "отложить")
     """
     try:
         base_text = f"🔔 <b>Напоминание!</b>\n📅 {format_datetime_for_user(reminder_datetime)} в {format_time_for_user(reminder_datetime)}"
 
         if reminder_text:
-            base_text += f"\n\n💬 {reminder_text}"
+            base_text += f"\n\n💬 {html.escape(reminder_text)}"
+
+        if reminder_id is not None:
+            reply_markup = get_delivered_reminder_keyboard(reminder_id, reminder_datetime)
+        else:
+            reply_markup = get_main_keyboard(keep_message=True)
 
         await bot.send_message(
             chat_id=user_id,
             text=base_text,
             parse_mode="HTML",
-            reply_markup=get_main_keyboard()
+            reply_markup=reply_markup
         )
         logger.info(f"Отправлено напоминание пользователю {user_id}")
 
     except Exception as e:
         logger.error(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
         raise
+
+
+async def send_reminders_digest_to_user(bot, user_id: int, reminders: list, reminder_ids: list = None):
+    """
+    Отправить несколько одновременно наступивших напоминаний одним сообщением
+
+    Args:
+        bot: Экземпляр бота
+        user_id: ID пользователя
+        reminders: Список (reminder_datetime, reminder_text) в порядке времени
+        reminder_ids: ID напоминаний в том же порядке (для кнопок "отложить")
+    """
+    text = f"🔔 <b>Напоминания ({len(reminders)})</b>\n"
+
+    for reminder_datetime, reminder_text in reminders:
+        text += f"\n📅 {format_datetime_for_user(reminder_datetime)} в {format_time_for_user(reminder_datetime)}"
+        if reminder_text:
+            text += f"\n💬 {html.escape(reminder_text)}"
+        text += "\n"
+
+    if reminder_ids:
+        reply_markup = get_digest_keyboard(list(zip(reminder_ids, (reminder[0] for reminder in reminders))))
+    else:
+        reply_markup = get_main_keyboard(keep_message=True)
+
+    await bot.send_message(
+        chat_id=user_id,
+        text=text,
+        parse_mode="HTML",
+        reply_markup=reply_markup
+    )
+    logger.info(f"Отправлено {len(reminders)} напоминаний одним сообщением пользователю {user_id}")
+
+
+async def send_missed_summary_to_user(
+    bot, user_id: int, missed_count: int, samples: list, sample_ids: list = None
+):
+    """
+    Отправить одно сводное сообщение о напоминаниях, пропущенных за время простоя
+
+    Args:
+        bot: Экземпляр бота
+        user_id: ID пользователя
+        missed_count: Общее количество пропущенных напоминаний
+        samples: Первые несколько пропущенных (reminder_datetime, reminder_text)
+        sample_ids: ID напоминаний из samples (кнопки "отложить" переносят их)
+    """
+    text = f"🔕 <b>Пока бот был недоступен, прошло напоминаний: {missed_count}</b>\n"
+
+    for reminder_datetime, reminder_text in samples:
+        text += f"\n• {format_datetime_short(reminder_datetime)}"
+        if reminder_text:
+            text += f" - {html.escape(reminder_text)}"
+
+    if missed_count > len(samples):
+        text += f"\n\n...и еще {missed_count - len(samples)}"
+
+    if sample_ids:
+        reply_markup = get_digest_keyboard(list(zip(sample_ids, (sample[0] for sample in samples))))
+    else:
+        reply_markup = get_main_keyboard(keep_message=True)
+
+    await bot.send_message(
+        chat_id=user_id,
+        text=text,
+        parse_mode="HTML",
+        reply_markup=reply_markup
+    )
+    logger.info(f"Отправлена сводка пропущенных напоминаний пользователю {user_id}")
@@ -0,0 +1,491 @@
+"""
+Фоновое обслуживание базы данных напоминаний
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from clock import get_clock
+from config import (
+    DB_CLEANUP_DAYS,
+    RETENTION_INTERVAL_MINUTES,
+    RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE_MS,
+    DB_MAINTENANCE_INTERVAL_MINUTES,
+    DB_ANALYZE_INTERVAL_HOURS,
+    DB_MAINTENANCE_QUIET_HOURS,
+    DB_VACUUM_PAGES_PER_STEP,
+    DB_VACUUM_MAX_PAGES,
+    DB_VACUUM_STEP_PAUSE_MS,
+    DB_BACKUP_INTERVAL_HOURS,
+    DB_BACKUP_DIR,
+    DB_BACKUP_KEEP,
+    DB_BACKUP_PAGES_PER_STEP,
+    DB_BACKUP_STEP_PAUSE_MS,
+    CREATE_BACKUP
+)
+from database import AUTO_VACUUM_INCREMENTAL
+
+logger = logging.getLogger(__name__)
+
+# Метка времени в именах файлов резервных копий: backup_20250612_180000.db
+BACKUP_STAMP_FORMAT = '%Y%m%d_%H%M%S'
+BACKUP_STAMP_LENGTH = len('20250612_180000')
+
+# Сколько раз пошаговая копия может начаться заново из-за записи в базу
+BACKUP_MAX_RESTARTS = 3
+
+
+class RetentionJob:
+    """Инкрементальная очистка старых отправленных напоминаний"""
+
+    def __init__(
+        self,
+        database,
+        days_old: int = DB_CLEANUP_DAYS,
+        interval_minutes: int = RETENTION_INTERVAL_MINUTES,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        batch_pause_ms: int = RETENTION_BATCH_PAUSE_MS,
+        stats: Optional[dict] = None,
+        clock=None
+    ):
+        """
+        Args:
+            database: База данных напоминаний
+            days_old: Количество дней хранения отправленных напоминаний
+            interval_minutes: Интервал между запусками очистки
+            batch_size: Размер диапазона id в одной транзакции
+            batch_pause_ms: Пауза между пакетами, чтобы не мешать записи
+            stats: Словарь статистики бота (необязательно)
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.db = database
+        self.days_old = days_old
+        self.interval_minutes = interval_minutes
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause_ms / 1000
+        self.stats = stats
+        self.clock = clock or get_clock()
+        self.last_report: Optional[dict] = None
+        self._running = False
+
+    async def run_once(self) -> dict:
+        """
+        Один проход очистки по всей таблице диапазонами id
+
+        Returns:
+            dict: Отчет {'deleted', 'archived', 'partitions_dropped', 'batches', 'seconds'}
+        """
+        started = time.perf_counter()
+        deleted_count = 0
+        archived_count = 0
+        partitions_dropped = 0
+        batches = 0
+
+        cutoff_time = self.db.get_retention_cutoff(self.days_old)
+        id_range = self.db.get_id_range()
+        if id_range:
+            min_id, max_id = id_range
+
+            for start_id in range(min_id, max_id + 1, self.batch_size):
+                end_id = start_id + self.batch_size
+                deleted_count += self.db.delete_sent_reminders_in_range(start_id, end_id, cutoff_time)
+                if self.db.history_enabled:
+                    # Отправленные до включения истории строки тоже переносим в файлы истории
+                    archived_count += self.db.archive_sent_reminders_in_range(start_id, end_id)
+                batches += 1
+                # Отдаем управление обработчикам и планировщику между пакетами
+                await self.clock.sleep(self.batch_pause)
+
+        if self.db.history_enabled:
+            # История хранится помесячными файлами: старые месяцы удаляются целиком
+            partitions_dropped = self.db.drop_history_partitions(cutoff_time)
+
+        report = {
+            'deleted': deleted_count,
+            'archived': archived_count,
+            'partitions_dropped': partitions_dropped,
+            'batches': batches,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+        self.last_report = report
+
+        if self.stats is not None:
+            self.stats['reminders_cleaned'] = self.stats.get('reminders_cleaned', 0) + deleted_count
+
+        logger.info(
+            f"Очистка старых напоминаний: удалено {report['deleted']}, "
+            f"перенесено в историю {report['archived']}, удалено файлов истории {report['partitions_dropped']} "
+            f"за {report['seconds']} с (пакетов: {report['batches']})"
+        )
+        return report
+
+    async def run(self):
+        """Фоновая задача: очистка раз в interval_minutes"""
+        self._running = True
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка очистки старых напоминаний: {e}")
+
+            await self.clock.sleep(self.interval_minutes * 60)
+
+    def stop(self):
+        self._running = False
+
+
+def _parse_hours_range(value: str) -> Tuple[int, int]:
+    """Диапазон часов "3-5" -> (3, 5); конец не включается, "23-2" переходит через полночь"""
+    start, end = (int(part) for part in value.split('-', 1))
+    return start % 24, end % 24
+
+
+class MaintenanceJob:
+    """
+    Регулярное обслуживание файлов базы без остановки записи
+
+    Каждый проход: PRAGMA optimize и checkpoint WAL, раз в analyze_interval_hours -
+    полный ANALYZE. В тихие часы свободные страницы возвращаются файловой
+    системе через PRAGMA incremental_vacuum короткими транзакциями с паузами,
+    а WAL обрезается (TRUNCATE) - вместо VACUUM, который переписывает весь файл.
+    """
+
+    def __init__(
+        self,
+        database,
+        interval_minutes: int = DB_MAINTENANCE_INTERVAL_MINUTES,
+        analyze_interval_hours: int = DB_ANALYZE_INTERVAL_HOURS,
+        quiet_hours: str = DB_MAINTENANCE_QUIET_HOURS,
+        vacuum_pages_per_step: int = DB_VACUUM_PAGES_PER_STEP,
+        vacuum_max_pages: int = DB_VACUUM_MAX_PAGES,
+        vacuum_pause_ms: int = DB_VACUUM_STEP_PAUSE_MS,
+        stats: Optional[dict] = None,
+        clock=None
+    ):
+        """
+        Args:
+            database: База данных напоминаний (все файлы из get_file_databases)
+            interval_minutes: Интервал между проходами
+            analyze_interval_hours: Как часто выполнять полный ANALYZE
+            quiet_hours: Часы по Омску для возврата свободных страниц, например "3-5"
+            vacuum_pages_per_step: Страниц за одну транзакцию incremental_vacuum
+            vacuum_max_pages: Максимум страниц за проход
+            vacuum_pause_ms: Пауза между транзакциями incremental_vacuum
+            stats: Словарь статистики бота (необязательно)
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.db = database
+        self.interval_minutes = interval_minutes
+        self.analyze_interval = analyze_interval_hours * 3600
+        self.quiet_start, self.quiet_end = _parse_hours_range(quiet_hours)
+        self.vacuum_pages_per_step = vacuum_pages_per_step
+        self.vacuum_max_pages = vacuum_max_pages
+        self.vacuum_pause = vacuum_pause_ms / 1000
+        self.stats = stats
+        self.clock = clock or get_clock()
+        self.last_report: Optional[dict] = None
+        self._last_analyze = None
+        self._running = False
+
+    def is_quiet_time(self) -> bool:
+        """Сейчас тихие часы"""
+        hour = self.clock.now().hour
+        if self.quiet_start <= self.quiet_end:
+            return self.quiet_start <= hour < self.quiet_end
+        return hour >= self.quiet_start or hour < self.quiet_end
+
+    async def run_once(self, force_vacuum: bool = False) -> dict:
+        """
+        Один проход обслуживания по всем файлам базы
+
+        Args:
+            force_vacuum: Возвращать свободные страницы и вне тихих часов
+
+        Returns:
+            dict: Отчет {'size_bytes_before', 'size_bytes', 'freelist_before', 'freelist_pages',
+                'wal_bytes', 'pages_vacuumed', 'analyzed', 'seconds'}
+        """
+        started = time.perf_counter()
+        now = self.clock.now()
+        quiet = force_vacuum or self.is_quiet_time()
+        analyze = self._last_analyze is None or (now - self._last_analyze).total_seconds() >= self.analyze_interval
+        loop = asyncio.get_running_loop()
+
+        report = {
+            'size_bytes_before': 0,
+            'size_bytes': 0,
+            'freelist_before': 0,
+            'freelist_pages': 0,
+            'wal_bytes': 0,
+            'pages_vacuumed': 0,
+            'analyzed': analyze,
+            'seconds': 0.0
+        }
+
+        # Все обращения к файлам базы выполняем в потоке, чтобы не останавливать обработчики
+        for database in self.db.get_file_databases():
+            before = await loop.run_in_executor(None, database.get_storage_info)
+            report['size_bytes_before'] += before['size_bytes']
+            report['freelist_before'] += before['freelist_pages']
+
+            # ANALYZE читает все индексы
+            await loop.run_in_executor(None, database.optimize, analyze)
+
+            # В файле без auto_vacuum = INCREMENTAL страницы возвращает только полный VACUUM
+            if quiet and before['freelist_pages'] and before['auto_vacuum'] == AUTO_VACUUM_INCREMENTAL:
+                vacuumed = 0
+                while vacuumed < self.vacuum_max_pages:
+                    pages = min(self.vacuum_pages_per_step, self.vacuum_max_pages - vacuumed)
+                    freed = await loop.run_in_executor(None, database.incremental_vacuum, pages)
+                    if not freed:
+                        break
+                    vacuumed += freed
+                    # Между транзакциями запись в базу проходит без ожидания
+                    await self.clock.sleep(self.vacuum_pause)
+                report['pages_vacuumed'] += vacuumed
+
+            await loop.run_in_executor(None, database.checkpoint, 'TRUNCATE' if quiet else 'PASSIVE')
+
+            after = await loop.run_in_executor(None, database.get_storage_info)
+            report['size_bytes'] += after['size_bytes']
+            report['freelist_pages'] += after['freelist_pages']
+            report['wal_bytes'] += after['wal_bytes']
+
+        if analyze:
+            self._last_analyze = now
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        self.last_report = report
+
+        if self.stats is not None:
+            self.stats['db_pages_vacuumed'] = self.stats.get('db_pages_vacuumed', 0) + report['pages_vacuumed']
+
+        logger.info(
+            f"Обслуживание базы: размер {report['size_bytes_before']} -> {report['size_bytes']} байт, "
+            f"свободных страниц {report['freelist_before']} -> {report['freelist_pages']}, "
+            f"WAL {report['wal_bytes']} байт, ANALYZE: {'да' if analyze else 'нет'}, "
+            f"за {report['seconds']} с"
+        )
+        return report
+
+    async def run(self):
+        """Фоновая задача: обслуживание раз в interval_minutes"""
+        self._running = True
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания базы данных: {e}")
+
+            await self.clock.sleep(self.interval_minutes * 60)
+
+    def stop(self):
+        self._running = False
+
+
+class _BackupRestarted(Exception):
+    """Пошаговая копия слишком часто начиналась заново"""
+
+
+class BackupService:
+    """
+    Резервное копирование базы через SQLite backup API
+
+    Копия снимается по pages_per_step страниц с паузой между шагами в
+    отдельном потоке: запись в базу ждет не дольше одного шага, а цикл
+    событий не блокируется. Файл копии сначала пишется как .part и
+    переименовывается только после успешного завершения, поэтому в
+    директории копий не бывает недописанных файлов.
+    """
+
+    def __init__(
+        self,
+        database,
+        backup_dir: str = DB_BACKUP_DIR,
+        interval_hours: float = DB_BACKUP_INTERVAL_HOURS,
+        keep: int = DB_BACKUP_KEEP,
+        pages_per_step: int = DB_BACKUP_PAGES_PER_STEP,
+        step_pause_ms: int = DB_BACKUP_STEP_PAUSE_MS,
+        max_restarts: int = BACKUP_MAX_RESTARTS,
+        on_start: bool = CREATE_BACKUP,
+        stats: Optional[dict] = None,
+        clock=None
+    ):
+        """
+        Args:
+            database: База данных напоминаний (все ее файлы из get_file_paths)
+            backup_dir: Директория копий
+            interval_hours: Интервал между копиями
+            keep: Сколько последних копий хранить
+            pages_per_step: Страниц базы за один шаг копирования
+            step_pause_ms: Пауза между шагами, чтобы не мешать записи
+            max_restarts: Сколько перезапусков пошаговой копии допустимо до копирования одним шагом
+            on_start: Создать копию сразу при запуске
+            stats: Словарь статистики бота (необязательно)
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.db = database
+        self.backup_dir = Path(backup_dir)
+        self.interval_hours = interval_hours
+        self.keep = max(1, keep)
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause_ms / 1000
+        self.max_restarts = max_restarts
+        self.on_start = on_start
+        self.stats = stats
+        self.clock = clock or get_clock()
+        self.last_report: Optional[dict] = None
+        self._running = False
+
+    async def backup_once(self) -> dict:
+        """
+        Создать копию всех файлов базы и удалить старые копии
+
+        Returns:
+            dict: Отчет {'files', 'pages', 'steps', 'restarts', 'size_bytes', 'removed', 'seconds'}
+        """
+        started = time.perf_counter()
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        stamp = self.clock.now().strftime(BACKUP_STAMP_FORMAT)
+
+        files = []
+        pages = 0
+        steps = 0
+        restarts = 0
+        size_bytes = 0
+        loop = asyncio.get_running_loop()
+        for source in self.db.get_file_paths():
+            # reminders.db -> backup_<время>.db, reminders.shard0.db -> backup_<время>.shard0.db
+            target = self.backup_dir / f"backup_{stamp}{''.join(Path(source).suffixes)}"
+            file_pages, file_steps, file_restarts = await loop.run_in_executor(None, self._copy, source, target)
+            files.append(str(target))
+            pages += file_pages
+            steps += file_steps
+            restarts += file_restarts
+            size_bytes += target.stat().st_size
+
+        removed = self.rotate()
+        report = {
+            'files': files,
+            'pages': pages,
+            'steps': steps,
+            'restarts': restarts,
+            'size_bytes': size_bytes,
+            'removed': removed,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+        self.last_report = report
+
+        if self.stats is not None:
+            self.stats['backups_created'] = self.stats.get('backups_created', 0) + 1
+
+        logger.info(
+            f"Резервная копия базы: {', '.join(files)} ({size_bytes} байт, {pages} страниц, "
+            f"{steps} шагов, перезапусков: {restarts}) за {report['seconds']} с, удалено старых копий: {removed}"
+        )
+        return report
+
+    def _copy(self, source: str, target: Path) -> Tuple[int, int, int]:
+        """
+        Скопировать файл базы по шагам (выполняется в потоке)
+
+        Запись в базу из другого соединения перезапускает пошаговую копию с
+        начала. Если перезапусков больше max_restarts, копия снимается одним
+        шагом: в режиме WAL это одна читающая транзакция, и запись не ждет.
+
+        Returns:
+            Tuple[int, int, int]: (страниц, шагов, перезапусков)
+        """
+        partial = target.with_name(target.name + '.part')
+        steps = 0
+        restarts = 0
+        total_pages = 0
+        previous_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal steps, restarts, total_pages, previous_remaining
+            steps += 1
+            total_pages = total
+            if previous_remaining is not None and remaining > previous_remaining:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise _BackupRestarted()
+            previous_remaining = remaining
+            if remaining and self.step_pause:
+                # sqlite3 ждет между шагами только при занятой базе - паузу делаем сами
+                time.sleep(self.step_pause)
+
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(partial)
+        try:
+            try:
+                src.backup(dst, pages=self.pages_per_step, progress=progress)
+            except _BackupRestarted:
+                logger.warning(f"Копия {source} перезапускалась {restarts} раз, копируем одним шагом")
+                src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+        os.replace(partial, target)
+        return total_pages, steps, restarts
+
+    @staticmethod
+    def _stamp(path: Path) -> str:
+        """Метка времени копии из имени файла backup_ГГГГММДД_ЧЧММСС..."""
+        return path.name[len('backup_'):len('backup_') + BACKUP_STAMP_LENGTH]
+
+    def list_backups(self) -> List[str]:
+        """Метки времени существующих копий по возрастанию"""
+        if not self.backup_dir.exists():
+            return []
+        return sorted({self._stamp(path) for path in self.backup_dir.glob('backup_*.db')})
+
+    def rotate(self) -> int:
+        """
+        Удалить копии старше последних keep
+
+        Returns:
+            int: Количество удаленных файлов
+        """
+        expired = set(self.list_backups()[:-self.keep])
+        removed = 0
+        for path in self.backup_dir.glob('backup_*.db'):
+            if self._stamp(path) in expired:
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError as e:
+                    logger.error(f"Не удалось удалить старую копию {path}: {e}")
+        return removed
+
+    def seconds_until_due(self) -> float:
+        """Секунд до следующей копии: интервал отсчитывается от последней существующей копии"""
+        backups = self.list_backups()
+        if not backups:
+            return 0.0
+        now = self.clock.now()
+        last = datetime.strptime(backups[-1], BACKUP_STAMP_FORMAT).replace(tzinfo=now.tzinfo)
+        return max(0.0, self.interval_hours * 3600 - (now - last).total_seconds())
+
+    async def run(self):
+        """Фоновая задача: копия раз в interval_hours (сразу при запуске, если on_start или копий еще нет)"""
+        self._running = True
+        if not self.on_start:
+            await self.clock.sleep(self.seconds_until_due())
+
+        while self._running:
+            try:
+                await self.backup_once()
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования базы: {e}")
+
+            await self.clock.sleep(self.interval_hours * 3600)
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,198 @@
+"""
+Middleware диспетчера: защита от флуда и настройки пользователя
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from clock import get_clock
+from config import (
+    RATE_LIMIT_MESSAGES_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_GLOBAL_PER_SECOND,
+    RATE_LIMIT_MODE
+)
+from user_settings import get_user_settings
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_WARNING = "⏳ Слишком много сообщений. Подождите немного и попробуйте снова."
+THROTTLED_CALLBACK = "⏳ Слишком много нажатий. Подождите немного."
+
+# Как часто удалять из памяти состояния пользователей с полным запасом
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class TokenBucket:
+    """
+    Общий лимит в виде ведра токенов
+
+    Состояние хранится одним числом - временем, когда ведро снова станет полным
+    (алгоритм GCRA, эквивалентен ведру токенов с пополнением rate в секунду).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Пополнение токенов в секунду
+            burst: Емкость ведра
+        """
+        self.interval = 1 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self._full_at = 0.0
+
+    def allow(self, now: float) -> bool:
+        """Списать токен, если он есть"""
+        full_at = max(self._full_at, now)
+        if full_at - now > self.tolerance:
+            return False
+        self._full_at = full_at + self.interval
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer-middleware: ведро токенов на пользователя и общий лимит на все обновления"""
+
+    def __init__(
+        self,
+        per_minute: int = RATE_LIMIT_MESSAGES_PER_MINUTE,
+        burst: int = RATE_LIMIT_BURST,
+        global_per_second: int = RATE_LIMIT_GLOBAL_PER_SECOND,
+        mode: str = RATE_LIMIT_MODE,
+        stats: Optional[dict] = None,
+        clock=None
+    ):
+        """
+        Args:
+            per_minute: Сообщений в минуту на пользователя
+            burst: Сколько сообщений подряд разрешено без пауз
+            global_per_second: Общий лимит обновлений в секунду (0 - без лимита)
+            mode: drop - молча отбрасывать, warn - один раз предупредить пользователя
+            stats: Словарь статистики бота (необязательно)
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.interval = 60 / per_minute
+        self.tolerance = self.interval * (burst - 1)
+        # Общему ведру разрешена серия в одну секунду лимита
+        self.global_bucket = TokenBucket(global_per_second, global_per_second) if global_per_second > 0 else None
+        self.mode = mode
+        self.stats = stats
+        self.clock = clock or get_clock()
+
+        # user_id -> время, когда ведро пользователя снова станет полным
+        self._buckets: Dict[int, float] = {}
+        # Пользователи, уже получившие предупреждение (до очистки их полного ведра)
+        self._warned = set()
+        self._next_sweep = self.clock.monotonic() + SWEEP_INTERVAL_SECONDS
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        now = self.clock.monotonic()
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        user = data.get('event_from_user')
+        full_at = None
+        if user is not None:
+            full_at = max(self._buckets.get(user.id, 0.0), now)
+            if full_at - now > self.tolerance:
+                return await self._drop(user.id, event, data)
+
+        # Общий лимит защищает рассылку напоминаний от волны спама с разных аккаунтов.
+        # Токен пользователя тратится только после него: отброшенное общим лимитом
+        # обновление не уменьшает личный лимит
+        if self.global_bucket is not None and not self.global_bucket.allow(now):
+            return await self._drop(None, event, data)
+
+        if full_at is not None:
+            self._buckets[user.id] = full_at + self.interval
+
+        return await handler(event, data)
+
+    async def _drop(self, user_id: Optional[int], event: TelegramObject, data: Dict[str, Any]):
+        self.dropped += 1
+        if self.stats is not None:
+            self.stats['updates_throttled'] = self.stats.get('updates_throttled', 0) + 1
+
+        callback_query = getattr(event, 'callback_query', None)
+        if callback_query is not None:
+            # Без ответа на нажатие кнопка у пользователя остается в состоянии загрузки
+            try:
+                await data['bot'].answer_callback_query(callback_query.id, text=THROTTLED_CALLBACK)
+            except Exception as e:
+                logger.error(f"Не удалось ответить на отброшенное нажатие {callback_query.id}: {e}")
+            return None
+
+        if self.mode == 'warn' and user_id is not None and user_id not in self._warned:
+            self._warned.add(user_id)
+            try:
+                await data['bot'].send_message(chat_id=user_id, text=THROTTLED_WARNING)
+            except Exception as e:
+                logger.error(f"Не удалось отправить предупреждение о флуде пользователю {user_id}: {e}")
+        return None
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Удалить состояния пользователей, чьи ведра уже полные
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        now = now if now is not None else self.clock.monotonic()
+        expired = [user_id for user_id, full_at in self._buckets.items() if full_at <= now]
+        for user_id in expired:
+            del self._buckets[user_id]
+            self._warned.discard(user_id)
+        self._next_sweep = now + SWEEP_INTERVAL_SECONDS
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def is_start_command(event: TelegramObject) -> bool:
+    """Сообщение - команда /start (в том числе /start@имя_бота и с параметром)"""
+    if not isinstance(event, Message) or not event.text:
+        return False
+    return event.text.split(maxsplit=1)[0].split('@', 1)[0] == '/start'
+
+
+class UserSettingsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware роутера: регистрирует пользователя при первом обращении
+    и передает обработчикам его настройки (аргумент user_settings)
+
+    На /start пользователь записывается в базу всегда (UserSettingsCache.register
+    снимает отметку о блокировке) - одной записью, обработчику писать не нужно.
+    """
+
+    def __init__(self, cache=None):
+        """
+        Args:
+            cache: Кэш настроек пользователей (по умолчанию - user_settings.get_user_settings())
+        """
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is not None:
+            if self.cache is None:
+                self.cache = get_user_settings()
+            if is_start_command(event):
+                data['user_settings'] = self.cache.register(user.id, user.language_code)
+            else:
+                # Запрос к базе только при промахе кэша, повторные обновления обходятся без него
+                data['user_settings'] = self.cache.ensure(user.id, user.language_code)
+        return await handler(event, data)
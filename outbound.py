@@ -0,0 +1,268 @@
+"""
+Приоритетная очередь исходящих запросов к Bot API
+
+Все сообщения бота проходят через общий лимит скорости (OUTBOUND_RATE_PER_SECOND)
+и распределяются по полосам приоритета: ответы на нажатия кнопок, затем
+рассылка напоминаний, затем экраны меню, затем объявления администратора.
+Внутри полосы чаты обслуживаются по очереди, и в один чат уходит не больше
+одного сообщения за OUTBOUND_PER_CHAT_INTERVAL секунд. Полоса, которую
+несколько раз подряд обошли более приоритетные, обслуживается вне очереди,
+поэтому ни рассылка, ни меню не простаивают бесконечно. Объявления вне
+очереди не обслуживаются и получают только свободные разрешения.
+
+Полоса задается по методу (answerCallbackQuery) или контекстом:
+    with outbound_lane(LANE_DELIVERY):
+        await bot.send_message(...)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from clock import get_clock
+from config import OUTBOUND_RATE_PER_SECOND, OUTBOUND_PER_CHAT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Полосы в порядке приоритета
+LANE_CALLBACK = 0
+LANE_DELIVERY = 1
+LANE_MENU = 2
+LANE_BROADCAST = 3
+LANE_NAMES = ('callback', 'delivery', 'menu', 'broadcast')
+
+# Фоновые полосы: не обслуживаются вне очереди, чтобы не задерживать остальные
+BACKGROUND_LANES = {LANE_BROADCAST}
+
+# Методы, которые создают или меняют сообщения и расходуют лимиты Telegram
+LIMITED_METHODS = {
+    'sendMessage',
+    'sendDocument',
+    'editMessageText',
+    'editMessageReplyMarkup',
+    'deleteMessage',
+    'answerCallbackQuery',
+}
+
+# Сколько раз подряд полосу с готовым запросом можно обойти
+STARVATION_LIMIT = 4
+
+# Как часто удалять из памяти чаты, чей интервал между сообщениями уже прошел
+SWEEP_INTERVAL_SECONDS = 60
+
+current_lane: ContextVar[int] = ContextVar('outbound_lane', default=LANE_MENU)
+
+
+@contextmanager
+def outbound_lane(lane: int):
+    """Отправлять запросы внутри блока по указанной полосе"""
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class _Lane:
+    """Ожидающие запросы одной полосы: очередь на чат и куча чатов по времени готовности"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.chats: Dict[Optional[int], Deque[Tuple[asyncio.Future, float]]] = {}
+        self.ready: List[Tuple[float, int, Optional[int]]] = []
+        self.depth = 0
+        self.max_depth = 0
+        self.granted = 0
+        self.wait_total = 0.0
+        self.skipped = 0
+
+    def push(self, chat_id: Optional[int], waiter: asyncio.Future, now: float, seq: int):
+        queue = self.chats.get(chat_id)
+        if queue is None:
+            queue = self.chats[chat_id] = deque()
+            heapq.heappush(self.ready, (now, seq, chat_id))
+        queue.append((waiter, now))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def head_ready_at(self, chat_ready: Dict[int, float]) -> Optional[float]:
+        """Время готовности первого чата (отмененные запросы выбрасываются)"""
+        while self.ready:
+            ready_at, seq, chat_id = self.ready[0]
+            queue = self.chats[chat_id]
+            while queue and queue[0][0].done():
+                queue.popleft()
+                self.depth -= 1
+            if not queue:
+                heapq.heappop(self.ready)
+                del self.chats[chat_id]
+                continue
+
+            # Чат мог получить сообщение из другой полосы - переносим его дальше
+            actual = chat_ready.get(chat_id, 0.0) if chat_id is not None else 0.0
+            if actual > ready_at:
+                heapq.heapreplace(self.ready, (actual, seq, chat_id))
+                continue
+            return ready_at
+        return None
+
+    def pop(self, now: float, next_ready_at: float, seq: int) -> Tuple[asyncio.Future, Optional[int]]:
+        _, _, chat_id = heapq.heappop(self.ready)
+        queue = self.chats[chat_id]
+        waiter, enqueued_at = queue.popleft()
+        if queue:
+            heapq.heappush(self.ready, (next_ready_at, seq, chat_id))
+        else:
+            del self.chats[chat_id]
+
+        self.depth -= 1
+        self.granted += 1
+        self.wait_total += now - enqueued_at
+        return waiter, chat_id
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Middleware сессии бота: выдает разрешения на запросы по полосам приоритета"""
+
+    def __init__(
+        self,
+        rate_per_second: float = OUTBOUND_RATE_PER_SECOND,
+        per_chat_interval: float = OUTBOUND_PER_CHAT_INTERVAL,
+        starvation_limit: int = STARVATION_LIMIT,
+        clock=None
+    ):
+        """
+        Args:
+            rate_per_second: Общий лимит запросов в секунду
+            per_chat_interval: Минимальный интервал между сообщениями в один чат (секунды)
+            starvation_limit: Сколько раз подряд можно обойти полосу с готовым запросом
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.interval = 1 / rate_per_second
+        self.per_chat_interval = per_chat_interval
+        self.starvation_limit = starvation_limit
+        self.clock = clock or get_clock()
+
+        self._lanes = [_Lane(name) for name in LANE_NAMES]
+        self._background = {self._lanes[lane] for lane in BACKGROUND_LANES}
+        self._chat_ready: Dict[int, float] = {}
+        self._next_sweep = self.clock.monotonic() + SWEEP_INTERVAL_SECONDS
+        self._next_grant = 0.0
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+
+    async def __call__(self, make_request, bot, method):
+        if getattr(method, '__api_method__', None) not in LIMITED_METHODS:
+            return await make_request(bot, method)
+
+        if method.__api_method__ == 'answerCallbackQuery':
+            lane, chat_id = LANE_CALLBACK, None
+        else:
+            lane, chat_id = current_lane.get(), getattr(method, 'chat_id', None)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._lanes[lane].push(chat_id, waiter, self.clock.monotonic(), next(self._seq))
+        self._ensure_pump()
+        await waiter
+
+        return await make_request(bot, method)
+
+    def metrics(self) -> dict:
+        """
+        Метрики очередей по полосам
+
+        Returns:
+            dict: {полоса: {'depth', 'max_depth', 'granted', 'avg_wait_ms'}}
+        """
+        return {
+            lane.name: {
+                'depth': lane.depth,
+                'max_depth': lane.max_depth,
+                'granted': lane.granted,
+                'avg_wait_ms': round(lane.wait_total / lane.granted * 1000, 1) if lane.granted else 0.0
+            }
+            for lane in self._lanes
+        }
+
+    def _ensure_pump(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    def _pick(self, now: float) -> Tuple[Optional[_Lane], Optional[float]]:
+        """Выбрать полосу для следующего разрешения или время ближайшей готовности"""
+        ready = []
+        earliest = None
+        for lane in self._lanes:
+            ready_at = lane.head_ready_at(self._chat_ready)
+            if ready_at is None:
+                continue
+            if ready_at <= now:
+                ready.append(lane)
+            elif earliest is None or ready_at < earliest:
+                earliest = ready_at
+
+        if not ready:
+            return None, earliest
+
+        chosen = ready[0]
+        for lane in ready[1:]:
+            if lane.skipped >= self.starvation_limit and lane not in self._background:
+                chosen = lane
+                break
+
+        for lane in ready:
+            lane.skipped = 0 if lane is chosen else lane.skipped + 1
+        return chosen, None
+
+    async def _pump(self):
+        while any(lane.depth for lane in self._lanes):
+            self._wakeup.clear()
+            now = self.clock.monotonic()
+            if now >= self._next_sweep:
+                self.sweep(now)
+
+            if now < self._next_grant:
+                await self.clock.sleep(self._next_grant - now)
+                continue
+
+            lane, earliest = self._pick(now)
+            if lane is None:
+                if earliest is None:
+                    break
+                # Ждем готовности чата или нового запроса
+                await self.clock.wait(self._wakeup, earliest - now)
+                continue
+
+            next_ready_at = now + self.per_chat_interval
+            waiter, chat_id = lane.pop(now, next_ready_at, next(self._seq))
+            if chat_id is not None:
+                self._chat_ready[chat_id] = next_ready_at
+            waiter.set_result(None)
+            self._next_grant = max(self._next_grant, now) + self.interval
+
+        # Очередь пуста: забываем чаты, чей интервал уже прошел
+        self.sweep()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Удалить чаты, в которые уже можно отправлять без ожидания
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        now = now if now is not None else self.clock.monotonic()
+        expired = [chat_id for chat_id, ready_at in self._chat_ready.items() if ready_at <= now]
+        for chat_id in expired:
+            del self._chat_ready[chat_id]
+        self._next_sweep = now + SWEEP_INTERVAL_SECONDS
+        return len(expired)
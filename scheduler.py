@@ -0,0 +1,320 @@
+"""
+Планировщик отправки напоминаний
+
+Вместо опроса базы раз в минуту планировщик спит до времени ближайшего
+напоминания и просыпается раньше, если пришло событие о новом напоминании
+(из этого процесса или по сокету из процесса обработки сообщений).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from config import (
+    CHECK_INTERVAL_SECONDS,
+    NOTIFICATION_RETRY_ATTEMPTS,
+    NOTIFICATION_RETRY_DELAY_SECONDS,
+    DUE_BATCH_SIZE,
+    COALESCE_DELIVERY,
+    COALESCE_MAX_ITEMS,
+    STALE_REMINDER_POLICY,
+    STALE_REMINDER_MINUTES
+)
+from clock import get_clock
+from due_index import epoch_minute
+from events import EVENT_ADDED
+from outbound import outbound_lane, LANE_DELIVERY
+from handlers import send_reminder_to_user_v2, send_reminders_digest_to_user, send_missed_summary_to_user
+
+# Сколько пропущенных напоминаний показывать в сводке на одного пользователя
+MISSED_SUMMARY_SAMPLES = 5
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Фоновая отправка напоминаний"""
+
+    def __init__(
+        self,
+        bot,
+        database,
+        stats: dict,
+        check_interval: int = CHECK_INTERVAL_SECONDS,
+        batch_size: int = DUE_BATCH_SIZE,
+        stale_policy: str = STALE_REMINDER_POLICY,
+        stale_minutes: int = STALE_REMINDER_MINUTES,
+        coalesce: bool = COALESCE_DELIVERY,
+        coalesce_max_items: int = COALESCE_MAX_ITEMS,
+        due_index=None,
+        user_settings=None,
+        clock=None
+    ):
+        """
+        Args:
+            bot: Экземпляр бота для отправки сообщений
+            database: База данных напоминаний
+            stats: Словарь статистики бота (обновляется планировщиком)
+            check_interval: Максимальный интервал между проверками в секундах
+            batch_size: Размер пакета при выборке наступивших напоминаний
+            stale_policy: Политика для сильно опоздавших напоминаний: send, summary или drop
+            stale_minutes: С какого опоздания (в минутах) напоминание считается устаревшим
+            coalesce: Объединять одновременно наступившие напоминания пользователя в одно сообщение
+            coalesce_max_items: Максимум напоминаний в одном объединенном сообщении
+            due_index: Индекс ближайших напоминаний в памяти (DueIndex) или None
+            user_settings: Кэш настроек пользователей (UserSettingsCache) или None
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.bot = bot
+        self.db = database
+        self.stats = stats
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        self.stale_policy = stale_policy
+        self.stale_minutes = stale_minutes
+        self.coalesce = coalesce
+        self.coalesce_max_items = coalesce_max_items
+        self.due_index = due_index
+        self.user_settings = user_settings
+        self.clock = clock or get_clock()
+
+        self._running = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup = asyncio.Event()
+        self._planned_wakeup: Optional[datetime] = None
+
+        # reminder_id -> (неудачных попыток, время следующей попытки)
+        self._retries: dict = {}
+
+    def notify(self, event: str = EVENT_ADDED, reminder_time: Optional[datetime] = None):
+        """
+        Сообщить планировщику об изменении напоминаний (потокобезопасно)
+
+        Args:
+            event: Тип события
+            reminder_time: Время нового напоминания
+        """
+        if self._loop is None:
+            return
+
+        if event == EVENT_ADDED and reminder_time and self.due_index is not None:
+            self.due_index.mark_dirty(reminder_time)
+
+        # Будим только если новое напоминание раньше запланированной проверки
+        if event == EVENT_ADDED and reminder_time and self._planned_wakeup:
+            if reminder_time >= self._planned_wakeup:
+                return
+
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def check_reminders(self):
+        """Фоновая задача для проверки и отправки напоминаний"""
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+
+        while self._running:
+            self._wakeup.clear()
+            try:
+                await self.deliver_due()
+            except Exception as e:
+                logger.error(f"Ошибка в проверке напоминаний: {e}")
+                self.stats['errors_count'] += 1
+
+            await self._sleep(self._next_delay())
+
+    async def deliver_due(self):
+        """Отправить все напоминания, время которых наступило, потоково пакетами"""
+        now = self.clock.now()
+        stale_before = now - timedelta(minutes=self.stale_minutes)
+        
+        # user_id -> [количество, первые несколько (reminder_time, reminder_text), их id]
+        missed = {}
+
+        # Напоминания текущего пользователя, ожидающие объединенной отправки
+        pending = []
+
+        # Напоминания с повторами, встреченные в этом проходе
+        seen_retries = set()
+
+        if self.due_index is not None:
+            self.due_index.sync(now)
+            batches = self.db.iter_reminders_by_ids(
+                self.due_index.pop_due(now), self.batch_size, group_by_user=self.coalesce
+            )
+        else:
+            batches = self.db.iter_due_reminders(self.batch_size, now, group_by_user=self.coalesce)
+
+        for batch in batches:
+            stale_ids = []
+            if self.user_settings is not None:
+                # Настройки получателей пакета - одним запросом, дальше из памяти
+                self.user_settings.prefetch(reminder[1] for reminder in batch)
+
+            for reminder in batch:
+                reminder_id, user_id, reminder_time, reminder_text = reminder
+                retry = self._retries.get(reminder_id)
+                if retry is not None:
+                    seen_retries.add(reminder_id)
+                    if retry[1] > now:
+                        # Повторная попытка еще не наступила
+                        if self.due_index is not None:
+                            self.due_index.add(reminder_id, epoch_minute(retry[1]))
+                        continue
+
+                if self.stale_policy != 'send' and reminder_time < stale_before:
+                    stale_ids.append(reminder_id)
+                    if self.stale_policy == 'summary':
+                        entry = missed.setdefault(user_id, [0, [], []])
+                        entry[0] += 1
+                        if len(entry[1]) < MISSED_SUMMARY_SAMPLES:
+                            entry[1].append((reminder_time, reminder_text))
+                            entry[2].append(reminder_id)
+                    continue
+
+                if not self.coalesce:
+                    await self._deliver_to_user(user_id, [reminder])
+                    continue
+
+                # Напоминания пользователя идут подряд, в том числе через границу пакета
+                if pending and (pending[0][1] != user_id or len(pending) >= self.coalesce_max_items):
+                    await self._deliver_to_user(pending[0][1], pending)
+                    pending = []
+                pending.append(reminder)
+
+            if stale_ids:
+                self.db.mark_reminders_sent(stale_ids, delivered=False)
+                self.stats['reminders_skipped'] = self.stats.get('reminders_skipped', 0) + len(stale_ids)
+                logger.info(f"Пропущено устаревших напоминаний: {len(stale_ids)} (политика {self.stale_policy})")
+
+            # Отдаем управление обработчикам между пакетами
+            await asyncio.sleep(0)
+
+        if pending:
+            await self._deliver_to_user(pending[0][1], pending)
+
+        # Наступившие повторы, которых не было среди наступивших напоминаний, удалены или уже отправлены
+        self._retries = {
+            reminder_id: retry for reminder_id, retry in self._retries.items()
+            if reminder_id in seen_retries or retry[1] > now
+        }
+
+        for user_id, (missed_count, samples, sample_ids) in missed.items():
+            try:
+                with outbound_lane(LANE_DELIVERY):
+                    await send_missed_summary_to_user(self.bot, user_id, missed_count, samples, sample_ids)
+            except Exception as e:
+                logger.error(f"Ошибка отправки сводки пропущенных напоминаний {user_id}: {e}")
+                self.stats['errors_count'] += 1
+
+    async def _deliver_to_user(self, user_id: int, reminders: list):
+        """Отправить пользователю одно или несколько напоминаний одним сообщением"""
+        reminder_ids = [reminder[0] for reminder in reminders]
+        if self.user_settings is not None and self.user_settings.get(user_id)['is_blocked']:
+            # Пользователь заблокировал бота: сообщение не дойдет, лимит отправки на него не тратим
+            self._skip_undeliverable(user_id, reminder_ids)
+            return
+        try:
+            if len(reminders) == 1:
+                _, _, reminder_time, reminder_text = reminders[0]
+                # Отправляем напоминание
+                with outbound_lane(LANE_DELIVERY):
+                    await send_reminder_to_user_v2(self.bot, user_id, reminder_time, reminder_text, reminder_ids[0])
+
+                # Отмечаем как отправленное
+                self.db.mark_reminder_sent(reminder_ids[0])
+            else:
+                with outbound_lane(LANE_DELIVERY):
+                    await send_reminders_digest_to_user(
+                        self.bot, user_id, [(reminder[2], reminder[3]) for reminder in reminders], reminder_ids
+                    )
+                # Все напоминания сообщения отмечаются в одной транзакции
+                self.db.mark_reminders_sent(reminder_ids)
+
+            self.stats['reminders_sent'] += len(reminders)
+            for reminder_id in reminder_ids:
+                self._retries.pop(reminder_id, None)
+
+        except TelegramForbiddenError:
+            if self.user_settings is not None:
+                self.user_settings.set_blocked(user_id)
+            else:
+                self.db.set_user_blocked(user_id)
+            for reminder_id in reminder_ids:
+                self._retries.pop(reminder_id, None)
+            self._skip_undeliverable(user_id, reminder_ids)
+
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминаний {reminder_ids}: {e}")
+            self.stats['errors_count'] += 1
+            self._schedule_retry(user_id, reminder_ids)
+
+    def _schedule_retry(self, user_id: int, reminder_ids: list):
+        """
+        Запланировать повтор с экспоненциальной задержкой или снять напоминания с отправки
+
+        Задержка перед n-й повторной попыткой - NOTIFICATION_RETRY_DELAY_SECONDS * 2^(n-1).
+        После NOTIFICATION_RETRY_ATTEMPTS неудачных попыток напоминание отмечается
+        недоставленным и один раз учитывается в статистике ошибок доставки.
+        """
+        now = self.clock.now()
+        failed_ids = []
+        for reminder_id in reminder_ids:
+            attempts = self._retries.get(reminder_id, (0, None))[0] + 1
+            if attempts >= NOTIFICATION_RETRY_ATTEMPTS:
+                self._retries.pop(reminder_id, None)
+                failed_ids.append(reminder_id)
+                continue
+
+            retry_at = now + timedelta(seconds=NOTIFICATION_RETRY_DELAY_SECONDS * 2 ** (attempts - 1))
+            self._retries[reminder_id] = (attempts, retry_at)
+            if self.due_index is not None:
+                self.due_index.add(reminder_id, epoch_minute(retry_at))
+
+        if failed_ids:
+            self.db.mark_reminders_sent(failed_ids, delivered=False)
+            self.db.record_delivery_failures(len(failed_ids))
+            self.stats['reminders_failed'] = self.stats.get('reminders_failed', 0) + len(failed_ids)
+            logger.warning(
+                f"Напоминания {failed_ids} пользователя {user_id} не доставлены "
+                f"после {NOTIFICATION_RETRY_ATTEMPTS} попыток"
+            )
+
+    def _skip_undeliverable(self, user_id: int, reminder_ids: list):
+        """Снять с отправки напоминания пользователя, заблокировавшего бота (повторять бесполезно)"""
+        self.db.mark_reminders_sent(reminder_ids, delivered=False)
+        self.stats['reminders_skipped'] = self.stats.get('reminders_skipped', 0) + len(reminder_ids)
+        logger.info(f"Напоминания {reminder_ids} не отправлены: пользователь {user_id} заблокировал бота")
+
+    def _next_delay(self) -> float:
+        """Секунды до следующей проверки: до ближайшего напоминания, но не дольше check_interval"""
+        now = self.clock.now()
+        delay = float(self.check_interval)
+
+        if self.due_index is not None:
+            next_time = self.due_index.next_due_time()
+        else:
+            next_time = self.db.get_next_reminder_time()
+        if next_time is not None:
+            if next_time <= now:
+                # Остались неотправленные из-за ошибок - ждем ближайшей повторной попытки
+                retry_at = min((retry[1] for retry in self._retries.values() if retry[1] > now), default=None)
+                if retry_at is not None:
+                    delay = min(delay, (retry_at - now).total_seconds())
+                else:
+                    delay = min(delay, NOTIFICATION_RETRY_DELAY_SECONDS)
+            else:
+                delay = min(delay, (next_time - now).total_seconds())
+
+        self._planned_wakeup = now + timedelta(seconds=delay)
+        return delay
+
+    async def _sleep(self, delay: float):
+        await self.clock.wait(self._wakeup, delay)
+
+    def stop(self):
+        """Остановить цикл проверки"""
+        self._running = False
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
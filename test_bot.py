@@ -3,10 +3,24 @@
 """
 import asyncio
 import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
 from datetime import datetime, timedelta
 
-from config import OMSK_TIMEZONE, setup_logging
-from database import db_v2
+# Тесты работают с временными базой и логами и не трогают рабочие файлы
+TEST_DIR = tempfile.mkdtemp(prefix='reminder_test_')
+os.environ['DB_PATH'] = os.path.join(TEST_DIR, 'reminders.db')
+os.environ['LOG_FILE'] = os.path.join(TEST_DIR, 'bot.log')
+
+# Бюджет на импорт базовых модулей (без aiogram), мс
+STARTUP_IMPORT_BUDGET_MS = 250
+
+from config import OMSK_TIMEZONE, PROJECT_ROOT, setup_logging
+from database import get_db
 from utils import (
     validate_reminder_time_v2,
     format_datetime_for_user,
@@ -20,6 +34,18 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+class FakeBot:
+    """Бот-заглушка: запоминает отправленные сообщения"""
+    
+    def __init__(self):
+        self.sent = []
+        self.texts = []
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+        self.texts.append(text)
+
+
 def test_new_date_formats():
     """Тест новых форматов дат"""
     print("=== Тестирование новых форматов дат ===")
@@ -69,11 +95,11 @@ def test_database_v2():
     
     print(f"Добавление {len(test_reminders)} напоминаний...")
     for reminder_time, reminder_text in test_reminders:
-        success = db_v2.add_reminder(test_user_id, reminder_time, reminder_text)
+        success = get_db().add_reminder(test_user_id, reminder_time, reminder_text)
         print(f"  {reminder_time} - {'✅' if success else '❌'}")
     
     # Получаем напоминания пользователя
-    user_reminders = db_v2.get_user_reminders(test_user_id)
+    user_reminders = get_db().get_user_reminders(test_user_id)
     print(f"\nНапоминания пользователя {test_user_id}: {len(user_reminders)} шт.")
     
     for reminder_id, reminder_time, reminder_text in user_reminders:
@@ -85,11 +111,11 @@ def test_database_v2():
     if user_reminders:
         first_reminder_id = user_reminders[0][0]
         print(f"\nУдаление напоминания ID {first_reminder_id}...")
-        success = db_v2.delete_reminder(first_reminder_id, test_user_id)
+        success = get_db().delete_reminder(first_reminder_id, test_user_id)
         print(f"Удаление: {'✅' if success else '❌'}")
         
         # Проверяем количество после удаления
-        count_after = db_v2.get_reminders_count(test_user_id)
+        count_after = get_db().get_reminders_count(test_user_id)
         print(f"Осталось напоминаний: {count_after}")
     
     print()
@@ -168,6 +194,1740 @@ def test_year_detection():
     print()
 
 
+def test_user_sharding():
+    """Тест шардирования обновлений по user_id"""
+    print("=== Тестирование шардирования по user_id ===")
+    
+    from workers import shard_for_user, _UserOrderedRunner
+    
+    # Один пользователь всегда попадает в один процесс
+    for user_id in (1, 42, 123456789):
+        assert shard_for_user(user_id, 4) == shard_for_user(user_id, 4)
+    assert shard_for_user(None, 4) == 0
+    assert {shard_for_user(user_id, 4) for user_id in range(100)} == {0, 1, 2, 3}
+    
+    # Обновления одного пользователя обрабатываются строго по порядку
+    processed = []
+    
+    async def feed(update):
+        # Первое обновление каждого пользователя обрабатывается дольше остальных
+        await asyncio.sleep(0.01 if update['update_id'] < 3 else 0)
+        processed.append((update['message']['from']['id'], update['update_id']))
+    
+    async def run():
+        runner = _UserOrderedRunner(feed)
+        for update_id in range(9):
+            user_id = update_id % 3
+            runner.submit({'update_id': update_id, 'message': {'from': {'id': user_id}}})
+        await runner.drain()
+    
+    asyncio.run(run())
+    for user_id in range(3):
+        order = [update_id for uid, update_id in processed if uid == user_id]
+        print(f"  Пользователь {user_id}: {order}")
+        assert order == sorted(order)
+    
+    print()
+
+
+def test_delivery_signals():
+    """Тест пробуждения планировщика по сигналу о новом напоминании"""
+    print("=== Тестирование сигналов процессу рассылки ===")
+    
+    import tempfile
+    from database import ReminderDatabaseV2
+    from events import DeliverySignalListener, DeliverySignalSender, EVENT_ADDED
+    from scheduler import ReminderScheduler
+    
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = ReminderDatabaseV2(f"{tmp_dir}/reminders.db")
+            fake_bot = FakeBot()
+            stats = {'reminders_sent': 0, 'errors_count': 0}
+            scheduler = ReminderScheduler(fake_bot, database, stats, check_interval=60)
+            
+            listener = DeliverySignalListener('127.0.0.1', 0, scheduler.notify)
+            await listener.start()
+            port = listener._transport.get_extra_info('sockname')[1]
+            sender = DeliverySignalSender('127.0.0.1', port)
+            
+            task = asyncio.create_task(scheduler.check_reminders())
+            await asyncio.sleep(0.1)
+            
+            # Без сигнала планировщик спал бы 60 секунд
+            reminder_time = datetime.now(OMSK_TIMEZONE) + timedelta(seconds=0.3)
+            database.add_reminder(777, reminder_time, "Сигнал")
+            sender(EVENT_ADDED, reminder_time)
+            
+            for _ in range(40):
+                if fake_bot.sent:
+                    break
+                await asyncio.sleep(0.05)
+            
+            scheduler.stop()
+            await task
+            sender.close()
+            listener.close()
+            return fake_bot.sent, stats
+    
+    sent, stats = asyncio.run(run())
+    print(f"  Отправлено: {sent}, статистика: {stats}")
+    assert sent == [777]
+    assert stats['reminders_sent'] == 1
+    
+    print()
+
+
+def test_retention_job():
+    """Тест пакетной очистки старых отправленных напоминаний"""
+    print("=== Тестирование очистки старых напоминаний ===")
+    
+    import sqlite3
+    from database import ReminderDatabaseV2
+    from maintenance import RetentionJob
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        now = datetime.now(OMSK_TIMEZONE)
+        
+        # 25 старых отправленных, 5 свежих отправленных и 5 старых неотправленных
+        for i in range(25):
+            database.add_reminder(1, now - timedelta(days=40, minutes=i))
+        for i in range(5):
+            database.add_reminder(1, now - timedelta(days=1, minutes=i))
+        with sqlite3.connect(database.db_path) as conn:
+            conn.execute("UPDATE reminders_v2 SET is_sent = TRUE")
+        for i in range(5):
+            database.add_reminder(2, now - timedelta(days=40, minutes=i))
+        
+        # Граница считается через timedelta и не падает в начале месяца
+        cutoff = database.get_retention_cutoff(days_old=30)
+        assert (now - cutoff).days in (30, 31)
+        
+        stats = {}
+        job = RetentionJob(database, days_old=30, batch_size=7, batch_pause_ms=0, stats=stats)
+        report = asyncio.run(job.run_once())
+        print(f"  Отчет: {report}")
+        
+        assert report['deleted'] == 25
+        assert report['batches'] == 5
+        assert stats['reminders_cleaned'] == 25
+        assert database.get_reminders_count(2) == 5
+        assert database.cleanup_old_reminders(days_old=30) == 0
+    
+    print()
+
+
+def test_history_partitions():
+    """Тест переноса отправленных напоминаний в месячные файлы истории"""
+    print("=== Тестирование файлов истории ===")
+    
+    from database import ReminderDatabaseV2
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'), history_enabled=True)
+        now = datetime.now(OMSK_TIMEZONE)
+        
+        # Напоминания за три разных месяца и одно ожидающее
+        times = [now - timedelta(days=70), now - timedelta(days=35), now - timedelta(minutes=5)]
+        for reminder_time in times:
+            database.add_reminder(5, reminder_time, "Отправлено")
+        database.add_reminder(5, now + timedelta(days=1), "Ожидает")
+        
+        for reminder_id, user_id, reminder_time, reminder_text in database.get_due_reminders():
+            assert database.mark_reminder_sent(reminder_id)
+        
+        partitions = database.list_history_partitions()
+        print(f"  Файлы истории: {[month for month, _ in partitions]}")
+        assert len(partitions) == len({t.strftime('%Y-%m') for t in times})
+        
+        # Основная таблица хранит только ожидающие напоминания
+        assert database.get_id_range() == (4, 4)
+        assert database.get_reminders_count(5) == 1
+        
+        # Подсчет и обход прозрачно охватывают все файлы
+        assert database.count_sent_reminders() == 3
+        assert database.count_sent_reminders(user_id=6) == 0
+        assert sorted(r[0] for r in database.iter_sent_reminders(user_id=5)) == [1, 2, 3]
+        
+        # Статистика учитывает перенесенные напоминания, в том числе при заполнении счетчиков миграцией
+        summary = database.get_stats_summary()
+        assert (summary['sent_total'], summary['pending'], summary['created_total']) == (3, 1, 4)
+        with sqlite3.connect(database.db_path) as conn:
+            conn.executescript(
+                "DROP TABLE stats_counters; DROP TABLE stats_hourly; DROP TABLE user_counters; PRAGMA user_version = 4;"
+            )
+        summary = ReminderDatabaseV2(database.db_path, history_enabled=True).get_stats_summary()
+        print(f"  Счетчики после миграции: отправлено {summary['sent_total']}, создано {summary['created_total']}")
+        assert (summary['sent_total'], summary['pending'], summary['created_total']) == (3, 1, 4)
+        
+        # Выгрузка с отправленными читает и файлы истории
+        from transfer import FORMAT_CSV, export_reminders
+        path = os.path.join(tmp_dir, 'export.csv')
+        assert export_reminders(database, 5, path, FORMAT_CSV) == 1
+        assert export_reminders(database, 5, path, FORMAT_CSV, batch_size=2, include_sent=True) == 4
+        with open(path, encoding='utf-8') as file:
+            assert sum(1 for line in file if "Отправлено" in line) == 3
+        
+        # Старые месяцы удаляются целиком
+        dropped = database.drop_history_partitions(now - timedelta(days=30))
+        print(f"  Удалено файлов: {dropped}")
+        assert database.count_sent_reminders() == 3 - dropped
+    
+    print()
+
+
+def test_streaming_catch_up():
+    """Тест потоковой досылки напоминаний после простоя"""
+    print("=== Тестирование досылки после простоя ===")
+    
+    from database import ReminderDatabaseV2
+    from scheduler import ReminderScheduler
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        now = datetime.now(OMSK_TIMEZONE)
+        
+        # 30 сильно опоздавших напоминаний у двух пользователей и 10 свежих
+        for i in range(30):
+            database.add_reminder(100 + i % 2, now - timedelta(hours=5, minutes=i), f"Старое {i}")
+        for i in range(10):
+            database.add_reminder(200, now - timedelta(minutes=10 - i), f"Свежее {i}")
+        
+        batches = list(database.iter_due_reminders(batch_size=7))
+        assert [len(batch) for batch in batches] == [7, 7, 7, 7, 7, 5]
+        due_times = [reminder[2] for batch in batches for reminder in batch]
+        assert due_times == sorted(due_times)
+        
+        fake_bot = FakeBot()
+        stats = {'reminders_sent': 0, 'errors_count': 0}
+        scheduler = ReminderScheduler(
+            fake_bot, database, stats, batch_size=7, stale_policy='summary', stale_minutes=60,
+            coalesce=False
+        )
+        asyncio.run(scheduler.deliver_due())
+        
+        print(f"  Сообщений: {len(fake_bot.sent)}, статистика: {stats}")
+        assert stats['reminders_sent'] == 10
+        assert stats['reminders_skipped'] == 30
+        assert fake_bot.sent.count(200) == 10
+        assert fake_bot.sent.count(100) == 1 and fake_bot.sent.count(101) == 1
+        assert "15" in fake_bot.texts[fake_bot.sent.index(100)]
+        assert database.get_due_reminders() == []
+    
+    print()
+
+
+def test_coalesced_delivery():
+    """Тест объединения одновременных напоминаний одного пользователя"""
+    print("=== Тестирование объединенной доставки ===")
+    
+    from database import ReminderDatabaseV2
+    from scheduler import ReminderScheduler
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        due_time = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0) - timedelta(minutes=20)
+        
+        # У пользователя 300 наступило 12 напоминаний сразу, у 301 - одно после них
+        for i in range(12):
+            database.add_reminder(300, due_time + timedelta(minutes=i), f"Задача {i}")
+        database.add_reminder(301, due_time + timedelta(minutes=15), "Одиночное")
+        
+        fake_bot = FakeBot()
+        stats = {'reminders_sent': 0, 'errors_count': 0}
+        scheduler = ReminderScheduler(fake_bot, database, stats, batch_size=5, coalesce=True, coalesce_max_items=10)
+        asyncio.run(scheduler.deliver_due())
+        
+        print(f"  Сообщений: {len(fake_bot.sent)}, напоминаний: {stats['reminders_sent']}")
+        assert stats['reminders_sent'] == 13
+        assert fake_bot.sent.count(300) == 2
+        assert fake_bot.sent.count(301) == 1
+        first = fake_bot.texts[fake_bot.sent.index(300)]
+        assert "(10)" in first and "Задача 0" in first and "Задача 9" in first
+        assert "Одиночное" in fake_bot.texts[fake_bot.sent.index(301)]
+        assert database.get_due_reminders() == []
+    
+    print()
+
+
+def test_due_index():
+    """Тест колеса времени для ближайших напоминаний"""
+    print("=== Тестирование индекса ближайших напоминаний ===")
+    
+    from database import ReminderDatabaseV2
+    from due_index import DueIndex, epoch_minute
+    from scheduler import ReminderScheduler
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+        
+        database.add_reminder(400, now - timedelta(minutes=5), "Опоздавшее")
+        database.add_reminder(400, now + timedelta(minutes=30), "Скоро")
+        database.add_reminder(401, now + timedelta(hours=2), "Через 2 часа")
+        database.add_reminder(401, now + timedelta(hours=6), "За горизонтом")
+        
+        index = DueIndex(database, horizon_hours=3)
+        index.sync(now)
+        print(f"  В индексе: {len(index)}, буферы: {index.memory_bytes()} байт")
+        assert len(index) == 3
+        assert index.next_due_time() == now - timedelta(minutes=5)
+        assert len(index.pop_due(now)) == 1
+        assert index.next_due_time() == now + timedelta(minutes=30)
+        
+        # Новое напоминание после загрузки подхватывается по событию без дублей
+        database.add_reminder(402, now + timedelta(minutes=10), "Новое")
+        index.mark_dirty(now + timedelta(minutes=10))
+        index.mark_dirty(now + timedelta(minutes=30))
+        index.sync(now)
+        assert len(index) == 3
+        assert index.next_due_time() == now + timedelta(minutes=10)
+        
+        # Через 4 часа: часовые корзины разложены, горизонт дозагружен, а сверка
+        # с базой возвращает выбранное, но так и не отправленное опоздавшее
+        later = now + timedelta(hours=4)
+        index.sync(later)
+        assert len(index) == 5
+        due = index.pop_due(later)
+        assert len(due) == 4 and epoch_minute(index.next_due_time()) == epoch_minute(now + timedelta(hours=6))
+        
+        # Планировщик с индексом отправляет наступившие напоминания
+        fake_bot = FakeBot()
+        stats = {'reminders_sent': 0, 'errors_count': 0}
+        due_index = DueIndex(database, horizon_hours=3, resync_seconds=0)
+        scheduler = ReminderScheduler(fake_bot, database, stats, due_index=due_index)
+        asyncio.run(scheduler.deliver_due())
+        assert stats['reminders_sent'] == 1 and fake_bot.sent == [400]
+        assert "Опоздавшее" in fake_bot.texts[0]
+        
+        # Подсказка о новом напоминании потерялась: сверка с базой все равно его находит
+        database.add_reminder(403, now - timedelta(minutes=1), "Без подсказки")
+        asyncio.run(scheduler.deliver_due())
+        assert stats['reminders_sent'] == 2 and fake_bot.sent == [400, 403]
+    
+    print()
+
+
+def test_navigation_edit_in_place():
+    """Тест навигации по меню редактированием сообщения"""
+    print("=== Тестирование навигации редактированием ===")
+    
+    from aiogram.exceptions import TelegramBadRequest
+    from aiogram.types import CallbackQuery
+    from callbacks import encode_callback, ACTION_HELP, ACTION_MAIN_MENU
+    from handlers import show_screen, render_help, MAIN_MENU_TEXT, get_main_keyboard
+    
+    class FakeApiBot:
+        """Бот, принимающий методы Bot API и отказывающий в редактировании по флагу"""
+        
+        def __init__(self, can_edit=True):
+            self.calls = []
+            self.can_edit = can_edit
+        
+        async def __call__(self, method, request_timeout=None):
+            self.calls.append(type(method).__name__)
+            if type(method).__name__ == 'EditMessageText' and not self.can_edit:
+                raise TelegramBadRequest(method=method, message="Bad Request: message can't be edited")
+            return True
+        
+        async def send_message(self, chat_id, text, **kwargs):
+            self.calls.append('SendMessage')
+    
+    def make_callback(bot, data, text, reply_markup=None):
+        message = {
+            'message_id': 1, 'date': 0, 'chat': {'id': 500, 'type': 'private'}, 'text': text
+        }
+        if reply_markup:
+            message['reply_markup'] = reply_markup.model_dump(exclude_none=True)
+        return CallbackQuery.model_validate({
+            'id': '1', 'chat_instance': '1', 'data': data, 'message': message,
+            'from': {'id': 500, 'is_bot': False, 'first_name': 'User'}
+        }, context={'bot': bot})
+    
+    help_text, help_markup = render_help()
+    
+    bot = FakeApiBot()
+    help_data = encode_callback(ACTION_HELP)
+    asyncio.run(show_screen(make_callback(bot, help_data, MAIN_MENU_TEXT, get_main_keyboard()), help_text, help_markup))
+    assert bot.calls == ['EditMessageText']
+    
+    # Тот же экран повторно - без запросов к API
+    bot = FakeApiBot()
+    callback = make_callback(bot, encode_callback(ACTION_MAIN_MENU), MAIN_MENU_TEXT, get_main_keyboard())
+    asyncio.run(show_screen(callback, MAIN_MENU_TEXT, get_main_keyboard()))
+    assert bot.calls == []
+    
+    # Редактировать нельзя или кнопка под напоминанием - новое сообщение
+    bot = FakeApiBot(can_edit=False)
+    asyncio.run(show_screen(make_callback(bot, help_data, MAIN_MENU_TEXT), help_text, help_markup))
+    assert bot.calls == ['EditMessageText', 'SendMessage']
+    
+    bot = FakeApiBot()
+    help_data = encode_callback(ACTION_HELP, new_message=True)
+    asyncio.run(show_screen(make_callback(bot, help_data, "🔔 Напоминание!"), help_text, help_markup))
+    assert bot.calls == ['SendMessage']
+    
+    # Обработчик кнопки сначала отвечает на нажатие (убирает индикатор загрузки), затем меняет экран
+    from handlers import callback_dispatch
+    bot = FakeApiBot()
+    asyncio.run(callback_dispatch(make_callback(bot, encode_callback(ACTION_HELP), MAIN_MENU_TEXT, get_main_keyboard())))
+    assert bot.calls == ['AnswerCallbackQuery', 'EditMessageText']
+    print("  Навигация: редактирование, пропуск без изменений и запасная отправка работают")
+    
+    print()
+
+
+def test_throttling_middleware():
+    """Тест защиты от флуда"""
+    print("=== Тестирование защиты от флуда ===")
+    
+    from types import SimpleNamespace
+    from middlewares import ThrottlingMiddleware, THROTTLED_WARNING
+    
+    handled = []
+    
+    async def handler(event, data):
+        handled.append(data['event_from_user'].id)
+    
+    async def feed(middleware, user_ids):
+        fake_bot = FakeBot()
+        for user_id in user_ids:
+            await middleware(handler, None, {'event_from_user': SimpleNamespace(id=user_id), 'bot': fake_bot})
+        return fake_bot
+    
+    stats = {}
+    middleware = ThrottlingMiddleware(per_minute=60, burst=3, global_per_second=0, mode='warn', stats=stats)
+    fake_bot = asyncio.run(feed(middleware, [1, 1, 1, 1, 1, 2]))
+    print(f"  Обработано: {handled}, предупреждений: {len(fake_bot.sent)}")
+    assert handled == [1, 1, 1, 2]
+    assert fake_bot.sent == [1] and fake_bot.texts == [THROTTLED_WARNING]
+    assert stats['updates_throttled'] == 2 and middleware.dropped == 2
+    
+    # Состояния с полным ведром удаляются при очистке
+    assert len(middleware) == 2
+    assert middleware.sweep(now=time.monotonic() + 3600) == 2 and len(middleware) == 0
+    
+    # Общий лимит срабатывает при спаме с разных аккаунтов
+    handled.clear()
+    middleware = ThrottlingMiddleware(per_minute=60, burst=3, global_per_second=2, mode='drop')
+    fake_bot = asyncio.run(feed(middleware, range(10, 20)))
+    assert handled == [10, 11] and fake_bot.sent == []
+    # Отброшенные общим лимитом обновления не тратят личный лимит пользователей
+    assert len(middleware) == 2
+    
+    # Отброшенное нажатие кнопки получает ответ вместо предупреждения сообщением
+    from middlewares import THROTTLED_CALLBACK
+    
+    class CallbackBot(FakeBot):
+        def __init__(self):
+            super().__init__()
+            self.answers = []
+        
+        async def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+            self.answers.append((callback_query_id, text))
+    
+    async def press(middleware, count):
+        fake_bot = CallbackBot()
+        for number in range(count):
+            update = SimpleNamespace(callback_query=SimpleNamespace(id=f"q{number}"))
+            await middleware(handler, update, {'event_from_user': SimpleNamespace(id=30), 'bot': fake_bot})
+        return fake_bot
+    
+    handled.clear()
+    middleware = ThrottlingMiddleware(per_minute=60, burst=2, global_per_second=0, mode='warn')
+    fake_bot = asyncio.run(press(middleware, 4))
+    assert handled == [30, 30] and fake_bot.sent == []
+    assert fake_bot.answers == [("q2", THROTTLED_CALLBACK), ("q3", THROTTLED_CALLBACK)]
+    
+    print()
+
+
+def test_outbound_lanes():
+    """Тест приоритетов и лимитов исходящих запросов"""
+    print("=== Тестирование полос исходящих запросов ===")
+    
+    from aiogram.methods import AnswerCallbackQuery, SendMessage
+    from outbound import OutboundScheduler, outbound_lane, LANE_DELIVERY
+    
+    async def run():
+        sent = []
+        
+        async def make_request(bot, method):
+            sent.append((time.monotonic(), method.__api_method__, getattr(method, 'chat_id', None)))
+        
+        outbound = OutboundScheduler(rate_per_second=200, per_chat_interval=0.1, starvation_limit=4)
+        
+        async def deliver(chat_id):
+            with outbound_lane(LANE_DELIVERY):
+                await outbound(make_request, None, SendMessage(chat_id=chat_id, text="🔔"))
+        
+        async def answer(query_id):
+            await outbound(make_request, None, AnswerCallbackQuery(callback_query_id=str(query_id)))
+        
+        # 30 напоминаний в разные чаты, затем нажатие кнопки и три сообщения меню в один чат
+        tasks = [asyncio.create_task(deliver(chat_id)) for chat_id in range(30)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(answer(1)))
+        tasks += [
+            asyncio.create_task(outbound(make_request, None, SendMessage(chat_id=900, text="меню")))
+            for _ in range(3)
+        ]
+        await asyncio.gather(*tasks)
+        return outbound, sent
+    
+    outbound, sent = asyncio.run(run())
+    methods = [method for _, method, _ in sent]
+    print(f"  Порядок: ответ на кнопку #{methods.index('answerCallbackQuery') + 1}, метрики: {outbound.metrics()}")
+    
+    # Ответ на кнопку обгоняет очередь рассылки
+    assert methods.index('answerCallbackQuery') <= 2
+    # Меню не голодает: первое сообщение меню уходит до конца рассылки
+    first_menu = next(i for i, (_, _, chat_id) in enumerate(sent) if chat_id == 900)
+    assert first_menu < 30
+    # Не чаще одного сообщения в чат за интервал
+    menu_times = [moment for moment, _, chat_id in sent if chat_id == 900]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(menu_times, menu_times[1:]))
+    
+    metrics = outbound.metrics()
+    assert metrics['delivery']['granted'] == 30 and metrics['delivery']['max_depth'] == 30
+    assert metrics['callback']['granted'] == 1 and metrics['menu']['granted'] == 3
+    assert all(lane['depth'] == 0 for lane in metrics.values())
+    
+    # Очередь не пустеет дольше интервала очистки: прошедшие чаты удаляются по ходу работы
+    from clock import VirtualClock
+    from outbound import SWEEP_INTERVAL_SECONDS
+    
+    clock = VirtualClock(datetime(2026, 1, 1, 12, 0, tzinfo=OMSK_TIMEZONE))
+    
+    async def run_long():
+        tracked = []
+        outbound = OutboundScheduler(rate_per_second=2, per_chat_interval=1, clock=clock)
+        
+        async def make_request(bot, method):
+            tracked.append(len(outbound._chat_ready))
+        
+        async def deliver(chat_id):
+            with outbound_lane(LANE_DELIVERY):
+                await outbound(make_request, None, SendMessage(chat_id=chat_id, text="🔔"))
+        
+        tasks = [asyncio.create_task(deliver(chat_id)) for chat_id in range(4 * SWEEP_INTERVAL_SECONDS)]
+        await clock.advance(3 * SWEEP_INTERVAL_SECONDS)
+        await asyncio.gather(*tasks)
+        return tracked
+    
+    tracked = asyncio.run(run_long())
+    print(f"  Чатов в памяти при долгой очереди: не больше {max(tracked)} из {len(tracked)}")
+    assert len(tracked) == 4 * SWEEP_INTERVAL_SECONDS
+    assert max(tracked) <= 2 * SWEEP_INTERVAL_SECONDS + 2
+    
+    # Общий лимит делится между ролями и рабочими процессами
+    from bot import outbound_rate_for
+    from config import OUTBOUND_RATE_PER_SECOND
+    assert outbound_rate_for('all') == OUTBOUND_RATE_PER_SECOND
+    assert outbound_rate_for('interactive') + outbound_rate_for('delivery') == OUTBOUND_RATE_PER_SECOND
+    assert outbound_rate_for('interactive', 3) * 4 == outbound_rate_for('interactive')
+    
+    print()
+
+
+def test_virtual_time_delivery():
+    """Тест планировщика в виртуальном времени: точность, события и повторы"""
+    print("=== Тестирование в виртуальном времени ===")
+    
+    from clock import VirtualClock, set_clock
+    from config import NOTIFICATION_RETRY_ATTEMPTS, NOTIFICATION_RETRY_DELAY_SECONDS
+    from database import ReminderDatabaseV2
+    from events import EVENT_ADDED
+    from scheduler import ReminderScheduler
+    from utils import validate_reminder_time_v2
+    
+    start = datetime(2026, 1, 1, 8, 0, tzinfo=OMSK_TIMEZONE)
+    clock = VirtualClock(start)
+    previous = set_clock(clock)
+    
+    class FlakyBot(FakeBot):
+        """Первая отправка пользователю 2 завершается ошибкой, пользователю 5 - всегда"""
+        
+        def __init__(self):
+            super().__init__()
+            self.times = []
+            self.failed = False
+            self.attempts = []
+        
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 5:
+                self.attempts.append(clock.now())
+                raise RuntimeError("Чат недоступен")
+            if chat_id == 2 and not self.failed:
+                self.failed = True
+                raise RuntimeError("Telegram недоступен")
+            await super().send_message(chat_id, text, **kwargs)
+            self.times.append(clock.now())
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+            
+            # Разбор "только время" опирается на виртуальную дату
+            target, status, is_today_only = validate_reminder_time_v2("09:30")
+            assert status == "success" and is_today_only and target == start.replace(hour=9, minute=30)
+            
+            database.add_reminder(1, target, "Утро")
+            database.add_reminder(2, start + timedelta(hours=5), "С повтором")
+            database.add_reminder(3, start + timedelta(days=1, hours=3), "Завтра")
+            database.add_reminder(5, start + timedelta(hours=6), "Не дойдет")
+            
+            fake_bot = FlakyBot()
+            stats = {'reminders_sent': 0, 'errors_count': 0}
+            scheduler = ReminderScheduler(fake_bot, database, stats, check_interval=3600)
+            
+            async def run():
+                task = asyncio.create_task(scheduler.check_reminders())
+                await clock.advance(3600)
+                
+                # Напоминание, добавленное во время работы, будит планировщик раньше плана
+                database.add_reminder(4, start + timedelta(hours=1, minutes=20), "Новое")
+                scheduler.notify(EVENT_ADDED, start + timedelta(hours=1, minutes=20))
+                await clock.run_until(start + timedelta(days=2))
+                
+                scheduler.stop()
+                await task
+            
+            asyncio.run(run())
+            
+            delivered = dict(zip(fake_bot.sent, fake_bot.times))
+            print(f"  Доставлено: { {user: moment.strftime('%d.%m %H:%M:%S') for user, moment in delivered.items()} }")
+            assert delivered[1] == start.replace(hour=9, minute=30)
+            assert delivered[4] == start + timedelta(hours=1, minutes=20)
+            assert delivered[2] == start + timedelta(hours=5, seconds=NOTIFICATION_RETRY_DELAY_SECONDS)
+            assert delivered[3] == start + timedelta(days=1, hours=3)
+            assert stats['reminders_sent'] == 4
+            
+            # Повторы с удвоением задержки, после последней попытки напоминание снято с отправки
+            gaps = [(b - a).total_seconds() for a, b in zip(fake_bot.attempts, fake_bot.attempts[1:])]
+            print(f"  Попытки пользователю 5: {len(fake_bot.attempts)}, интервалы {gaps}")
+            assert fake_bot.attempts[0] == start + timedelta(hours=6)
+            assert gaps == [NOTIFICATION_RETRY_DELAY_SECONDS * 2 ** n for n in range(NOTIFICATION_RETRY_ATTEMPTS - 1)]
+            assert stats['errors_count'] == 1 + NOTIFICATION_RETRY_ATTEMPTS and stats['reminders_failed'] == 1
+            assert database.get_user_reminders(5) == [] and database.get_stats_summary()['failed_total'] == 1
+            assert scheduler._retries == {}
+    finally:
+        set_clock(previous)
+    
+    print()
+
+
+def test_sharded_database():
+    """Тест базы, разделенной на несколько файлов по user_id"""
+    print("=== Тестирование разделенной базы ===")
+    
+    from database import ShardedReminderDatabase
+    from due_index import DueIndex
+    from scheduler import ReminderScheduler
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ShardedReminderDatabase(os.path.join(tmp_dir, 'reminders.db'), shards=3)
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+        
+        # Пользователи 500-505 попадают во все три файла
+        for user_id in range(500, 506):
+            for i in range(3):
+                database.add_reminder(user_id, now - timedelta(minutes=30 - user_id % 3 - i * 5), f"{user_id}/{i}")
+        database.add_reminder(500, now + timedelta(hours=1), "Позже")
+        
+        files = sorted(os.path.basename(path) for path in os.listdir(tmp_dir) if path.endswith('.db'))
+        print(f"  Файлы: {files}")
+        assert files == ['reminders.shard0.db', 'reminders.shard1.db', 'reminders.shard2.db']
+        
+        # id уникальны между файлами и ведут в файл пользователя
+        reminders = database.get_user_reminders(500)
+        assert len(reminders) == 4
+        all_ids = [reminder[0] for user_id in range(500, 506) for reminder in database.get_user_reminders(user_id)]
+        assert len(set(all_ids)) == 19
+        
+        # Слияние потоков сохраняет порядок по времени и группировку по пользователю
+        batches = list(database.iter_due_reminders(batch_size=4))
+        assert [len(batch) for batch in batches] == [4, 4, 4, 4, 2]
+        rows = [reminder for batch in batches for reminder in batch]
+        assert [row[2] for row in rows] == sorted(row[2] for row in rows)
+        # Группировка по пользователю - внутри пакета, без пересортировки всего потока
+        grouped = list(database.iter_due_reminders(batch_size=4, group_by_user=True))
+        assert [sorted(batch) for batch in grouped] == [sorted(batch) for batch in batches]
+        for batch in grouped:
+            users = [reminder[1] for reminder in batch]
+            runs = [user_id for i, user_id in enumerate(users) if i == 0 or users[i - 1] != user_id]
+            assert len(runs) == len(set(users))
+            assert all(a[2] < b[2] for a, b in zip(batch, batch[1:]) if a[1] == b[1])
+        # Выборка по id тоже идет по времени и группирует только внутри пакета
+        by_ids = list(database.iter_reminders_by_ids(all_ids, batch_size=4))
+        grouped_by_ids = list(database.iter_reminders_by_ids(all_ids, batch_size=4, group_by_user=True))
+        assert [sorted(batch) for batch in grouped_by_ids] == [sorted(batch) for batch in by_ids]
+        assert all([row[2] for row in batch] == sorted(row[2] for row in batch) for batch in by_ids)
+        
+        assert not database.delete_reminder(reminders[0][0], 501)
+        assert database.delete_reminder(reminders[-1][0], 500)
+        assert database.get_next_reminder_time() == now - timedelta(minutes=30)
+        
+        # Планировщик с индексом работает с глобальными id
+        fake_bot = FakeBot()
+        stats = {'reminders_sent': 0, 'errors_count': 0}
+        scheduler = ReminderScheduler(fake_bot, database, stats, due_index=DueIndex(database))
+        asyncio.run(scheduler.deliver_due())
+        print(f"  Сообщений: {len(fake_bot.sent)}, напоминаний: {stats['reminders_sent']}")
+        assert stats['reminders_sent'] == 18 and sorted(fake_bot.sent) == list(range(500, 506))
+        assert database.get_due_reminders() == [] and database.get_next_reminder_time() is None
+        
+        # Очистка по глобальным диапазонам id доходит до всех файлов
+        start_id, end_id = database.get_id_range()
+        cutoff = now + timedelta(days=1)
+        assert database.delete_sent_reminders_in_range(start_id, end_id + 1, cutoff) == 18
+        assert database.get_id_range() is None
+    
+    print()
+
+
+def test_group_commit():
+    """Тест групповой фиксации добавлений напоминаний"""
+    print("=== Тестирование групповой фиксации ===")
+    
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from write_batcher import InsertBatcher
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+        
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=2)
+        ):
+            batcher = InsertBatcher(database, delay_ms=5, max_batch=10)
+            
+            async def run():
+                # 25 одновременных добавлений у 5 пользователей
+                return await asyncio.gather(*(
+                    batcher.add(600 + i % 5, now + timedelta(hours=1, minutes=i), f"Задача {i}")
+                    for i in range(25)
+                ))
+            
+            results = asyncio.run(run())
+            print(f"  {type(database).__name__}: транзакций {batcher.batches}, записано {batcher.committed}")
+            assert batcher.batches == 3 and batcher.committed == 25
+            assert len({reminder_id for reminder_id, _ in results}) == 25
+            # Счетчик - количество активных напоминаний пользователя после фиксации группы
+            assert [count for _, count in results[:10]] == [2] * 10
+            assert [count for _, count in results[20:]] == [5] * 5
+            
+            reminders = database.get_user_reminders(600)
+            assert [reminder[0] for reminder in reminders] == [results[i][0] for i in range(0, 25, 5)]
+            assert reminders[0][2] == "Задача 0"
+        
+        class BrokenDatabase:
+            def add_reminders(self, reminders):
+                raise sqlite3.OperationalError("database is locked")
+        
+        async def run_broken():
+            return await InsertBatcher(BrokenDatabase(), delay_ms=1).add(600, now, "Ошибка")
+        
+        assert asyncio.run(run_broken()) is None
+    
+    print()
+
+
+def test_backup_service():
+    """Тест резервного копирования через SQLite backup API с ротацией"""
+    print("=== Тестирование резервного копирования ===")
+    
+    from clock import VirtualClock
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from maintenance import BackupService
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+        database.add_reminders([(i % 50, now + timedelta(minutes=i), "x" * 200) for i in range(500)])
+        
+        clock = VirtualClock(datetime(2026, 1, 1, 3, 0, tzinfo=OMSK_TIMEZONE))
+        backup_dir = os.path.join(tmp_dir, 'backups')
+        stats = {}
+        service = BackupService(
+            database, backup_dir=backup_dir, interval_hours=24, keep=2,
+            pages_per_step=5, step_pause_ms=0, stats=stats, clock=clock
+        )
+        
+        async def run():
+            assert service.seconds_until_due() == 0
+            reports = []
+            for day in range(3):
+                if day:
+                    await clock.advance(24 * 3600)
+                reports.append(await service.backup_once())
+            await clock.advance(4 * 3600)
+            return reports
+        
+        reports = asyncio.run(run())
+        print(f"  Отчет: {reports[-1]}")
+        assert reports[0]['steps'] > 1 and reports[0]['pages'] > 5
+        assert reports[2]['removed'] == 1 and stats['backups_created'] == 3
+        assert sorted(os.listdir(backup_dir)) == ['backup_20260102_030000.db', 'backup_20260103_030000.db']
+        assert service.seconds_until_due() == 20 * 3600
+        
+        with sqlite3.connect(reports[-1]['files'][0]) as conn:
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+            assert conn.execute("SELECT COUNT(*) FROM reminders_v2").fetchone()[0] == 500
+        
+        # Разделенная база копируется всеми файлами под одной меткой времени
+        sharded = ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=2)
+        report = asyncio.run(BackupService(sharded, backup_dir=os.path.join(tmp_dir, 'sharded_backups')).backup_once())
+        assert [os.path.basename(path)[len('backup_') + 15:] for path in report['files']] == ['.shard0.db', '.shard1.db']
+    
+    print()
+
+
+def test_db_maintenance():
+    """Тест обслуживания базы: инкрементальная очистка в тихие часы, ANALYZE и checkpoint"""
+    print("=== Тестирование обслуживания базы ===")
+    
+    from clock import VirtualClock
+    from database import ReminderDatabaseV2, SCHEMA_VERSION
+    from maintenance import MaintenanceJob
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # База старой версии без auto_vacuum при запуске не переписывается: перевод только по запросу
+        old_path = os.path.join(tmp_dir, 'old.db')
+        with sqlite3.connect(old_path) as conn:
+            conn.execute("CREATE TABLE reminders_v2 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                         "reminder_time TEXT NOT NULL, reminder_text TEXT, created_at TEXT NOT NULL, "
+                         "is_sent BOOLEAN DEFAULT FALSE, UNIQUE(user_id, reminder_time))")
+            conn.execute("INSERT INTO reminders_v2 (user_id, reminder_time, created_at) VALUES (1, '2030-01-01T10:00:00+06:00', '')")
+            conn.execute("PRAGMA user_version = 2")
+        old_database = ReminderDatabaseV2(old_path)
+        with sqlite3.connect(old_path) as conn:
+            assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        
+        # Обслуживание такой базы не пытается возвращать страницы
+        old_job = MaintenanceJob(old_database, vacuum_pause_ms=0, clock=VirtualClock(datetime(2026, 1, 1, 12, 0, tzinfo=OMSK_TIMEZONE)))
+        assert asyncio.run(old_job.run_once(force_vacuum=True))['pages_vacuumed'] == 0
+        
+        assert old_database.enable_incremental_vacuum()
+        with sqlite3.connect(old_path) as conn:
+            assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+            assert conn.execute("SELECT COUNT(*) FROM reminders_v2").fetchone()[0] == 1
+        
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+        database.add_reminders([(i % 100, now + timedelta(minutes=i), "x" * 500) for i in range(3000)])
+        with sqlite3.connect(database.db_path) as conn:
+            conn.execute("DELETE FROM reminders_v2 WHERE id % 10 != 0")
+        database.checkpoint('TRUNCATE')
+        
+        before = database.get_storage_info()
+        assert before['freelist_pages'] > 100
+        
+        clock = VirtualClock(datetime(2026, 1, 1, 12, 0, tzinfo=OMSK_TIMEZONE))
+        stats = {}
+        job = MaintenanceJob(
+            database, analyze_interval_hours=24, quiet_hours="3-5",
+            vacuum_pages_per_step=50, vacuum_max_pages=10_000, vacuum_pause_ms=0, stats=stats, clock=clock
+        )
+        
+        async def run():
+            # Днем - только optimize, ANALYZE (первый проход) и PASSIVE checkpoint
+            day = await job.run_once()
+            await clock.run_until(datetime(2026, 1, 2, 3, 30, tzinfo=OMSK_TIMEZONE))
+            night = await job.run_once()
+            return day, night
+        
+        day, night = asyncio.run(run())
+        print(f"  День: {day}")
+        print(f"  Ночь: {night}")
+        assert day['analyzed'] and day['pages_vacuumed'] == 0 and day['freelist_pages'] > 100
+        assert not night['analyzed'] and night['pages_vacuumed'] == day['freelist_pages']
+        assert night['freelist_pages'] == 0 and night['size_bytes'] < before['size_bytes'] / 2
+        assert night['wal_bytes'] == 0
+        assert stats['db_pages_vacuumed'] == night['pages_vacuumed']
+        
+        with sqlite3.connect(database.db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        assert len(database.get_due_reminders()) == 0 and database.get_reminders_count(9) == 30
+    
+    print()
+
+
+def test_import_export():
+    """Тест импорта напоминаний из CSV/iCalendar и выгрузки /export"""
+    print("=== Тестирование импорта и выгрузки ===")
+    
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from transfer import FORMAT_CSV, FORMAT_ICS, detect_format, import_file, import_reminders, export_reminders
+    
+    assert detect_format("Мои дела.CSV") == FORMAT_CSV and detect_format("calendar.ics") == FORMAT_ICS
+    assert detect_format("photo.jpg") is None and detect_format(None) is None
+    
+    year = datetime.now(OMSK_TIMEZONE).year + 1
+    csv_lines = [
+        "время;текст\n",
+        f"09:00 01.02.{year};Позвонить маме\n",
+        f"10:30 01.02.{year};Купить хлеб; молоко, сыр, яблоки и что-нибудь к чаю\n",
+        "\n",
+        f"25:00 01.02.{year};Неверное время\n",
+        "09:00 01.02.2001;Давно прошло\n",
+        f"09:00 01.02.{year};Повтор той же минуты\n",
+        f"18:00 03.03.{str(year)[2:]};\n",
+    ]
+    ics_lines = [
+        "BEGIN:VCALENDAR\r\n",
+        "BEGIN:VEVENT\r\n",
+        f"DTSTART:{year}0601T030000Z\r\n",
+        "SUMMARY:Встреча\\, обсудить\r\n",
+        "  план\r\n",
+        "END:VEVENT\r\n",
+        "BEGIN:VEVENT\r\n",
+        f"DTSTART;VALUE=DATE:{year}0602\r\n",
+        "SUMMARY:Весь день\r\n",
+        "END:VEVENT\r\n",
+        "BEGIN:VEVENT\r\n",
+        "DTSTART:не время\r\n",
+        "END:VEVENT\r\n",
+        "END:VCALENDAR\r\n",
+    ]
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+        ):
+            report = import_reminders(database, 700, csv_lines, FORMAT_CSV, chunk_size=2)
+            print(f"  CSV ({type(database).__name__}): {report}")
+            assert report['added'] == 3 and report['duplicates'] == 1
+            assert report['invalid'] == 1 and report['past'] == 1 and report['error_lines'] == [5, 6]
+            
+            reminders = database.get_user_reminders(700)
+            assert [text for _, _, text in reminders] == ["Позвонить маме", "Купить хлеб; молоко, сыр, яблоки и что-нибудь к чаю", ""]
+            assert reminders[2][1] == datetime(year, 3, 3, 18, 0, tzinfo=OMSK_TIMEZONE)
+            
+            report = import_reminders(database, 700, ics_lines, FORMAT_ICS)
+            print(f"  ICS: {report}")
+            assert report['added'] == 2 and report['invalid'] == 1
+            reminders = database.get_user_reminders(700)
+            # 03:00 UTC = 09:00 по Омску, событие на весь день - в 09:00
+            assert (reminders[3][1].hour, reminders[3][2]) == (9, "Встреча, обсудить план")
+            assert reminders[4][1] == datetime(year, 6, 2, 9, 0, tzinfo=OMSK_TIMEZONE)
+            
+            # Выгрузка в оба формата и обратный импорт другому пользователю дают те же напоминания
+            for file_format in (FORMAT_CSV, FORMAT_ICS):
+                path = os.path.join(tmp_dir, f'export.{file_format}')
+                assert export_reminders(database, 700, path, file_format, batch_size=2) == 5
+                report = import_file(database, 701, path, file_format)
+                assert report['added'] == 5 and report['invalid'] == 0, report
+                assert [r[1:] for r in database.get_user_reminders(701)] == [r[1:] for r in reminders]
+                for reminder_id, _, _ in database.get_user_reminders(701):
+                    database.delete_reminder(reminder_id, 701)
+            
+            # Ограничение количества строк
+            report = import_reminders(database, 702, csv_lines, FORMAT_CSV, max_rows=2)
+            assert report['truncated'] and report['added'] == 2
+    
+    # Текст из файла попадает в HTML-сообщения только экранированным
+    from handlers import render_reminders_list, send_reminder_to_user_v2, send_reminders_digest_to_user
+    report = import_reminders(get_db(), 703, [f"09:00 01.02.{year};a < b & c\n"], FORMAT_CSV)
+    assert report['added'] == 1
+    reminder_id, reminder_time, reminder_text = get_db().get_user_reminders(703)[0]
+    assert reminder_text == "a < b & c"
+    
+    text, _ = render_reminders_list(703)
+    fake_bot = FakeBot()
+    asyncio.run(send_reminder_to_user_v2(fake_bot, 703, reminder_time, reminder_text, reminder_id))
+    asyncio.run(send_reminders_digest_to_user(fake_bot, 703, [(reminder_time, reminder_text)] * 2))
+    for html_text in [text] + fake_bot.texts:
+        assert "a &lt; b &amp; c" in html_text and "a < b" not in html_text, html_text
+    print("  Текст 'a < b & c' экранирован в списке и доставленных напоминаниях")
+    
+    print()
+
+
+def test_broadcast():
+    """Тест объявлений администратора: темп, контрольная точка, возобновление и блокировки"""
+    print("=== Тестирование объявлений ===")
+    
+    from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+    from aiogram.methods import SendMessage
+    from broadcast import BroadcastService
+    from clock import VirtualClock
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from outbound import OutboundScheduler, outbound_lane, LANE_BROADCAST, LANE_DELIVERY
+    
+    clock = VirtualClock(datetime(2026, 1, 1, 12, 0, tzinfo=OMSK_TIMEZONE))
+    
+    class AnnounceBot(FakeBot):
+        """Пользователь 7 заблокировал бота, на пользователе 3 один раз превышен лимит"""
+        
+        def __init__(self):
+            super().__init__()
+            self.times = []
+            self.limited = False
+        
+        async def send_message(self, chat_id, text, **kwargs):
+            method = SendMessage(chat_id=chat_id, text=text)
+            if chat_id == 7:
+                raise TelegramForbiddenError(method, "bot was blocked by the user")
+            if chat_id == 3 and not self.limited:
+                self.limited = True
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=2)
+            await super().send_message(chat_id, text, **kwargs)
+            self.times.append(clock.monotonic())
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        now = datetime.now(OMSK_TIMEZONE)
+        sharded = ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+        for database in (ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')), sharded):
+            for user_id in range(1, 26):
+                database.add_reminder(user_id, now + timedelta(days=1, minutes=user_id))
+                database.add_reminder(user_id, now + timedelta(days=2, minutes=user_id))
+            batches = list(database.iter_broadcast_recipients(0, batch_size=10))
+            assert [len(batch) for batch in batches] == [10, 10, 5]
+            assert sum(batches, []) == list(range(1, 26))
+        
+        broadcast_id = sharded.create_broadcast("<b>Профилактика</b> в 03:00", created_by=1)
+        fake_bot = AnnounceBot()
+        stats = {}
+        
+        async def run():
+            # Первый запуск останавливается посреди второго пакета (как при перезапуске бота)
+            service = BroadcastService(fake_bot, sharded, stats, rate_per_second=10, concurrency=4, batch_size=10, clock=clock)
+            assert service.resume() == 1 and service.resume() == 0
+            await clock.advance(2.8)
+            await service.stop()
+            checkpoint = sharded.get_broadcasts(running_only=True)[0]
+            checkpoint['sends'] = len(fake_bot.times)
+            
+            service = BroadcastService(fake_bot, sharded, stats, rate_per_second=10, concurrency=4, batch_size=10, clock=clock)
+            assert service.resume() == 1
+            await clock.advance(60)
+            return checkpoint
+        
+        checkpoint = asyncio.run(run())
+        broadcast = sharded.get_broadcasts()[0]
+        print(f"  Контрольная точка: {checkpoint['last_user_id']}, итог: {broadcast}")
+        assert checkpoint['last_user_id'] == 10 and checkpoint['status'] == 'running'
+        assert broadcast['id'] == broadcast_id and broadcast['status'] == 'done' and broadcast['finished_at']
+        assert broadcast['sent'] == 24 and broadcast['blocked'] == 1 and broadcast['failed'] == 0
+        
+        # Каждый получил объявление, повторно - не больше прерванного пакета
+        assert set(fake_bot.sent) == set(range(1, 26)) - {7}
+        assert len(fake_bot.sent) - 24 <= 10
+        # Темп каждого запуска не выше 10 сообщений в секунду
+        for times in (fake_bot.times[:checkpoint['sends']], fake_bot.times[checkpoint['sends']:]):
+            assert all(later - earlier >= 0.099 for earlier, later in zip(times, times[1:]))
+        assert stats['broadcast_blocked'] == 1
+        
+        # Ошибка базы посреди рассылки: рассылка помечается неудавшейся и не возобновляется
+        class BrokenDatabase:
+            def __getattr__(self, name):
+                return getattr(sharded, name)
+            
+            def iter_broadcast_recipients(self, *args):
+                raise sqlite3.OperationalError("disk I/O error")
+        
+        failed_id = sharded.create_broadcast("Сбой", created_by=1)
+        service = BroadcastService(fake_bot, BrokenDatabase(), stats, clock=clock)
+        asyncio.run(service.run_broadcast(sharded.get_broadcasts(running_only=True)[0]))
+        assert sharded.get_broadcasts()[0]['id'] == failed_id and sharded.get_broadcasts()[0]['status'] == 'failed'
+        assert sharded.get_broadcasts(running_only=True) == []
+        
+        # Заблокировавший бота больше не получает объявлений, после /start - снова получает
+        assert 7 not in sum(sharded.iter_broadcast_recipients(), [])
+        sharded.set_user_blocked(7, False)
+        assert 7 in sum(sharded.iter_broadcast_recipients(), [])
+    
+    # Полоса объявлений не обслуживается вне очереди: сначала все напоминания
+    async def run_lanes():
+        granted = []
+        
+        async def make_request(bot, method):
+            granted.append(method.chat_id)
+        
+        outbound = OutboundScheduler(rate_per_second=1000, per_chat_interval=0, starvation_limit=2)
+        
+        async def send(chat_id, lane):
+            with outbound_lane(lane):
+                await outbound(make_request, None, SendMessage(chat_id=chat_id, text="x"))
+        
+        tasks = [asyncio.create_task(send(1000, LANE_BROADCAST))]
+        tasks += [asyncio.create_task(send(chat_id, LANE_DELIVERY)) for chat_id in range(20)]
+        await asyncio.gather(*tasks)
+        return granted
+    
+    granted = asyncio.run(run_lanes())
+    assert granted[-1] == 1000
+    
+    print()
+
+
+def test_stats_counters():
+    """Тест сводной статистики, которую ведут операции записи"""
+    print("=== Тестирование счетчиков /stats ===")
+
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from handlers import render_stats
+
+    def pending_users(files):
+        """Владельцы активных напоминаний прямым чтением строк"""
+        user_ids = []
+        for path in files:
+            with sqlite3.connect(path) as conn:
+                user_ids += [row[0] for row in conn.execute("SELECT user_id FROM reminders_v2 WHERE is_sent = FALSE")]
+        return user_ids
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'single.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'reminders.db'), shards=3)
+        ):
+            files = [shard.db_path for shard in getattr(database, 'shards', [database])]
+
+            database.add_reminder(700, now - timedelta(minutes=2), "Первое")
+            database.add_reminder(700, now - timedelta(minutes=2), "Замена")
+            database.add_reminders([(701, now + timedelta(hours=1), None), (702, now + timedelta(hours=2), None)])
+            assert database.import_reminders(700, [(now + timedelta(hours=3), None), (now - timedelta(minutes=2), None)]) == 1
+
+            summary = database.get_stats_summary()
+            assert summary['pending'] == 4 and summary['active_users'] == 3
+            assert summary['created_total'] == 5
+
+            # Доставка: задержка от времени напоминания, повторная отметка не считается
+            reminder_id = database.get_due_reminders()[0][0]
+            assert database.mark_reminders_sent([reminder_id]) == 1
+            assert database.mark_reminders_sent([reminder_id]) == 0
+            database.record_delivery_failures(2)
+
+            # Удаление последнего напоминания пользователя уменьшает число активных пользователей
+            assert database.delete_reminder(database.get_user_reminders(702)[0][0], 702)
+            assert database.delete_reminder(reminder_id, 700)
+
+            summary = database.get_stats_summary()
+            user_ids = pending_users(files)
+            hour = summary['hourly'][now.strftime('%Y-%m-%dT%H')]
+            print(f"  Счетчики: {({key: value for key, value in summary.items() if key != 'hourly'})}")
+            assert (summary['pending'], summary['active_users']) == (len(user_ids), len(set(user_ids))) == (2, 2)
+            assert summary['sent_total'] == 1 and summary['failed_total'] == 2 and summary['deleted_total'] == 2
+            assert (hour['created'], hour['sent'], hour['deleted'], hour['failed']) == (5, 1, 2, 2)
+            assert 120 <= hour['lag_max'] < 240
+
+            database.set_started_at(now - timedelta(hours=2))
+            text = render_stats(database.get_stats_summary())
+            assert "Активных пользователей: 2" in text and "0 д 2 ч" in text
+
+        # Миграция с прежней схемы заполняет счетчики по существующим строкам
+        path = os.path.join(tmp_dir, 'old.db')
+        database = ReminderDatabaseV2(path)
+        database.add_reminders([(800, now + timedelta(hours=1), None), (801, now + timedelta(hours=1), None)])
+        with sqlite3.connect(path) as conn:
+            conn.executescript(
+                "DROP TABLE stats_counters; DROP TABLE stats_hourly; DROP TABLE user_counters; PRAGMA user_version = 4;"
+            )
+        summary = ReminderDatabaseV2(path).get_stats_summary()
+        assert (summary['pending'], summary['active_users'], summary['created_total']) == (2, 2, 2)
+
+    print()
+
+
+def test_user_settings():
+    """Тест таблицы пользователей, кэша настроек и пропуска заблокировавших бота при рассылке"""
+    print("=== Тестирование настроек пользователей ===")
+
+    from types import SimpleNamespace
+    from aiogram.exceptions import TelegramForbiddenError
+    from aiogram.methods import SendMessage
+    from aiogram.types import Message
+    from bot import ReminderBotV2
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from events import ReminderEvents, EVENT_USER
+    from middlewares import UserSettingsMiddleware
+    from scheduler import ReminderScheduler
+    from user_settings import UserSettingsCache
+
+    class CountingDatabase:
+        """Обертка базы: считает запросы к таблице users"""
+
+        def __init__(self, database):
+            self.database = database
+            self.queries = 0
+
+        def __getattr__(self, name):
+            method = getattr(self.database, name)
+            if name in ('get_users', 'upsert_user', 'set_user_blocked'):
+                self.queries += 1
+            return method
+
+    class BlockedBot(FakeBot):
+        """Пользователь 902 заблокировал бота"""
+
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 902:
+                raise TelegramForbiddenError(SendMessage(chat_id=chat_id, text=text), "bot was blocked by the user")
+            await super().send_message(chat_id, text, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+        ):
+            # Владельцы напоминаний попадают в users при добавлении, остальные - при первом обращении
+            database.add_reminder(900, now + timedelta(hours=1))
+            assert database.get_users([900, 901]) == {900: {
+                'language': None, 'timezone': None, 'quiet_start': None, 'quiet_end': None, 'is_blocked': 0
+            }}
+            assert database.upsert_user(901, 'ru')['language'] == 'ru'
+            assert database.upsert_user(901, 'en')['language'] == 'ru'
+
+            # Кэш: повторные обращения без запросов, вытеснение давно не обращавшихся
+            counting = CountingDatabase(database)
+            cache = UserSettingsCache(counting, max_size=2)
+            cache.ensure(900, 'de')
+            cache.ensure(900, 'de')
+            cache.get(901)
+            assert counting.queries == 2 and cache.metrics()['hits'] == 1
+            cache.prefetch([900, 901, 902])
+            assert counting.queries == 3 and cache.metrics()['size'] == 2
+            assert cache.get(902)['is_blocked'] == 0
+
+            # Блокировка пишется в базу и в кэш, /start снимает ее; получатели объявлений - из users
+            assert cache.set_blocked(901)
+            assert cache.get(901)['is_blocked'] == 1
+            assert list(database.iter_broadcast_recipients()) == [[900]]
+            assert cache.register(901)['is_blocked'] == 0
+            assert sum(database.iter_broadcast_recipients(), []) == [900, 901]
+
+            # /start: одна запись в базу (снимает блокировку, отмеченную другим процессом), кэш остается теплым
+            counting = CountingDatabase(database)
+            cache = UserSettingsCache(counting)
+            cache.ensure(905, 'ru')
+            database.set_user_blocked(905)
+            middleware = UserSettingsMiddleware(cache)
+            user = SimpleNamespace(id=905, language_code='ru')
+            handled = []
+
+            async def handler(event, data):
+                handled.append(data['user_settings']['is_blocked'])
+
+            for text in ("/start", "/start@reminder_bot", "18:00"):
+                message = Message.model_validate({
+                    'message_id': 1, 'date': 0, 'chat': {'id': 905, 'type': 'private'}, 'text': text
+                })
+                asyncio.run(middleware(handler, message, {'event_from_user': user}))
+            assert handled == [0, 0, 0] and counting.queries == 3
+            assert database.get_users([905])[905]['is_blocked'] == 0
+            misses = cache.metrics()['misses']
+            assert cache.get(905)['is_blocked'] == 0 and cache.metrics()['misses'] == misses
+
+            # Событие из этого же процесса не сбрасывает обновленный кэш, из другого процесса - сбрасывает
+            reminder_bot = ReminderBotV2.__new__(ReminderBotV2)
+            reminder_bot.user_settings = cache
+            reminder_bot._signal_listener = None
+            reminder_bot._on_reminder_event(EVENT_USER, None, 905)
+            assert cache.metrics()['size'] == 1
+            reminder_bot._signal_listener = object()
+            reminder_bot._on_reminder_event(EVENT_USER, None, 905)
+            assert cache.metrics()['size'] == 0
+
+            # Рассылка: ошибка "бот заблокирован" отмечает пользователя, дальше его напоминания не отправляются
+            database.add_reminder(902, now - timedelta(minutes=2), "Первое")
+            database.add_reminder(903, now - timedelta(minutes=1), "Другому")
+            fake_bot = BlockedBot()
+            stats = {'reminders_sent': 0, 'errors_count': 0}
+            cache = UserSettingsCache(database)
+            scheduler = ReminderScheduler(fake_bot, database, stats, coalesce=False, user_settings=cache)
+            asyncio.run(scheduler.deliver_due())
+            assert fake_bot.sent == [903] and stats['reminders_skipped'] == 1
+            assert cache.get(902)['is_blocked'] == 1 and database.get_users([902])[902]['is_blocked'] == 1
+
+            database.add_reminder(902, now - timedelta(minutes=1), "Второе")
+            asyncio.run(scheduler.deliver_due())
+            assert fake_bot.sent == [903] and stats['reminders_skipped'] == 2 and stats['errors_count'] == 0
+            assert database.get_due_reminders() == []
+
+        # Миграция переносит отметки из прежней таблицы blocked_users
+        path = os.path.join(tmp_dir, 'old.db')
+        ReminderDatabaseV2(path).add_reminder(910, now + timedelta(hours=1))
+        with sqlite3.connect(path) as conn:
+            conn.executescript('''
+                DROP TABLE users;
+                CREATE TABLE blocked_users (user_id INTEGER PRIMARY KEY, blocked_at TEXT NOT NULL);
+                INSERT INTO blocked_users VALUES (910, '2026-01-01T00:00:00+06:00'), (911, '2026-01-01T00:00:00+06:00');
+                PRAGMA user_version = 5;
+            ''')
+        users = ReminderDatabaseV2(path).get_users([910, 911])
+        assert {user_id: settings['is_blocked'] for user_id, settings in users.items()} == {910: 1, 911: 1}
+
+    # Событие изменения пользователя передает слушателю его id
+    received = []
+    events = ReminderEvents()
+    events.subscribe(lambda *args: received.append(args))
+    events.publish(EVENT_USER, user_id=42)
+    assert received == [(EVENT_USER, None, 42)]
+    print(f"  Кэш: {cache.metrics()}")
+
+    print()
+
+
+def test_full_text_search():
+    """Тест поиска /find: индекс FTS5 ведут триггеры, результаты только пользователя"""
+    print("=== Тестирование поиска по тексту ===")
+
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from callbacks import encode_callback, decode_callback, ACTION_REMINDER, ACTION_SEARCH_PAGE
+    from handlers import render_search_results, _search_query_from_text
+    from config import SEARCH_PAGE_SIZE
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+        ):
+            texts = ["Купить молоко", "Молоко и хлеб к ужину", "Позвонить маме", "Хлеб"]
+            for i, text in enumerate(texts):
+                database.add_reminder(950, now + timedelta(hours=i + 1), text)
+            database.add_reminder(951, now + timedelta(hours=1), "Молоко соседу")
+
+            def found(query, user_id=950):
+                return [text for _, _, text in database.search_reminders(user_id, query)]
+
+            # Начало слова, регистр, все слова запроса, только свои напоминания
+            assert sorted(found("молок")) == ["Купить молоко", "Молоко и хлеб к ужину"]
+            assert found("ХЛЕБ молоко") == ["Молоко и хлеб к ужину"]
+            assert found("молоко", 951) == ["Молоко соседу"]
+            # Синтаксис FTS5 в запросе - просто слова
+            assert found('молоко" OR owner:u951 *') == []
+            assert found("***") == []
+
+            # Страницы
+            assert len(database.search_reminders(950, "хлеб", limit=1)) == 1
+            first, second = (database.search_reminders(950, "хлеб", limit=1, offset=i)[0][0] for i in range(2))
+            assert first != second
+
+            # Замена на то же время, удаление и отправка убирают старый текст из индекса
+            database.add_reminder(950, now + timedelta(hours=3), "Позвонить папе")
+            assert found("маме") == [] and found("папе") == ["Позвонить папе"]
+            reminder_id = database.search_reminders(950, "купить")[0][0]
+            assert database.delete_reminder(reminder_id, 950)
+            assert found("купить") == []
+            reminder_id = database.search_reminders(950, "папе")[0][0]
+            database.mark_reminders_sent([reminder_id])
+            assert found("папе") == []
+
+            for path in (shard.db_path for shard in getattr(database, 'shards', [database])):
+                with sqlite3.connect(path) as conn:
+                    conn.execute("INSERT INTO reminders_fts (reminders_fts) VALUES ('integrity-check')")
+
+        # Экран результатов: страницы и запрос в заголовке для кнопок
+        database = get_db()
+        for i in range(SEARCH_PAGE_SIZE + 2):
+            database.add_reminder(960, now + timedelta(days=1, hours=i), f"Тренировка {i}")
+        text, keyboard = render_search_results(960, "трен<ировка")
+        assert "Ничего не найдено" in text
+        database.add_reminder(961, now + timedelta(days=1), "Сравнить a < b & c")
+        text, _ = render_search_results(961, "сравнить")
+        assert "a &lt; b &amp; c" in text
+        text, keyboard = render_search_results(960, "тренировка")
+        buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+        assert buttons.count(encode_callback(ACTION_SEARCH_PAGE, 1)) == 1
+        assert [decode_callback(b).action for b in buttons].count(ACTION_REMINDER) == SEARCH_PAGE_SIZE
+        assert _search_query_from_text(text.replace("<b>", "")) == "тренировка"
+        text, keyboard = render_search_results(960, "тренировка", 1)
+        buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+        assert encode_callback(ACTION_SEARCH_PAGE, 0) in buttons and encode_callback(ACTION_SEARCH_PAGE, 2) not in buttons
+        print(f"  Вторая страница: {text.splitlines()[0]}")
+
+    print()
+
+
+def test_bulk_delete():
+    """Тест массового удаления: один запрос к базе, отметки в клавиатуре экрана выбора"""
+    print("=== Тестирование массового удаления ===")
+
+    from aiogram.types import CallbackQuery
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from callbacks import (
+        encode_callback, ACTION_BULK_TOGGLE, ACTION_BULK_DELETE_SELECTED, ACTION_BULK_CONFIRM,
+        ACTION_BULK_CONFIRM_SELECTED, ACTION_BULK_SELECT
+    )
+    from handlers import render_bulk_select, callback_dispatch, BULK_SCOPE_ALL, CHECKBOX_ON
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        today = datetime.now(OMSK_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow = today + timedelta(days=1)
+
+        for database in (
+            ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+            ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+        ):
+            for hour in range(1, 6):
+                database.add_reminder(970, today + timedelta(hours=hour), f"сегодня {hour}")
+                database.add_reminder(970, tomorrow + timedelta(hours=hour), f"завтра {hour}")
+            database.add_reminder(971, today + timedelta(hours=1), "чужое")
+            ids = [reminder_id for reminder_id, _, _ in database.get_user_reminders(970)]
+            foreign_id = database.get_user_reminders(971)[0][0]
+
+            # По списку id: чужие напоминания не удаляются
+            assert database.delete_reminders(970, ids[:2] + [foreign_id]) == 2
+            assert database.delete_reminders(970, []) == 0
+            assert database.get_reminders_count(971) == 1
+
+            # Сегодняшние, затем все оставшиеся
+            assert database.delete_reminders(970, start_time=today, end_time=tomorrow) == 3
+            assert all(time >= tomorrow for _, time, _ in database.get_user_reminders(970))
+            assert database.delete_reminders(970) == 5
+            assert database.get_reminders_count(970) == 0 and database.search_reminders(970, "завтра") == []
+
+            summary = database.get_stats_summary()
+            assert summary['deleted_total'] == 10 and summary['pending'] == 1 and summary['active_users'] == 1
+
+    # Экран выбора: отметки хранятся в клавиатуре, удаление отмеченных - одним сообщением
+    class FakeApiBot:
+        def __init__(self):
+            self.edited = None
+            self.answers = []
+
+        async def __call__(self, method, request_timeout=None):
+            if type(method).__name__ == 'EditMessageText':
+                self.edited = method
+            else:
+                self.answers.append(method.text)
+            return True
+
+    def press(data, text, reply_markup):
+        bot = FakeApiBot()
+        message = {
+            'message_id': 1, 'date': 0, 'chat': {'id': 972, 'type': 'private'}, 'text': text,
+            'reply_markup': reply_markup.model_dump(exclude_none=True)
+        }
+        return bot, CallbackQuery.model_validate({
+            'id': '1', 'chat_instance': '1', 'data': data, 'message': message,
+            'from': {'id': 972, 'is_bot': False, 'first_name': 'User'}
+        }, context={'bot': bot})
+
+    database = get_db()
+    now = datetime.now(OMSK_TIMEZONE).replace(second=0, microsecond=0)
+    for i in range(3):
+        database.add_reminder(972, now + timedelta(days=2, hours=i), f"выбор {i}")
+    ids = [reminder_id for reminder_id, _, _ in database.get_user_reminders(972)]
+
+    text, keyboard = render_bulk_select(972, set())
+    for reminder_id in ids[:2]:
+        bot, callback = press(encode_callback(ACTION_BULK_TOGGLE, reminder_id), text, keyboard)
+        asyncio.run(callback_dispatch(callback))
+        text, keyboard = bot.edited.text, bot.edited.reply_markup
+    marked = [b.text for row in keyboard.inline_keyboard for b in row if b.text.startswith(CHECKBOX_ON)]
+    assert len(marked) == 2 and "Выбрано: 2 из 3" in text
+
+    # Удаление отмеченных - только после подтверждения, отмена сохраняет отметки
+    bot, callback = press(encode_callback(ACTION_BULK_DELETE_SELECTED), text, keyboard)
+    asyncio.run(callback_dispatch(callback))
+    assert bot.edited.text.startswith("🗑️ Удалить выбранные напоминания (2)?")
+    assert database.get_reminders_count(972) == 3
+    confirm_text, confirm_keyboard = bot.edited.text, bot.edited.reply_markup
+    
+    bot, callback = press(encode_callback(ACTION_BULK_SELECT), confirm_text, confirm_keyboard)
+    asyncio.run(callback_dispatch(callback))
+    assert "Выбрано: 2 из 3" in bot.edited.text
+    
+    bot, callback = press(encode_callback(ACTION_BULK_CONFIRM_SELECTED), confirm_text, confirm_keyboard)
+    asyncio.run(callback_dispatch(callback))
+    assert bot.edited.text == "✅ Удалено напоминаний: 2"
+    assert [reminder_id for reminder_id, _, _ in database.get_user_reminders(972)] == ids[2:]
+
+    bot, callback = press(encode_callback(ACTION_BULK_CONFIRM, BULK_SCOPE_ALL), bot.edited.text, bot.edited.reply_markup)
+    asyncio.run(callback_dispatch(callback))
+    assert bot.edited.text == "✅ Удалено напоминаний: 1" and database.get_reminders_count(972) == 0
+    print("  Отмеченные, сегодняшние и все напоминания удаляются одним запросом")
+
+    print()
+
+
+def test_callback_codec():
+    """Тест компактной callback_data: версия, действие, аргументы, старый формат"""
+    print("=== Тестирование callback_data ===")
+
+    import base64
+    from callbacks import (
+        encode_callback, decode_callback, CallbackData, MAX_CALLBACK_BYTES, ACTION_ARGS,
+        ACTION_MAIN_MENU, ACTION_REMINDER, ACTION_CONFIRM_DELETE, ACTION_HELP
+    )
+    from handlers import CALLBACK_HANDLERS
+
+    # Каждое действие обрабатывается, туда и обратно без потерь
+    assert set(CALLBACK_HANDLERS) == set(ACTION_ARGS)
+    for reminder_id in (0, 127, 128, 10 ** 9, 2 ** 63):
+        data = encode_callback(ACTION_REMINDER, reminder_id)
+        assert len(data.encode()) <= MAX_CALLBACK_BYTES
+        assert decode_callback(data) == CallbackData(ACTION_REMINDER, (reminder_id,))
+    data = encode_callback(ACTION_HELP, new_message=True)
+    assert decode_callback(data) == CallbackData(ACTION_HELP, (), True)
+    print(f"  Кнопка напоминания #1000000: {encode_callback(ACTION_REMINDER, 10 ** 6)!r}")
+
+    for bad_args in ((), (1, 2), (-1,)):
+        try:
+            encode_callback(ACTION_REMINDER, *bad_args)
+            assert False, bad_args
+        except ValueError:
+            pass
+
+    # Кнопки старых сообщений
+    assert decode_callback("main_menu") == CallbackData(ACTION_MAIN_MENU)
+    assert decode_callback("confirm_delete_42") == CallbackData(ACTION_CONFIRM_DELETE, (42,))
+    assert decode_callback("reminder_5") == CallbackData(ACTION_REMINDER, (5,))
+
+    # Другая версия, обрезанные или чужие данные - не распознаются
+    other_version = base64.urlsafe_b64encode(bytes((2, ACTION_MAIN_MENU, 0))).decode().rstrip("=")
+    truncated = encode_callback(ACTION_REMINDER, 10 ** 6)[:-2]
+    for data in (other_version, truncated, "reminder_x", "reminder_", "help:new", "find_page_2", "unknown", "", None, "AQ"):
+        assert decode_callback(data) is None, data
+
+    print()
+
+
+def test_snooze():
+    """Тест кнопок "отложить": та же строка снова ожидает отправки и доставляется планировщиком"""
+    print("=== Тестирование отложенных напоминаний ===")
+
+    from aiogram.types import CallbackQuery
+    from callbacks import decode_callback, ACTION_SNOOZE, ACTION_SNOOZE_ALL
+    from clock import VirtualClock, set_clock
+    from database import ReminderDatabaseV2, ShardedReminderDatabase
+    from due_index import DueIndex
+    from events import reminder_events
+    from handlers import callback_dispatch, _snooze_time, SNOOZE_10_MIN, SNOOZE_1_HOUR, SNOOZE_TOMORROW
+    from scheduler import ReminderScheduler
+
+    start = datetime(2026, 3, 1, 8, 0, tzinfo=OMSK_TIMEZONE)
+    clock = VirtualClock(start)
+    previous = set_clock(clock)
+
+    class SnoozeBot:
+        """Запоминает напоминания с клавиатурами, правки сообщений и ответы на нажатия"""
+
+        def __init__(self):
+            self.delivered = []
+            self.edited = []
+            self.answers = []
+
+        async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+            self.delivered.append((clock.now(), text, reply_markup))
+
+        async def __call__(self, method, request_timeout=None):
+            if type(method).__name__ == 'EditMessageText':
+                self.edited.append(method)
+            else:
+                self.answers.append(method.text)
+            return True
+
+    def press(bot, text, reply_markup, option):
+        data = next(
+            button.callback_data for button in reply_markup.inline_keyboard[0]
+            if decode_callback(button.callback_data).args[1] == option
+        )
+        return CallbackQuery.model_validate({
+            'id': '1', 'chat_instance': '1', 'data': data,
+            'from': {'id': 980, 'is_bot': False, 'first_name': 'User'},
+            'message': {
+                'message_id': 1, 'date': 0, 'chat': {'id': 980, 'type': 'private'}, 'text': text,
+                'reply_markup': reply_markup.model_dump(exclude_none=True)
+            }
+        }, context={'bot': bot})
+
+    try:
+        database = get_db()
+        database.add_reminder(980, start + timedelta(hours=1), "Полить цветы")
+        reminder_id = database.get_user_reminders(980)[0][0]
+
+        bot = SnoozeBot()
+        stats = {'reminders_sent': 0, 'errors_count': 0}
+        scheduler = ReminderScheduler(bot, database, stats, check_interval=3600, due_index=DueIndex(database))
+        reminder_events.subscribe(scheduler.notify)
+
+        async def run():
+            task = asyncio.create_task(scheduler.check_reminders())
+            await clock.run_until(start + timedelta(hours=1, minutes=1))
+
+            # Под напоминанием - кнопки "отложить"; +10 мин от момента нажатия
+            _, text, reply_markup = bot.delivered[0]
+            assert [decode_callback(b.callback_data).action for b in reply_markup.inline_keyboard[0]] == [ACTION_SNOOZE] * 3
+            await callback_dispatch(press(bot, text, reply_markup, SNOOZE_10_MIN))
+            assert database.get_user_reminders(980) == [(reminder_id, start + timedelta(hours=1, minutes=11), "Полить цветы")]
+            assert "Отложено на" in bot.edited[-1].text and len(bot.edited[-1].reply_markup.inline_keyboard) == 2
+
+            # Повторное нажатие на старой клавиатуре: напоминание уже ожидает отправки
+            await callback_dispatch(press(bot, text, reply_markup, SNOOZE_1_HOUR))
+            assert bot.answers[-1].startswith("Не удалось отложить")
+
+            await clock.run_until(start + timedelta(hours=2))
+            scheduler.stop()
+            await task
+
+        asyncio.run(run())
+        reminder_events.unsubscribe(scheduler.notify)
+
+        assert [moment for moment, _, _ in bot.delivered] == [start + timedelta(hours=1), start + timedelta(hours=1, minutes=11)]
+        assert database.get_reminders_count(980) == 0 and stats['reminders_sent'] == 2
+        assert _snooze_time(SNOOZE_TOMORROW, start + timedelta(hours=1)) == start + timedelta(days=1, hours=1)
+        print(f"  Доставлено: {[moment.strftime('%H:%M') for moment, _, _ in bot.delivered]}")
+
+        # Объединенное сообщение и сводка пропущенных откладываются целиком, интервалы сохраняются
+        def press_all(bot, text, reply_markup, option):
+            data = next(
+                button.callback_data for button in reply_markup.inline_keyboard[0]
+                if decode_callback(button.callback_data).action == ACTION_SNOOZE_ALL
+                and decode_callback(button.callback_data).args[0] == option
+            )
+            return CallbackQuery.model_validate({
+                'id': '1', 'chat_instance': '1', 'data': data,
+                'from': {'id': 983, 'is_bot': False, 'first_name': 'User'},
+                'message': {
+                    'message_id': 1, 'date': 0, 'chat': {'id': 983, 'type': 'private'}, 'text': text,
+                    'reply_markup': reply_markup.model_dump(exclude_none=True)
+                }
+            }, context={'bot': bot})
+
+        now = clock.now()
+        database.add_reminder(983, now - timedelta(minutes=20), "Первое")
+        database.add_reminder(983, now - timedelta(minutes=5), "Второе")
+        database.add_reminder(983, now - timedelta(hours=3), "Давно")
+        bot = SnoozeBot()
+        scheduler = ReminderScheduler(bot, database, stats, stale_policy='summary', stale_minutes=60)
+        asyncio.run(scheduler.deliver_due())
+        assert [text.startswith("🔕") for _, text, _ in bot.delivered] == [False, True]
+
+        _, text, reply_markup = bot.delivered[0]
+        asyncio.run(callback_dispatch(press_all(bot, text, reply_markup, SNOOZE_10_MIN)))
+        assert [time for _, time, _ in database.get_user_reminders(983)] == [now + timedelta(minutes=10), now + timedelta(minutes=25)]
+        assert "Отложено напоминаний: 2" in bot.edited[-1].text and len(bot.edited[-1].reply_markup.inline_keyboard) == 2
+
+        _, text, reply_markup = bot.delivered[1]
+        asyncio.run(callback_dispatch(press_all(bot, text, reply_markup, SNOOZE_1_HOUR)))
+        assert (now + timedelta(hours=1), "Давно") in [(time, text) for _, time, text in database.get_user_reminders(983)]
+        assert database.get_reminders_count(983) == 3
+
+        # Без планировщика: основная таблица, файл истории и файлы шардов
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for database in (
+                ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db')),
+                ReminderDatabaseV2(os.path.join(tmp_dir, 'history.db'), history_enabled=True),
+                ShardedReminderDatabase(os.path.join(tmp_dir, 'sharded.db'), shards=3)
+            ):
+                reminder_time = start + timedelta(hours=1)
+                database.add_reminder(981, reminder_time, "Купить хлеб")
+                database.add_reminder(981, start + timedelta(hours=3), "Другое")
+                reminder_id = database.get_user_reminders(981)[0][0]
+                database.mark_reminders_sent([reminder_id])
+
+                assert not database.snooze_reminder(reminder_id, 982, start + timedelta(hours=2), reminder_time)
+                assert not database.snooze_reminder(reminder_id, 981, start + timedelta(hours=3), reminder_time)
+                assert database.snooze_reminder(reminder_id, 981, start + timedelta(hours=2), reminder_time)
+                assert database.get_user_reminders(981)[0] == (reminder_id, start + timedelta(hours=2), "Купить хлеб")
+                assert database.search_reminders(981, "хлеб")[0][0] == reminder_id
+                assert database.get_stats_summary()['pending'] == 2 and database.get_reminders_count(981) == 2
+    finally:
+        set_clock(previous)
+
+    print()
+
+
+def test_startup_import_time():
+    """Тест быстрого импорта базовых модулей без побочных эффектов"""
+    print("=== Тестирование времени запуска ===")
+    
+    modules = ('config', 'database', 'utils', 'events')
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'reminders.db')
+        log_path = os.path.join(tmp_dir, 'logs', 'bot.log')
+        env = {**os.environ, 'DB_PATH': db_path, 'LOG_FILE': log_path}
+        env.pop('BOT_TOKEN', None)
+        
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        
+        # Формат строк: "import time: self [us] | cumulative | imported package"
+        cumulative_us = 0
+        imported = []
+        for line in result.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].rstrip()
+            imported.append(name.strip())
+            if name.strip() in modules and name == ' ' + name.strip():
+                cumulative_us += int(parts[1])
+        
+        print(f"  Импорт {', '.join(modules)}: {cumulative_us / 1000:.1f} мс (бюджет {STARTUP_IMPORT_BUDGET_MS} мс)")
+        assert cumulative_us / 1000 < STARTUP_IMPORT_BUDGET_MS
+        
+        # Импорт не подтягивает aiogram, не создает базу и не открывает лог
+        assert not any(name.startswith('aiogram') for name in imported)
+        assert not os.path.exists(db_path)
+        assert not os.path.exists(log_path)
+    
+    # Повторная инициализация базы ничего не делает
+    from database import ReminderDatabaseV2
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = ReminderDatabaseV2(os.path.join(tmp_dir, 'reminders.db'))
+        database.init_database()
+        database.init_database()
+    
+    print()
+
+
+def test_webhook_secret():
+    """Тест проверки секрета webhook: без секрета бот не запускается, чужие запросы отклоняются"""
+    print("=== Тестирование секрета webhook ===")
+    
+    from aiogram import Bot, Dispatcher
+    from aiohttp.test_utils import TestClient, TestServer
+    from bot import ReminderBotV2
+    
+    # Экземпляр без __init__: приложению нужны только бот и диспетчер
+    reminder_bot = ReminderBotV2.__new__(ReminderBotV2)
+    reminder_bot.bot = Bot(token="123456:TEST")
+    reminder_bot.dp = Dispatcher()
+    
+    try:
+        reminder_bot.create_webhook_app(secret_token='')
+        assert False, "webhook без секрета не должен создаваться"
+    except ValueError:
+        pass
+    
+    async def run():
+        statuses = {}
+        update = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': "/start"}}
+        async with TestClient(TestServer(reminder_bot.create_webhook_app(secret_token='s3cret'))) as client:
+            for name, headers in (
+                ('missing', {}),
+                ('wrong', {'X-Telegram-Bot-Api-Secret-Token': 'guess'}),
+                ('valid', {'X-Telegram-Bot-Api-Secret-Token': 's3cret'}),
+            ):
+                response = await client.post('/webhook', json=update, headers=headers)
+                statuses[name] = response.status
+        await reminder_bot.bot.session.close()
+        return statuses
+    
+    statuses = asyncio.run(run())
+    print(f"  Ответы: {statuses}")
+    assert statuses == {'missing': 401, 'wrong': 401, 'valid': 200}
+    
+    print()
+
+
 async def main():
     """Главная функция тестирования"""
     print("🚀 Запуск тестирования Telegram-бота 'Напоминалка' v2.0")
@@ -179,6 +1939,31 @@ async def main():
         test_formatting_functions()
         test_edge_cases()
         test_year_detection()
+        test_user_sharding()
+        test_delivery_signals()
+        test_retention_job()
+        test_history_partitions()
+        test_streaming_catch_up()
+        test_coalesced_delivery()
+        test_due_index()
+        test_navigation_edit_in_place()
+        test_throttling_middleware()
+        test_outbound_lanes()
+        test_virtual_time_delivery()
+        test_sharded_database()
+        test_group_commit()
+        test_backup_service()
+        test_db_maintenance()
+        test_import_export()
+        test_broadcast()
+        test_stats_counters()
+        test_user_settings()
+        test_full_text_search()
+        test_bulk_delete()
+        test_callback_codec()
+        test_snooze()
+        test_webhook_secret()
+        test_startup_import_time()
         
         print("🎉 Все тесты v2.0 пройдены успешно!")
         print("✨ Новые возможности:")
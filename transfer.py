@@ -0,0 +1,341 @@
+"""
+Импорт напоминаний из файлов CSV и iCalendar и выгрузка (/export)
+
+Файл читается построчно: каждая строка проверяется тем же разбором времени,
+что и сообщения пользователя (utils.validate_reminder_time_v2), и записывается
+пакетами по IMPORT_CHUNK_SIZE одной транзакцией executemany. Выгрузка читает
+напоминания курсором пакетами и сразу пишет их в файл, поэтому память не
+зависит ни от размера файла, ни от количества напоминаний.
+
+CSV: время и текст через запятую или точку с запятой, время - в любом
+формате сообщений бота ("18:00 12.06.2025"), первая строка может быть
+заголовком. iCalendar: события VEVENT, время - DTSTART, текст - SUMMARY
+(повторения RRULE не разворачиваются, берется первое наступление).
+"""
+import csv
+import itertools
+import logging
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from clock import get_clock
+from config import IMPORT_MAX_ROWS, IMPORT_CHUNK_SIZE, DUE_INDEX_HORIZON_HOURS, OMSK_TIMEZONE
+from utils import parse_time_and_date_v2, validate_reminder_time_v2
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = 'csv'
+FORMAT_ICS = 'ics'
+FORMATS = (FORMAT_CSV, FORMAT_ICS)
+
+# Формат времени в выгрузке CSV - тот же, что понимает бот в сообщениях
+CSV_TIME_FORMAT = "%H:%M %d.%m.%Y"
+
+# Длина текста напоминания из файла (длиннее - обрезается)
+MAX_TEXT_LENGTH = 1000
+
+# Время для событий на весь день (DTSTART;VALUE=DATE)
+ALL_DAY_TIME = time(9, 0)
+
+# Сколько номеров ошибочных строк показывать пользователю
+ERROR_SAMPLES = 5
+
+# Длина строки iCalendar в октетах (длинные строки переносятся)
+ICS_LINE_OCTETS = 75
+
+
+def detect_format(file_name: Optional[str]) -> Optional[str]:
+    """
+    Формат файла по расширению
+
+    Returns:
+        Optional[str]: FORMAT_CSV, FORMAT_ICS или None, если формат не поддерживается
+    """
+    suffix = (file_name or '').rsplit('.', 1)[-1].lower()
+    if suffix in ('csv', 'txt'):
+        return FORMAT_CSV
+    if suffix in ('ics', 'ical', 'ifb'):
+        return FORMAT_ICS
+    return None
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[Tuple[int, str, str]]:
+    """
+    Строки CSV: разделитель (запятая или точка с запятой) определяется по первой строке
+
+    Yields:
+        Tuple[int, str, str]: (номер строки, время, текст)
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    reader = csv.reader(itertools.chain((first,), lines), delimiter=delimiter)
+    for row in reader:
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        # Текст мог содержать неэкранированный разделитель - собираем остаток строки
+        text = delimiter.join(row[1:]).strip()
+        # Заголовок пропускается: первая строка, в которой нет времени
+        if reader.line_num == 1 and parse_time_and_date_v2(row[0]) is None:
+            continue
+        yield reader.line_num, row[0], text
+
+
+def _unfold_ics(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Склеить перенесенные строки iCalendar (продолжение начинается с пробела или табуляции)"""
+    current = None
+    start = 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, number
+    if current is not None:
+        yield start, current
+
+
+def _unescape_ics(value: str) -> str:
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            result.append('\n' if escaped in ('n', 'N') else escaped)
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def _escape_ics(value: str) -> str:
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def _parse_ics_time(params: dict, value: str) -> Optional[datetime]:
+    """Время DTSTART по времени Омска: UTC (...Z), с TZID, без пояса (как Омск) или дата"""
+    value = value.strip()
+    try:
+        if params.get('VALUE') == 'DATE' or len(value) == 8:
+            return datetime.combine(datetime.strptime(value, '%Y%m%d').date(), ALL_DAY_TIME, OMSK_TIMEZONE)
+
+        if value.endswith('Z'):
+            moment = datetime.strptime(value[:15], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+            return moment.astimezone(OMSK_TIMEZONE)
+
+        moment = datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+        zone = OMSK_TIMEZONE
+        if 'TZID' in params:
+            try:
+                zone = ZoneInfo(params['TZID'].strip('"'))
+            except Exception:
+                logger.debug(f"Неизвестный часовой пояс {params['TZID']}, считаем время омским")
+        return moment.replace(tzinfo=zone).astimezone(OMSK_TIMEZONE)
+    except ValueError:
+        return None
+
+
+def iter_ics_events(lines: Iterable[str]) -> Iterator[Tuple[int, str, str]]:
+    """
+    События VEVENT из файла iCalendar
+
+    Yields:
+        Tuple[int, str, str]: (номер строки BEGIN:VEVENT, время в формате сообщений бота или
+            исходное значение DTSTART, если его не удалось разобрать, текст)
+    """
+    event_line = None
+    start_text = ''
+    summary = ''
+
+    for number, line in _unfold_ics(lines):
+        name, _, value = line.partition(':')
+        name, *raw_params = name.split(';')
+        name = name.upper()
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event_line, start_text, summary = number, '', ''
+        elif event_line is None:
+            continue
+        elif name == 'DTSTART':
+            params = dict(param.partition('=')[::2] for param in raw_params)
+            moment = _parse_ics_time({key.upper(): val for key, val in params.items()}, value)
+            start_text = moment.strftime(CSV_TIME_FORMAT) if moment else value
+        elif name == 'SUMMARY':
+            summary = _unescape_ics(value)
+        elif name == 'END' and value.upper() == 'VEVENT':
+            yield event_line, start_text, summary.strip()
+            event_line = None
+
+
+def import_reminders(
+    database,
+    user_id: int,
+    lines: Iterable[str],
+    file_format: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    max_rows: int = IMPORT_MAX_ROWS
+) -> dict:
+    """
+    Импортировать напоминания пользователя из строк файла (блокирующий вызов, для потока)
+
+    Args:
+        database: База данных напоминаний
+        user_id: ID пользователя
+        lines: Строки файла (например, открытый текстовый файл)
+        file_format: FORMAT_CSV или FORMAT_ICS
+        chunk_size: Строк в одной транзакции
+        max_rows: Максимум строк; остальные не читаются
+
+    Returns:
+        dict: added, duplicates, invalid, past, failed, truncated, error_lines (номера первых
+            ошибочных строк), wake_times (минуты ближайших напоминаний - для планировщика)
+    """
+    rows = iter_ics_events(lines) if file_format == FORMAT_ICS else iter_csv_rows(lines)
+    report = {
+        'added': 0, 'duplicates': 0, 'invalid': 0, 'past': 0, 'failed': 0,
+        'truncated': False, 'error_lines': [], 'wake_times': set()
+    }
+    # Напоминания в пределах горизонта индекса планировщика нужно сообщить ему поминутно
+    wake_before = get_clock().now() + timedelta(hours=DUE_INDEX_HORIZON_HOURS + 1)
+
+    chunk = []
+
+    def flush():
+        added = database.import_reminders(user_id, chunk)
+        if added is None:
+            report['failed'] += len(chunk)
+        else:
+            report['added'] += added
+            report['duplicates'] += len(chunk) - added
+        chunk.clear()
+
+    for count, (line_number, time_text, text) in enumerate(rows):
+        if count >= max_rows:
+            report['truncated'] = True
+            break
+
+        reminder_time, status, _ = validate_reminder_time_v2(time_text)
+        if reminder_time is None:
+            report['invalid' if status == 'invalid_format' else 'past'] += 1
+            if len(report['error_lines']) < ERROR_SAMPLES:
+                report['error_lines'].append(line_number)
+            continue
+
+        if reminder_time < wake_before:
+            report['wake_times'].add(reminder_time)
+        chunk.append((reminder_time, text[:MAX_TEXT_LENGTH] or None))
+        if len(chunk) >= chunk_size:
+            flush()
+
+    if chunk:
+        flush()
+
+    report['wake_times'] = sorted(report['wake_times'])
+    logger.info(
+        f"Импорт для пользователя {user_id}: добавлено {report['added']}, повторов {report['duplicates']}, "
+        f"ошибочных строк {report['invalid']}, в прошлом {report['past']}"
+    )
+    return report
+
+
+def import_file(database, user_id: int, path: str, file_format: str, **kwargs) -> dict:
+    """
+    Импортировать напоминания из файла на диске (см. import_reminders)
+
+    Файл читается как UTF-8 (с BOM или без), неверные байты заменяются.
+    """
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as file:
+        return import_reminders(database, user_id, file, file_format, **kwargs)
+
+
+def _fold_ics(line: str) -> str:
+    """Перенести строку iCalendar длиннее ICS_LINE_OCTETS октетов, не разрывая символы UTF-8"""
+    if len(line.encode('utf-8')) <= ICS_LINE_OCTETS:
+        return line + '\r\n'
+
+    parts = []
+    current = ''
+    size = 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        # Строки продолжения начинаются с пробела, он тоже занимает октет
+        limit = ICS_LINE_OCTETS if not parts else ICS_LINE_OCTETS - 1
+        if size + char_size > limit:
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def export_reminders(
+    database,
+    user_id: int,
+    path: str,
+    file_format: str,
+    batch_size: int = IMPORT_CHUNK_SIZE,
+    include_sent: bool = False
+) -> int:
+    """
+    Выгрузить напоминания пользователя в файл (блокирующий вызов, для потока)
+
+    Выгрузка активных напоминаний в CSV импортируется обратно без изменений.
+
+    Args:
+        database: База данных напоминаний
+        user_id: ID пользователя
+        path: Путь к создаваемому файлу
+        file_format: FORMAT_CSV или FORMAT_ICS
+        batch_size: Сколько напоминаний читать из базы за раз
+        include_sent: Добавить отправленные напоминания, в том числе из файлов истории
+
+    Returns:
+        int: Количество выгруженных напоминаний
+    """
+    exported = 0
+    stamp = get_clock().now().astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if file_format == FORMAT_ICS:
+            file.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Reminder Bot//RU\r\n")
+        else:
+            writer = csv.writer(file)
+            writer.writerow(('time', 'text'))
+
+        batches = database.iter_user_reminders(user_id, batch_size)
+        if include_sent:
+            sent = ((reminder_id, reminder_time, reminder_text)
+                    for reminder_id, _, reminder_time, reminder_text in database.iter_sent_reminders(user_id))
+            batches = itertools.chain(batches, iter(lambda: list(itertools.islice(sent, batch_size)), []))
+
+        for batch in batches:
+            if file_format == FORMAT_ICS:
+                lines = []
+                for reminder_id, reminder_time, reminder_text in batch:
+                    start = reminder_time.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+                    lines.append("BEGIN:VEVENT\r\n")
+                    lines.append(f"UID:reminder-{reminder_id}-{user_id}\r\n")
+                    lines.append(f"DTSTAMP:{stamp}\r\nDTSTART:{start}\r\n")
+                    if reminder_text:
+                        lines.append(_fold_ics(f"SUMMARY:{_escape_ics(reminder_text)}"))
+                    lines.append("END:VEVENT\r\n")
+                file.write(''.join(lines))
+            else:
+                writer.writerows(
+                    (reminder_time.strftime(CSV_TIME_FORMAT), reminder_text) for _, reminder_time, reminder_text in batch
+                )
+            exported += len(batch)
+
+        if file_format == FORMAT_ICS:
+            file.write("END:VCALENDAR\r\n")
+
+    logger.info(f"Выгружено {exported} напоминаний пользователя {user_id} в {file_format}")
+    return exported
@@ -0,0 +1,135 @@
+"""
+Настройки пользователей в памяти процесса (LRU поверх таблицы users)
+
+Обработчики и рассылка напоминаний читают язык, часовой пояс, тихие часы и
+отметку о блокировке отсюда, а не из базы на каждое обновление или отправку.
+Промах читает одну строку (или пакет строк через prefetch), запись идет
+в базу и в кэш. Другие процессы узнают об изменении по событию EVENT_USER
+и сбрасывают свою запись (invalidate).
+"""
+import logging
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from config import USER_CACHE_SIZE
+from database import get_db, USER_SETTINGS_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Настройки пользователя, которого еще нет в базе
+DEFAULT_SETTINGS = dict.fromkeys(USER_SETTINGS_FIELDS)
+DEFAULT_SETTINGS['is_blocked'] = 0
+
+
+class UserSettingsCache:
+    """LRU настроек пользователей с чтением из базы при промахе"""
+
+    def __init__(self, database, max_size: int = USER_CACHE_SIZE):
+        """
+        Args:
+            database: База данных напоминаний (таблица users)
+            max_size: Максимум пользователей в кэше
+        """
+        self.db = database
+        self.max_size = max(1, max_size)
+        self._settings: 'OrderedDict[int, dict]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, user_id: int, settings: dict) -> dict:
+        self._settings[user_id] = settings
+        self._settings.move_to_end(user_id)
+        while len(self._settings) > self.max_size:
+            self._settings.popitem(last=False)
+        return settings
+
+    def _lookup(self, user_id: int) -> Optional[dict]:
+        settings = self._settings.get(user_id)
+        if settings is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._settings.move_to_end(user_id)
+        return settings
+
+    def get(self, user_id: int) -> dict:
+        """
+        Настройки пользователя (при промахе - из базы, для неизвестного - DEFAULT_SETTINGS)
+
+        Returns:
+            dict: Настройки USER_SETTINGS_FIELDS (не изменять - общий объект кэша)
+        """
+        settings = self._lookup(user_id)
+        if settings is None:
+            settings = self._store(user_id, self.db.get_users([user_id]).get(user_id, DEFAULT_SETTINGS))
+        return settings
+
+    def prefetch(self, user_ids: Iterable[int]):
+        """Загрузить одним запросом настройки пользователей, которых нет в кэше (перед пакетом отправок)"""
+        missing = [user_id for user_id in set(user_ids) if user_id not in self._settings]
+        if not missing:
+            return
+        found = self.db.get_users(missing)
+        for user_id in missing:
+            self._store(user_id, found.get(user_id, DEFAULT_SETTINGS))
+
+    def ensure(self, user_id: int, language: Optional[str] = None) -> dict:
+        """
+        Настройки пользователя; при первом обращении в этом процессе пользователь
+        добавляется в базу или обновляется время его последнего обращения
+
+        Args:
+            user_id: ID пользователя Telegram
+            language: Язык из профиля Telegram
+        """
+        settings = self._lookup(user_id)
+        if settings is None:
+            settings = self._store(user_id, self.db.upsert_user(user_id, language) or DEFAULT_SETTINGS)
+        return settings
+
+    def register(self, user_id: int, language: Optional[str] = None) -> dict:
+        """Пользователь запустил бота (/start): запись в базу всегда, отметка о блокировке снимается"""
+        settings = self.db.upsert_user(user_id, language, unblock=True)
+        if settings is None:
+            self._settings.pop(user_id, None)
+            return DEFAULT_SETTINGS
+        return self._store(user_id, settings)
+
+    def set_blocked(self, user_id: int, blocked: bool = True) -> bool:
+        """
+        Отметить, что пользователь заблокировал бота (или снять отметку)
+
+        Returns:
+            bool: True если записано в базу
+        """
+        if not self.db.set_user_blocked(user_id, blocked):
+            return False
+        settings = self._settings.get(user_id)
+        if settings is not None:
+            self._settings[user_id] = {**settings, 'is_blocked': int(blocked)}
+        return True
+
+    def invalidate(self, user_id: int):
+        """Забыть настройки пользователя (изменены другим процессом)"""
+        self._settings.pop(user_id, None)
+
+    def metrics(self) -> dict:
+        """Размер кэша и доля попаданий"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._settings),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+_cache: Optional[UserSettingsCache] = None
+
+
+def get_user_settings() -> UserSettingsCache:
+    """Общий кэш настроек пользователей (создается при первом обращении)"""
+    global _cache
+    if _cache is None:
+        _cache = UserSettingsCache(get_db())
+    return _cache
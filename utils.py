@@ -6,6 +6,7 @@ import re
 import logging
 from datetime import datetime, time, date
 from typing import Optional, Tuple
+from clock import get_clock
 from config import OMSK_TIMEZONE
 
 logger = logging.getLogger(__name__)
@@ -35,7 +36,7 @@ def parse_time_and_date_v2(text: str) -> Optional[Tuple[datetime, bool]]:
         None если формат неверный
     """
     text = text.strip()
-    current_year = datetime.now(OMSK_TIMEZONE).year
+    current_year = get_clock().now().year
     
     # Попробуем полный формат "ЧЧ:ММ ДД.ММ.ГГГГ"
     match = TIME_DATE_FULL_PATTERN.match(text)
@@ -63,7 +64,7 @@ def parse_time_and_date_v2(text: str) -> Optional[Tuple[datetime, bool]]:
         # Если дата уже прошла в этом году, используем следующий год
         try:
             target_date = date(year, month, day)
-            current_date = datetime.now(OMSK_TIMEZONE).date()
+            current_date = get_clock().now().date()
             
             if target_date < current_date:
                 year += 1
@@ -79,7 +80,7 @@ def parse_time_and_date_v2(text: str) -> Optional[Tuple[datetime, bool]]:
         hour, minute = map(int, match.groups())
         
         # Используем текущую дату в часовом поясе Омска
-        current_datetime = datetime.now(OMSK_TIMEZONE)
+        current_datetime = get_clock().now()
         current_date = current_datetime.date()
         
         return _create_datetime(hour, minute, current_date.day, current_date.month, current_date.year, True)
@@ -115,8 +116,8 @@ def _create_datetime(hour: int, minute: int, day: int, month: int, year: int, is
     try:
         target_time = time(hour, minute)
         target_datetime = datetime.combine(target_date, target_time)
-        # Применяем часовой пояс Омска
-        target_datetime = OMSK_TIMEZONE.localize(target_datetime)
+        # Применяем часовой пояс Омска (фиксированное смещение, без перехода на летнее время)
+        target_datetime = target_datetime.replace(tzinfo=OMSK_TIMEZONE)
         
         logger.debug(f"Создан datetime: {target_datetime} (is_today_only: {is_today_only})")
         return target_datetime, is_today_only
@@ -136,7 +137,7 @@ def is_future_time(target_datetime: datetime) -> bool:
     Returns:
         bool: True если время в будущем
     """
-    current_time = datetime.now(OMSK_TIMEZONE)
+    current_time = get_clock().now()
     return target_datetime > current_time
 
 
@@ -176,7 +177,7 @@ def format_datetime_short(dt: datetime) -> str:
     Returns:
         str: Короткая строка "ДД.ММ в ЧЧ:ММ"
     """
-    current_year = datetime.now(OMSK_TIMEZONE).year
+    current_year = get_clock().now().year
     if dt.year == current_year:
         return dt.strftime("%d.%m в %H:%M")
     else:
@@ -190,7 +191,7 @@ def get_current_omsk_time() -> datetime:
     Returns:
         datetime: Текущее время в Омске
     """
-    return datetime.now(OMSK_TIMEZONE)
+    return get_clock().now()
 
 
 def validate_reminder_time_v2(text: str) -> Tuple[Optional[datetime], str, bool]:
@@ -227,7 +228,7 @@ def get_time_until_reminder(reminder_time: datetime) -> str:
     Returns:
         str: Строка типа "через 2 часа 30 минут"
     """
-    current_time = datetime.now(OMSK_TIMEZONE)
+    current_time = get_clock().now()
     if reminder_time <= current_time:
         return "уже прошло"
     
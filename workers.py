@@ -0,0 +1,209 @@
+"""
+Многопроцессная обработка обновлений с шардированием по user_id
+
+Главный процесс получает обновления (polling или webhook) и раскладывает их
+по очередям рабочих процессов по user_id. Каждый рабочий процесс запускает
+тот же роутер из handlers.py. Все обновления одного пользователя попадают
+в один процесс и обрабатываются строго по порядку.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Сигнал завершения для рабочего процесса
+_STOP = None
+
+
+def shard_for_user(user_id: Optional[int], workers_count: int) -> int:
+    """
+    Номер рабочего процесса для пользователя
+
+    Args:
+        user_id: ID пользователя (None для обновлений без пользователя)
+        workers_count: Количество рабочих процессов
+
+    Returns:
+        int: Индекс рабочего процесса
+    """
+    if user_id is None:
+        return 0
+    return user_id % workers_count
+
+
+class ShardRouterMiddleware(BaseMiddleware):
+    """Outer-middleware главного процесса: передает обновление в рабочий процесс вместо обработки"""
+
+    def __init__(self, processor: 'ShardedUpdateProcessor'):
+        self.processor = processor
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        self.processor.dispatch(event, user.id if user else None)
+        return None
+
+
+class ShardedUpdateProcessor:
+    """Пул рабочих процессов, обрабатывающих обновления по шардам user_id"""
+
+    def __init__(self, workers_count: int, api_base_url: str = '', outbound_rate: Optional[float] = None):
+        """
+        Args:
+            workers_count: Количество рабочих процессов
+            api_base_url: Адрес локального Bot API сервера ('' - api.telegram.org)
+            outbound_rate: Лимит исходящих запросов в секунду для каждого рабочего процесса
+                (None - OUTBOUND_RATE_PER_SECOND)
+        """
+        self.workers_count = workers_count
+        self.api_base_url = api_base_url
+        self.outbound_rate = outbound_rate
+        self.dispatched = [0] * workers_count
+        self._context = multiprocessing.get_context('spawn')
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        """Запустить рабочие процессы"""
+        for index in range(self.workers_count):
+            queue = self._context.Queue()
+            process = self._context.Process(
+                target=run_worker,
+                args=(index, queue, self.api_base_url, self.outbound_rate),
+                name=f"reminder-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self._queues.append(queue)
+            self._processes.append(process)
+
+        logger.info(f"Запущено рабочих процессов: {self.workers_count}")
+
+    def dispatch(self, update: Update, user_id: Optional[int]):
+        """
+        Передать обновление рабочему процессу
+
+        Args:
+            update: Обновление Telegram
+            user_id: ID пользователя, по которому выбирается шард
+        """
+        index = shard_for_user(user_id, self.workers_count)
+        payload = update.model_dump_json(exclude_unset=True)
+        self._queues[index].put(payload)
+        self.dispatched[index] += 1
+
+    def stop(self, timeout: float = 10):
+        """Остановить рабочие процессы, дождавшись обработки поставленных обновлений"""
+        for queue in self._queues:
+            queue.put(_STOP)
+
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Рабочий процесс {process.name} не завершился, принудительная остановка")
+                process.terminate()
+
+        self._queues.clear()
+        self._processes.clear()
+        logger.info("Рабочие процессы остановлены")
+
+
+class _UserOrderedRunner:
+    """Конкурентная обработка обновлений разных пользователей с сохранением порядка для каждого"""
+
+    def __init__(self, feed: Callable[[dict], Awaitable[Any]]):
+        self._feed = feed
+        self._tails: Dict[Optional[int], asyncio.Task] = {}
+
+    def submit(self, update: dict):
+        user_id = _extract_user_id(update)
+        previous = self._tails.get(user_id)
+        task = asyncio.create_task(self._run_after(previous, update))
+        self._tails[user_id] = task
+        task.add_done_callback(lambda done: self._release(user_id, done))
+
+    async def _run_after(self, previous: Optional[asyncio.Task], update: dict):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self._feed(update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    def _release(self, user_id: Optional[int], task: asyncio.Task):
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+    async def drain(self):
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+def _extract_user_id(update: dict) -> Optional[int]:
+    """Найти ID пользователя в сыром обновлении"""
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from'].get('id')
+    return None
+
+
+async def _worker_main(index: int, queue: multiprocessing.Queue, api_base_url: str, outbound_rate: Optional[float]):
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    from config import (
+        DELIVERY_SIGNAL_HOST, DELIVERY_SIGNAL_PORT, OUTBOUND_LANES_ENABLED, OUTBOUND_RATE_PER_SECOND, get_bot_token
+    )
+    from events import reminder_events, DeliverySignalSender
+    from handlers import router
+    from outbound import OutboundScheduler
+
+    # Планировщик работает в другом процессе: сообщаем ему об изменениях через сокет
+    signal_sender = DeliverySignalSender(DELIVERY_SIGNAL_HOST, DELIVERY_SIGNAL_PORT)
+    reminder_events.subscribe(signal_sender)
+
+    session = None
+    if api_base_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_base_url))
+    bot = Bot(token=get_bot_token(), session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    if OUTBOUND_LANES_ENABLED:
+        # Лимит скорости действует на процесс: главный процесс передает долю общего лимита
+        bot.session.middleware(OutboundScheduler(rate_per_second=outbound_rate or OUTBOUND_RATE_PER_SECOND))
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    runner = _UserOrderedRunner(lambda update: dp.feed_raw_update(bot, update))
+    loop = asyncio.get_running_loop()
+
+    logger.info(f"Рабочий процесс {index} запущен")
+    try:
+        while True:
+            payload = await loop.run_in_executor(None, queue.get)
+            if payload is _STOP:
+                break
+            runner.submit(json.loads(payload))
+        await runner.drain()
+    finally:
+        signal_sender.close()
+        await bot.session.close()
+        logger.info(f"Рабочий процесс {index} остановлен")
+
+
+def run_worker(index: int, queue: multiprocessing.Queue, api_base_url: str = '', outbound_rate: Optional[float] = None):
+    """Точка входа рабочего процесса"""
+    from config import setup_logging
+    setup_logging()
+    asyncio.run(_worker_main(index, queue, api_base_url, outbound_rate))
@@ -0,0 +1,119 @@
+"""
+Групповая фиксация добавлений напоминаний
+
+Обработчики сообщений не пишут в базу сами, а ставят напоминание в очередь.
+Добавления, пришедшие в пределах GROUP_COMMIT_DELAY_MS, записываются одной
+транзакцией (один fsync вместо одного на напоминание) в отдельном потоке,
+и каждый обработчик получает id своего напоминания и новое количество
+активных напоминаний пользователя. Пока транзакция пишется, следующие
+добавления собираются в новую группу.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from clock import get_clock
+from config import GROUP_COMMIT_ENABLED, GROUP_COMMIT_DELAY_MS, GROUP_COMMIT_MAX_BATCH
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class InsertBatcher:
+    """Очередь добавлений напоминаний с фиксацией группами"""
+
+    def __init__(
+        self,
+        database,
+        delay_ms: int = GROUP_COMMIT_DELAY_MS,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        clock=None
+    ):
+        """
+        Args:
+            database: База данных напоминаний (нужен метод add_reminders)
+            delay_ms: Сколько ждать попутных добавлений перед фиксацией
+            max_batch: Максимум напоминаний в одной транзакции
+            clock: Источник времени (по умолчанию - get_clock())
+        """
+        self.db = database
+        self.delay = delay_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.clock = clock or get_clock()
+
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._full: Optional[asyncio.Event] = None
+        self.batches = 0
+        self.committed = 0
+
+    async def add(self, user_id: int, reminder_time: datetime, reminder_text: str = None) -> Optional[Tuple[int, int]]:
+        """
+        Добавить напоминание в ближайшую группу и дождаться фиксации
+
+        Returns:
+            Optional[Tuple[int, int]]: (id напоминания, количество активных напоминаний
+                пользователя) или None при ошибке записи
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((user_id, reminder_time, reminder_text), future))
+
+        if self._flush_task is None or self._flush_task.done():
+            self._full = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+
+        return await future
+
+    async def _flush_loop(self):
+        while self._pending:
+            if len(self._pending) < self.max_batch:
+                # Ждем попутные добавления, но не дольше delay и не после заполнения группы
+                self._full.clear()
+                await self.clock.wait(self._full, self.delay)
+
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            reminders = [reminder for reminder, _ in batch]
+            try:
+                # Транзакция пишется в потоке: обработчики тем временем собирают следующую группу
+                results = await asyncio.get_running_loop().run_in_executor(None, self.db.add_reminders, reminders)
+            except Exception as e:
+                logger.error(f"Ошибка групповой записи напоминаний: {e}")
+                results = None
+
+            if results is None:
+                results = [None] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+            self.batches += 1
+            self.committed += sum(result is not None for result in results)
+
+
+_batcher: Optional[InsertBatcher] = None
+
+
+def get_insert_batcher() -> InsertBatcher:
+    """Общая очередь добавлений (создается при первом обращении)"""
+    global _batcher
+    if _batcher is None:
+        _batcher = InsertBatcher(get_db())
+    return _batcher
+
+
+async def add_reminder(user_id: int, reminder_time: datetime, reminder_text: str = None) -> Optional[Tuple[int, int]]:
+    """
+    Сохранить напоминание: групповой фиксацией или сразу (GROUP_COMMIT_ENABLED=false)
+
+    Returns:
+        Optional[Tuple[int, int]]: (id напоминания, количество активных напоминаний
+            пользователя) или None при ошибке записи
+    """
+    if GROUP_COMMIT_ENABLED:
+        return await get_insert_batcher().add(user_id, reminder_time, reminder_text)
+
+    results = get_db().add_reminders([(user_id, reminder_time, reminder_text)])
+    return results[0] if results else None